@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Produtor, Empresa, Produto, Documento, Administrador, Certificacao, AnuncioMarketplace, Perfil, Carrinho, Mensagem
+from django.utils import timezone
+from .models import Produtor, Empresa, Produto, Documento, Administrador, Certificacao, AnuncioMarketplace, Perfil, Carrinho, ItemCarrinho, Mensagem, ReservaEstoque, Tarefa, BlobMidia
 # Register your models here.
 
 # registro do painel admnistrativo com permissões e afins: falta adicionar camada de proteção e otimizar painels para deixar mais "clean" ou melhorar algo
@@ -44,6 +45,7 @@ class AdministradorAdmin(admin.ModelAdmin):
 class CertificacaoAdmin(admin.ModelAdmin):
     list_display = ('id_certificacao', 'produto', 'administrador', 'data_certificacao', 'validade', 'status')
     list_filter = ('status',)
+    list_select_related = ('produto', 'administrador')
 
 @admin.register(AnuncioMarketplace) #MKT - pode otimizar ?
 class AnuncioMarketplaceAdmin(admin.ModelAdmin):
@@ -51,13 +53,45 @@ class AnuncioMarketplaceAdmin(admin.ModelAdmin):
     list_filter = ('plataforma', 'status')
     search_fields = ('url',)
 
+class ItemCarrinhoInline(admin.TabularInline):
+    model = ItemCarrinho
+    extra = 0
+    raw_id_fields = ('produto',)
+
 @admin.register(Carrinho) # Carrinho
 class CarrinhoAdmin(admin.ModelAdmin):
     list_display = ('id_carrinho', 'usuario', 'sessao_id', 'criado_em', 'atualizado_em')
     list_filter = ('criado_em',)
+    inlines = [ItemCarrinhoInline]
 
 @admin.register(Mensagem) # Chat
 class MensagemAdmin(admin.ModelAdmin):
     list_display = ('id_mensagem', 'remetente', 'destinatario', 'assunto', 'lida', 'criada_em')
     list_filter = ('lida', 'criada_em')
     search_fields = ('assunto', 'corpo')
+
+@admin.register(ReservaEstoque) # Reservas de estoque do checkout
+class ReservaEstoqueAdmin(admin.ModelAdmin):
+    list_display = ('id', 'produto', 'usuario', 'quantidade', 'status', 'referencia', 'expira_em')
+    list_filter = ('status',)
+    search_fields = ('referencia',)
+    raw_id_fields = ('produto', 'usuario')
+
+@admin.register(Tarefa) # Fila de tarefas em segundo plano
+class TarefaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'nome', 'status', 'tentativas', 'executar_em', 'atualizada_em')
+    list_filter = ('status', 'nome')
+    search_fields = ('nome', 'chave')
+    actions = ['reenfileirar']
+
+    @admin.action(description='Reenfileirar tarefas selecionadas')
+    def reenfileirar(self, request, queryset):
+        total = queryset.exclude(status='executando').update(status='pendente', tentativas=0, executar_em=timezone.now())
+        self.message_user(request, f'{total} tarefa(s) reenfileirada(s).')
+
+@admin.register(BlobMidia) # Arquivos do armazenamento por conteúdo
+class BlobMidiaAdmin(admin.ModelAdmin):
+    list_display = ('sha256', 'nome', 'tamanho', 'referencias', 'atualizado_em')
+    list_filter = ('referencias',)
+    search_fields = ('sha256', 'nome')
+    readonly_fields = ('sha256', 'nome', 'tamanho', 'referencias', 'criado_em', 'atualizado_em')
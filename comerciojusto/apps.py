@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class ComerciojustoConfig(AppConfig):
     name = 'comerciojusto'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import busca, certificacoes  # noqa: F401 (registram tarefas)
@@ -0,0 +1,234 @@
+"""
+Armazenamento por conteúdo das mídias enviadas (Produto.imagem, Perfil.logo,
+Certificacao.arquivo_certificado)
+
+O arquivo é gravado com o SHA-256 do conteúdo como nome, então o mesmo
+certificado ou a mesma foto enviados de novo ocupam o disco uma vez só:
+
+    certificacoes/laudo.pdf -> conteudo/3f/3f9a...c1.pdf
+
+Cada arquivo tem um BlobMidia com o número de campos que apontam para ele:
+o upload soma uma referência e os signals (troca de arquivo, exclusão)
+subtraem. Arquivos sem referência são apagados pelo comando limpar_midia,
+que antes recalcula as contagens a partir dos próprios campos.
+
+Como o nome nunca muda de conteúdo, a view midia_conteudo serve esses
+arquivos com cache imutável de um ano. Nomes antigos (gravados antes do
+armazenamento por conteúdo) continuam funcionando, servidos por MEDIA_URL.
+"""
+import os
+import posixpath
+import re
+import uuid
+from collections import Counter
+
+from django.core.files.storage import FileSystemStorage, default_storage, storages
+from django.db.models import F
+from django.utils import timezone
+
+from .uploads import EXTENSOES, sha256_arquivo
+
+PASTA = 'conteudo'
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+NOME_CONTEUDO = re.compile(rf'{PASTA}/[0-9a-f]{{2}}/([0-9a-f]{{64}})(\.\w{{1,9}})?')
+
+# Modelo -> campo de arquivo que usa este armazenamento
+CAMPOS = {
+    'Produto': 'imagem',
+    'Perfil': 'logo',
+    'Certificacao': 'arquivo_certificado',
+}
+
+
+def armazenamento_midia():
+    """Storage dos campos de mídia (STORAGES['midia'] no settings); usado como storage= nos modelos"""
+    return storages['midia']
+
+
+def sha256_do_nome(nome):
+    """SHA-256 de um nome do armazenamento por conteúdo (None para nomes antigos)"""
+    encontrado = NOME_CONTEUDO.fullmatch(nome or '')
+    return encontrado.group(1) if encontrado else None
+
+
+def nome_conteudo(sha256, nome_original, tipo=None):
+    # Extensão pelo tipo detectado no upload (foto.JPEG e foto.jpg viram o mesmo arquivo)
+    extensao = EXTENSOES.get(tipo) or posixpath.splitext(nome_original)[1].lower()[:10]
+    return f'{PASTA}/{sha256[:2]}/{sha256}{extensao}'
+
+
+def referenciar(sha256, nome, tamanho):
+    """Soma uma referência ao blob (criando o registro se for o primeiro)"""
+    from .models import BlobMidia
+
+    atualizados = BlobMidia.objects.filter(pk=sha256).update(
+        referencias=F('referencias') + 1, atualizado_em=timezone.now()
+    )
+    if not atualizados:
+        _, criado = BlobMidia.objects.get_or_create(
+            sha256=sha256, defaults={'nome': nome, 'tamanho': tamanho, 'referencias': 1}
+        )
+        if not criado:
+            # Outro upload criou o registro ao mesmo tempo
+            BlobMidia.objects.filter(pk=sha256).update(
+                referencias=F('referencias') + 1, atualizado_em=timezone.now()
+            )
+
+
+def liberar(nome):
+    """Subtrai uma referência do blob de `nome`; o arquivo fica para o limpar_midia"""
+    from .models import BlobMidia
+
+    sha256 = sha256_do_nome(nome)
+    if sha256:
+        BlobMidia.objects.filter(pk=sha256, referencias__gt=0).update(
+            referencias=F('referencias') - 1, atualizado_em=timezone.now()
+        )
+
+
+class ArmazenamentoConteudo(FileSystemStorage):
+    """FileSystemStorage que grava cada arquivo uma vez, com o nome dado pelo SHA-256 do conteúdo"""
+
+    def __init__(self, url_conteudo='/midia/', **kwargs):
+        super().__init__(**kwargs)
+        self.url_conteudo = url_conteudo
+
+    def _save(self, name, content):
+        # O hash normalmente já veio calculado do upload (uploads.py)
+        sha256 = sha256_arquivo(content)
+        nome = nome_conteudo(sha256, name, getattr(content, 'tipo_detectado', None))
+        # Referência antes do arquivo: o limpar_midia não apaga blob com referência
+        referenciar(sha256, nome, content.size)
+        if self.exists(nome):
+            return nome
+        return super()._save(nome, content)
+
+    def url(self, name):
+        if sha256_do_nome(name):
+            return f'{self.url_conteudo}{name}'
+        return super().url(name)
+
+
+def campos_midia():
+    """(modelo, nome do campo) dos campos de arquivo que usam o armazenamento por conteúdo"""
+    from django.apps import apps
+
+    return [(apps.get_model('comerciojusto', modelo), campo) for modelo, campo in CAMPOS.items()]
+
+
+def recontar_referencias():
+    """
+    Recalcula BlobMidia.referencias a partir dos campos (corrige desvios de transações
+    desfeitas ou de updates que não passam pelos signals); retorna quantos blobs mudaram
+    """
+    from .models import BlobMidia
+
+    contagem = Counter()
+    nomes = {}
+    for Modelo, campo in campos_midia():
+        consulta = Modelo.objects.filter(**{f'{campo}__startswith': f'{PASTA}/'}).values_list(campo, flat=True)
+        for nome in consulta.iterator():
+            sha256 = sha256_do_nome(nome)
+            contagem[sha256] += 1
+            nomes[sha256] = nome
+
+    agora = timezone.now()
+    alterados = []
+    for blob in BlobMidia.objects.only('sha256', 'referencias').iterator():
+        nomes.pop(blob.sha256, None)
+        referencias = contagem.get(blob.sha256, 0)
+        if blob.referencias != referencias:
+            blob.referencias = referencias
+            blob.atualizado_em = agora
+            alterados.append(blob)
+    BlobMidia.objects.bulk_update(alterados, ['referencias', 'atualizado_em'], batch_size=500)
+
+    # Campos que apontam para um arquivo sem registro
+    storage = armazenamento_midia()
+    novos = [
+        BlobMidia(sha256=sha256, nome=nome, tamanho=storage.size(nome), referencias=contagem[sha256])
+        for sha256, nome in nomes.items() if storage.exists(nome)
+    ]
+    BlobMidia.objects.bulk_create(novos, ignore_conflicts=True)
+    return len(alterados) + len(novos)
+
+
+def _apagar_arquivo(sha256, nome):
+    """
+    Apaga o arquivo e as variantes se nenhum BlobMidia voltou a apontar para ele;
+    retorna se apagou. Um upload do mesmo conteúdo recria o registro e, vendo o
+    arquivo no lugar, não grava de novo (ArmazenamentoConteudo._save): por isso o
+    arquivo sai do lugar primeiro (rename atômico) e só então o registro é conferido.
+    Se o upload chegou antes da conferência, o arquivo volta; se chegou depois, ele
+    já não encontra o arquivo e grava o seu.
+    """
+    from . import imagens
+    from .models import BlobMidia
+
+    caminho = armazenamento_midia().path(nome)
+    descartado = f'{caminho}.coleta-{uuid.uuid4().hex}'
+    try:
+        os.rename(caminho, descartado)
+    except FileNotFoundError:
+        return False
+    if BlobMidia.objects.filter(pk=sha256).exists():
+        try:
+            os.link(descartado, caminho)
+        except FileExistsError:
+            pass  # o upload já gravou o mesmo conteúdo de novo
+        os.unlink(descartado)
+        return False
+    os.unlink(descartado)
+    # Variantes geradas a partir do arquivo (imagens.py)
+    for larguras in imagens.LARGURAS.values():
+        for largura in larguras:
+            for extensao, _, _, _ in imagens.FORMATOS:
+                variante = imagens.nome_variante(nome, largura, extensao)
+                if default_storage.exists(variante):
+                    default_storage.delete(variante)
+    return True
+
+
+def _arquivos_conteudo(storage):
+    if not storage.exists(PASTA):
+        return
+    pastas, _ = storage.listdir(PASTA)
+    for pasta in pastas:
+        _, arquivos = storage.listdir(f'{PASTA}/{pasta}')
+        for arquivo in arquivos:
+            yield f'{PASTA}/{pasta}/{arquivo}'
+
+
+def coletar(carencia, simular=False):
+    """
+    Apaga os arquivos sem referência há mais de `carencia` (timedelta) e os arquivos
+    órfãos (gravados por uma transação que foi desfeita). Retorna (arquivos, bytes).
+    """
+    from .models import BlobMidia
+
+    storage = armazenamento_midia()
+    limite = timezone.now() - carencia
+    apagados, liberados = 0, 0
+
+    for blob in BlobMidia.objects.filter(referencias=0, atualizado_em__lt=limite).iterator():
+        # Condicional: um upload pode ter voltado a referenciar o blob desde a consulta
+        if not simular and not BlobMidia.objects.filter(
+            pk=blob.pk, referencias=0, atualizado_em__lt=limite
+        ).delete()[0]:
+            continue
+        if not simular and not _apagar_arquivo(blob.pk, blob.nome):
+            continue
+        apagados += 1
+        liberados += blob.tamanho
+
+    for nome in _arquivos_conteudo(storage):
+        if BlobMidia.objects.filter(pk=sha256_do_nome(nome)).exists():
+            continue
+        if storage.get_modified_time(nome) >= limite:
+            continue
+        tamanho = storage.size(nome)
+        if not simular and not _apagar_arquivo(sha256_do_nome(nome), nome):
+            continue
+        apagados += 1
+        liberados += tamanho
+    return apagados, liberados
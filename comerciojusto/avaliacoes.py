@@ -0,0 +1,91 @@
+"""
+Agregados incrementais de avaliação em Perfil
+
+Cada avaliação criada/excluída ajusta total, soma, histograma de estrelas e média
+com um único UPDATE baseado em F(), sem ler o valor anterior em Python (sem corrida
+entre requisições simultâneas). reconciliar_avaliacoes recalcula tudo do zero.
+"""
+from decimal import Decimal
+
+from django.db.models import Case, Count, DecimalField, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .versoes_cache import invalidar, invalidar_perfis, namespace_perfil, namespace_usuario
+
+# Média exibida quando o perfil ainda não tem avaliações (mesmo default do modelo)
+MEDIA_PADRAO = 5.0
+
+CAMPOS_AGREGADOS = [
+    'taxa_avaliacao', 'total_avaliacoes', 'soma_avaliacoes',
+    'estrelas_1', 'estrelas_2', 'estrelas_3', 'estrelas_4', 'estrelas_5',
+]
+
+
+def _ajustar(perfil_id, estrelas, delta):
+    from .models import Perfil
+
+    if perfil_id is None or estrelas not in range(1, 6):
+        return
+    novo_total = F('total_avaliacoes') + delta
+    nova_soma = F('soma_avaliacoes') + delta * estrelas
+    # taxa_avaliacao vem primeiro: no MySQL o SET é avaliado da esquerda para a direita
+    # com os valores já atualizados; assim todas as expressões leem os valores antigos
+    Perfil.objects.filter(pk=perfil_id).update(
+        taxa_avaliacao=Case(
+            When(Q(total_avaliacoes__lte=-delta), then=Value(Decimal(MEDIA_PADRAO))),
+            default=Cast(
+                Cast(nova_soma, FloatField()) / Cast(novo_total, FloatField()),
+                DecimalField(max_digits=3, decimal_places=2),
+            ),
+            output_field=DecimalField(max_digits=3, decimal_places=2),
+        ),
+        total_avaliacoes=novo_total,
+        soma_avaliacoes=nova_soma,
+        **{f'estrelas_{estrelas}': F(f'estrelas_{estrelas}') + delta},
+        # Carimbo dos fragmentos em cache do perfil (resumo e lista de avaliações)
+        atualizado_em=timezone.now(),
+    )
+    invalidar_perfis([perfil_id])
+
+
+def registrar_avaliacao(avaliacao):
+    """Soma uma avaliação nova aos agregados do perfil"""
+    _ajustar(avaliacao.perfil_id, avaliacao.estrelas, 1)
+
+
+def remover_avaliacao(avaliacao):
+    """Retira uma avaliação excluída dos agregados do perfil"""
+    _ajustar(avaliacao.perfil_id, avaliacao.estrelas, -1)
+
+
+def reconciliar_avaliacoes(lote=1000):
+    """Recalcula os agregados de todos os perfis com uma consulta agrupada; retorna o total de perfis"""
+    from .models import Avaliacao, Perfil
+
+    agregados = {
+        linha['perfil_id']: linha
+        for linha in Avaliacao.objects.order_by().values('perfil_id').annotate(
+            total=Count('pk'),
+            soma=Sum('estrelas'),
+            **{f'e{n}': Count('pk', filter=Q(estrelas=n)) for n in range(1, 6)},
+        )
+    }
+
+    agora = timezone.now()
+    perfis = list(Perfil.objects.only('pk', 'user_id', *CAMPOS_AGREGADOS))
+    for perfil in perfis:
+        perfil.atualizado_em = agora
+        linha = agregados.get(perfil.pk)
+        total = linha['total'] if linha else 0
+        soma = linha['soma'] if linha else 0
+        perfil.total_avaliacoes = total
+        perfil.soma_avaliacoes = soma
+        perfil.taxa_avaliacao = round(soma / total, 2) if total else MEDIA_PADRAO
+        for n in range(1, 6):
+            setattr(perfil, f'estrelas_{n}', linha[f'e{n}'] if linha else 0)
+    Perfil.objects.bulk_update(perfis, CAMPOS_AGREGADOS + ['atualizado_em'], batch_size=lote)
+    for perfil in perfis:
+        invalidar(namespace_usuario(perfil.user_id))
+        invalidar(namespace_perfil(perfil.pk))
+    return len(perfis)
@@ -0,0 +1,151 @@
+"""
+Busca de produtos com índice invertido (tabela TermoBusca)
+
+Os textos são normalizados sem acento e em minúsculas ("orgânico" == "organico"),
+as stopwords em português são descartadas e os plurais mais comuns reduzidos ao
+singular (e sem a vogal de gênero final). Cada produto guarda um peso por termo (nome pesa mais que descrição) e a
+relevância final mistura esse peso com destaque e vendas.
+"""
+import re
+import unicodedata
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F, FloatField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Ln
+
+from .tarefas import tarefa
+
+# Peso de cada campo no índice
+PESO_NOME = 3.0
+PESO_CATEGORIA = 1.5
+PESO_DESCRICAO = 1.0
+
+# Mistura da relevância textual com a popularidade do produto
+PESO_DESTAQUE = 2.0
+PESO_VENDAS = 0.5
+
+TAMANHO_MAXIMO_TERMO = 60
+
+STOPWORDS = {
+    'a', 'ao', 'aos', 'as', 'com', 'como', 'da', 'das', 'de', 'do', 'dos', 'e', 'em',
+    'na', 'nas', 'no', 'nos', 'o', 'os', 'ou', 'para', 'pela', 'pelas', 'pelo', 'pelos',
+    'por', 'que', 'se', 'sem', 'um', 'uma', 'uns', 'umas', 'mais', 'muito', 'sua', 'seu',
+}
+
+# Plurais regulares do português, do sufixo mais específico ao mais genérico
+_PLURAIS = (
+    ('oes', 'ao'), ('aes', 'ao'), ('ais', 'al'), ('eis', 'el'), ('ois', 'ol'),
+    ('res', 'r'), ('zes', 'z'), ('ns', 'm'), ('s', ''),
+)
+
+_PALAVRA = re.compile(r'[a-z0-9]+')
+
+
+def normalizar(texto):
+    """Remove acentos e converte para minúsculas"""
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in decomposto if not unicodedata.combining(c)).lower()
+
+
+def _singular(palavra):
+    if len(palavra) <= 3 or palavra.isdigit():
+        return palavra
+    for sufixo, troca in _PLURAIS:
+        if palavra.endswith(sufixo) and len(palavra) - len(sufixo) >= 3:
+            palavra = palavra[:-len(sufixo)] + troca
+            break
+    # "organico" e "organica" viram o mesmo termo
+    if len(palavra) > 4 and palavra[-1] in 'ao':
+        palavra = palavra[:-1]
+    return palavra
+
+
+def tokenizar(texto):
+    """Quebra um texto em termos normalizados, sem stopwords"""
+    termos = []
+    for palavra in _PALAVRA.findall(normalizar(texto)):
+        if palavra in STOPWORDS or len(palavra) < 2:
+            continue
+        termos.append(_singular(palavra)[:TAMANHO_MAXIMO_TERMO])
+    return termos
+
+
+def pesos_produto(produto):
+    """Calcula o peso de cada termo de um produto"""
+    pesos = Counter()
+    for termo in tokenizar(produto.nome):
+        pesos[termo] += PESO_NOME
+    for termo in tokenizar(produto.get_categoria_display() if produto.categoria != 'todas' else ''):
+        pesos[termo] += PESO_CATEGORIA
+    for termo in tokenizar(produto.descricao):
+        pesos[termo] += PESO_DESCRICAO
+    return pesos
+
+
+def termos_produto(produto):
+    """Linhas de TermoBusca (não salvas) para um produto"""
+    from .models import TermoBusca
+    return [
+        TermoBusca(termo=termo, produto_id=produto.pk, peso=peso)
+        for termo, peso in pesos_produto(produto).items()
+    ]
+
+
+def indexar_produto(produto):
+    """Substitui os termos indexados de um produto"""
+    from .models import TermoBusca
+    with transaction.atomic():
+        TermoBusca.objects.filter(produto_id=produto.pk).delete()
+        TermoBusca.objects.bulk_create(termos_produto(produto))
+
+
+@tarefa('busca.indexar_produto')
+def indexar_produto_id(produto_id):
+    """Reindexa o produto em segundo plano (enfileirado pelo signal de Produto)"""
+    from .models import Produto
+    produto = Produto.objects.filter(pk=produto_id).first()
+    if produto:
+        indexar_produto(produto)
+
+
+def _filtro_termo(termo, prefixo=False):
+    # Prefixo via intervalo (>= termo e < termo + U+FFFF) para aproveitar o índice de termo
+    if prefixo:
+        return Q(termo__gte=termo, termo__lt=termo + '\uffff')
+    return Q(termo=termo)
+
+
+def buscar_produtos(queryset, texto):
+    """
+    Filtra o queryset pelos produtos que contêm todos os termos de `texto`
+    (o último termo vale como prefixo, para busca enquanto se digita) e anota
+    `relevancia` para ordenação.
+    """
+    from .models import TermoBusca
+
+    termos = list(dict.fromkeys(tokenizar(texto)))
+    if not termos:
+        return queryset.none().annotate(relevancia=Value(0.0))
+
+    filtros = [_filtro_termo(t) for t in termos[:-1]] + [_filtro_termo(termos[-1], prefixo=True)]
+    qualquer_termo = Q()
+    for filtro in filtros:
+        queryset = queryset.filter(
+            id_produto__in=TermoBusca.objects.filter(filtro).values('produto_id')
+        )
+        qualquer_termo |= filtro
+
+    peso_textual = (
+        TermoBusca.objects.filter(qualquer_termo, produto_id=OuterRef('pk'))
+        .values('produto_id')
+        .annotate(total=Sum('peso'))
+        .values('total')
+    )
+    return queryset.annotate(
+        relevancia=(
+            Coalesce(Subquery(peso_textual, output_field=FloatField()), Value(0.0))
+            + Cast('destaque', FloatField()) * Value(PESO_DESTAQUE)
+            + Ln(Cast(F('vendas'), FloatField()) + Value(1.0)) * Value(PESO_VENDAS)
+        )
+    )
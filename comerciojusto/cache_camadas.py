@@ -0,0 +1,464 @@
+"""
+Backend de cache em camadas (CACHES['default'] no settings)
+
+    processo (LRU em memória, poucos segundos)  ->  compartilhado (arquivo, entre workers)
+
+A camada local evita ler o disco nos valores mais usados; a compartilhada faz
+todos os workers verem o mesmo cache sem nenhum serviço externo (por padrão o
+FileBasedCache do Django; qualquer backend serve, ex.: DatabaseCache sobre o
+SQLite).
+
+As chaves do projeto são versionadas (versoes_cache): um valor gravado sob uma
+versão não muda mais, então a cópia local não fica errada. As próprias versões
+('versao:...') mudam a cada invalidação e por isso nunca ficam na camada local
+(PREFIXOS_COMPARTILHADOS): uma invalidação feita num worker vale na hora para
+os outros. Chaves não versionadas apagadas ou regravadas em outro worker podem
+ser lidas da cópia local por até LOCAL_TIMEOUT segundos.
+
+get_or_set calcula o valor uma vez só quando ele falta (single-flight): dentro
+do processo com uma trava por chave e entre processos com um arquivo de trava
+criado com O_CREAT | O_EXCL (atômico no sistema de arquivos); quem não pegou a
+trava espera o valor aparecer. add e incr (versões de namespace, estatísticas)
+também passam por uma trava de arquivo, porque no FileBasedCache eles são ler
+e gravar o arquivo e dois processos poderiam perder um incremento. Contadores
+incrementados aqui não expiram.
+
+O diretório do FileBasedCache e o das travas são criados com 0o700 e conferidos
+na primeira instância do processo (diretorio_privado): o FileBasedCache
+desserializa com pickle o que encontrar ali. As travas são criadas com 0o600.
+
+Acertos e falhas por camada são contados por processo e somados no cache
+compartilhado de tempos em tempos (python manage.py estatisticas_cache).
+"""
+import atexit
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+import threading
+import uuid
+import time
+import zlib
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+_AUSENTE = object()
+
+COMPARTILHADO_PADRAO = 'django.core.cache.backends.filebased.FileBasedCache'
+PREFIXO_ESTATISTICAS = 'estatisticas_cache:'
+CAMPOS_ESTATISTICAS = (
+    'acerto_local', 'acerto_compartilhado', 'falha', 'gravacao', 'recalculo', 'espera',
+)
+INTERVALO_ESTATISTICAS = 30  # segundos entre publicações das contagens do processo
+TRAVAS_PROCESSO = 64  # travas por hash da chave para o single-flight dentro do processo
+TRAVA_CURTA_TIMEOUT = 5  # segundos de uma trava de add/incr (só ler e gravar um arquivo)
+
+
+def diretorio_privado(caminho):
+    """
+    Cria (0o700) ou confere o diretório do cache/das travas. O FileBasedCache desserializa
+    (pickle) o que encontrar ali: um diretório de outro usuário, ou gravável por outros,
+    permitiria plantar valores que executam código no app.
+    """
+    os.makedirs(caminho, 0o700, exist_ok=True)
+    info = os.lstat(caminho)
+    if not stat.S_ISDIR(info.st_mode):
+        raise ImproperlyConfigured(f'O diretório do cache {caminho} não é um diretório (link simbólico?)')
+    if hasattr(os, 'getuid'):
+        if info.st_uid != os.getuid():
+            raise ImproperlyConfigured(f'O diretório do cache {caminho} pertence a outro usuário')
+        if info.st_mode & 0o077:
+            os.chmod(caminho, 0o700)
+
+
+class _CamadaLocal:
+    """LRU, travas e contagens de um cache neste processo"""
+
+    def __init__(self):
+        self.entradas = OrderedDict()
+        self.trava = threading.Lock()
+        self.travas_chave = [threading.Lock() for _ in range(TRAVAS_PROCESSO)]
+        self.contagens = Counter()
+        self.publicadas_em = time.monotonic()
+
+
+class TravasArquivo:
+    """
+    Travas entre processos por arquivo: quem cria o arquivo com O_EXCL leva. Uma trava
+    mais velha que a validade é de um processo que morreu e pode ser tomada.
+    """
+
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+
+    def _caminho(self, nome):
+        return os.path.join(self.diretorio, hashlib.md5(nome.encode()).hexdigest() + '.trava')
+
+    def _criar(self, caminho, dono):
+        try:
+            fd = os.open(caminho, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+        except FileNotFoundError:
+            diretorio_privado(self.diretorio)
+            return self._criar(caminho, dono)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as arquivo:
+            arquivo.write(dono)
+        return True
+
+    def _vencida(self, caminho, validade):
+        try:
+            return os.stat(caminho).st_mtime < time.time() - validade
+        except FileNotFoundError:
+            return True
+
+    def tentar(self, nome, validade):
+        """Pega a trava sem esperar; retorna o dono (para liberar) ou None"""
+        caminho = self._caminho(nome)
+        dono = f'{os.getpid()}:{uuid.uuid4().hex}'
+        if self._criar(caminho, dono):
+            return dono
+        if not self._vencida(caminho, validade):
+            return None
+        # Trava abandonada: o rename é atômico, só um processo a tira do lugar
+        descartada = f'{caminho}.{dono}'
+        try:
+            os.rename(caminho, descartada)
+        except FileNotFoundError:
+            return None
+        if not self._vencida(descartada, validade):
+            # Entre o stat e o rename outro processo já tinha criado uma trava nova: devolve
+            try:
+                os.link(descartada, caminho)
+            except FileExistsError:
+                pass
+            os.unlink(descartada)
+            return None
+        os.unlink(descartada)
+        return dono if self._criar(caminho, dono) else None
+
+    def liberar(self, nome, dono):
+        caminho = self._caminho(nome)
+        try:
+            with open(caminho) as arquivo:
+                if arquivo.read() != dono:
+                    return  # venceu e foi tomada por outro processo
+            os.unlink(caminho)
+        except FileNotFoundError:
+            pass
+
+    def existe(self, nome):
+        return os.path.exists(self._caminho(nome))
+
+    @contextmanager
+    def segurando(self, nome, validade=TRAVA_CURTA_TIMEOUT):
+        """Espera pela trava (seções curtas, como ler e gravar um contador)"""
+        pausa = 0.001
+        while (dono := self.tentar(nome, validade)) is None:
+            time.sleep(pausa)
+            pausa = min(pausa * 2, 0.05)
+        try:
+            yield
+        finally:
+            self.liberar(nome, dono)
+
+
+# O Django cria uma instância do backend por thread: a camada local fica num registro
+# por LOCATION para ser do processo inteiro (como o LocMemCache faz)
+_camadas = {}
+_trava_camadas = threading.Lock()
+
+
+class CacheEmCamadas(BaseCache):
+    """
+    OPTIONS:
+        LOCAL_MAX_ENTRADAS    entradas na LRU do processo (padrão 1000)
+        LOCAL_TIMEOUT         segundos que uma cópia local vale (padrão 30)
+        LOCAL_TAMANHO_MAXIMO  bytes; valores maiores só ficam no compartilhado (padrão 256 KB)
+        PREFIXOS_COMPARTILHADOS  chaves que nunca ficam na camada local
+        TRAVA_TIMEOUT         segundos máximos de um recálculo no get_or_set (padrão 30)
+        TRAVAS_LOCATION       diretório dos arquivos de trava (padrão: 'travas' dentro do
+                              diretório do FileBasedCache, ou um diretório temporário)
+        COMPARTILHADO         {'BACKEND', 'LOCATION', 'OPTIONS'} da camada compartilhada
+                              (LOCATION padrão: a do próprio cache)
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        opcoes = dict(params.get('OPTIONS', {}))
+        self.local_max_entradas = int(opcoes.pop('LOCAL_MAX_ENTRADAS', 1000))
+        self.local_timeout = float(opcoes.pop('LOCAL_TIMEOUT', 30))
+        self.local_tamanho_maximo = int(opcoes.pop('LOCAL_TAMANHO_MAXIMO', 256 * 1024))
+        self.prefixos_compartilhados = tuple(opcoes.pop('PREFIXOS_COMPARTILHADOS', ('versao:', PREFIXO_ESTATISTICAS)))
+        self.trava_timeout = float(opcoes.pop('TRAVA_TIMEOUT', 30))
+        diretorio_travas = opcoes.pop('TRAVAS_LOCATION', None)
+        compartilhado = opcoes.pop('COMPARTILHADO', {})
+
+        # Mesmo prefixo, versão e função de chave nas duas camadas
+        parametros = {
+            nome: params[nome] for nome in ('TIMEOUT', 'KEY_PREFIX', 'VERSION', 'KEY_FUNCTION') if nome in params
+        }
+        parametros['OPTIONS'] = compartilhado.get('OPTIONS', {})
+        backend = import_string(compartilhado.get('BACKEND', COMPARTILHADO_PADRAO))
+        self.compartilhado = backend(compartilhado.get('LOCATION', location), parametros)
+        if diretorio_travas is None:
+            # O FileBasedCache só lista os arquivos .djcache, então o subdiretório não o atrapalha
+            diretorio_cache = getattr(self.compartilhado, '_dir', None)
+            # Sem diretório do cache, um temporário por usuário (conferido por diretorio_privado)
+            diretorio_travas = (
+                os.path.join(diretorio_cache, 'travas') if diretorio_cache
+                else os.path.join(
+                    tempfile.gettempdir(),
+                    f'cache_travas_{getattr(os, "getuid", lambda: 0)()}_{zlib.crc32(location.encode()):08x}',
+                )
+            )
+        self.travas = TravasArquivo(diretorio_travas)
+
+        with _trava_camadas:
+            self._camada = _camadas.get(location)
+            if self._camada is None:
+                # Uma vez por processo: o diretório existe, é deste usuário e só ele acessa
+                diretorio_cache = getattr(self.compartilhado, '_dir', None)
+                if diretorio_cache:
+                    diretorio_privado(diretorio_cache)
+                diretorio_privado(diretorio_travas)
+                self._camada = _camadas[location] = _CamadaLocal()
+                # Contagens ainda não publicadas de processos curtos (comandos)
+                atexit.register(self.publicar_estatisticas)
+
+    # Camada local
+
+    def _so_compartilhado(self, key):
+        return str(key).startswith(self.prefixos_compartilhados)
+
+    def _ler_local(self, chave_local):
+        camada = self._camada
+        with camada.trava:
+            entrada = camada.entradas.get(chave_local)
+            if entrada is None:
+                return _AUSENTE
+            expira_em, dados = entrada
+            if expira_em <= time.monotonic():
+                del camada.entradas[chave_local]
+                return _AUSENTE
+            camada.entradas.move_to_end(chave_local)
+        return pickle.loads(dados)
+
+    def _gravar_local(self, key, valor, timeout, version):
+        if self._so_compartilhado(key):
+            return
+        # Mesma semântica do LocMemCache: cópia serializada, alterar o objeto lido não altera o cache
+        dados = pickle.dumps(valor, pickle.HIGHEST_PROTOCOL)
+        chave_local = self.make_key(key, version)
+        if len(dados) > self.local_tamanho_maximo:
+            self._descartar_local(chave_local)
+            return
+        duracao = self.local_timeout
+        expiracao_backend = self.get_backend_timeout(timeout)
+        if expiracao_backend is not None:
+            duracao = min(duracao, expiracao_backend - time.time())
+        if duracao <= 0:
+            self._descartar_local(chave_local)
+            return
+        camada = self._camada
+        with camada.trava:
+            camada.entradas[chave_local] = (time.monotonic() + duracao, dados)
+            camada.entradas.move_to_end(chave_local)
+            while len(camada.entradas) > self.local_max_entradas:
+                camada.entradas.popitem(last=False)
+
+    def _descartar_local(self, chave_local):
+        with self._camada.trava:
+            self._camada.entradas.pop(chave_local, None)
+
+    # Estatísticas
+
+    def _contar(self, campo, quantidade=1):
+        camada = self._camada
+        with camada.trava:
+            camada.contagens[campo] += quantidade
+            publicar = time.monotonic() - camada.publicadas_em >= INTERVALO_ESTATISTICAS
+        if publicar:
+            self.publicar_estatisticas()
+
+    def publicar_estatisticas(self):
+        """Soma as contagens deste processo às do cache compartilhado"""
+        camada = self._camada
+        with camada.trava:
+            camada.publicadas_em = time.monotonic()
+            contagens, camada.contagens = camada.contagens, Counter()
+        for campo, quantidade in contagens.items():
+            self._incrementar(PREFIXO_ESTATISTICAS + campo, quantidade, inicial=0)
+
+    def estatisticas(self):
+        """Contagens somadas de todos os processos (incluindo as ainda não publicadas deste)"""
+        self.publicar_estatisticas()
+        publicadas = self.compartilhado.get_many([PREFIXO_ESTATISTICAS + campo for campo in CAMPOS_ESTATISTICAS])
+        contagens = {campo: publicadas.get(PREFIXO_ESTATISTICAS + campo, 0) for campo in CAMPOS_ESTATISTICAS}
+        leituras = contagens['acerto_local'] + contagens['acerto_compartilhado'] + contagens['falha']
+        contagens['taxa_acerto'] = (
+            (contagens['acerto_local'] + contagens['acerto_compartilhado']) / leituras if leituras else 0.0
+        )
+        contagens['entradas_locais'] = len(self._camada.entradas)
+        return contagens
+
+    def zerar_estatisticas(self):
+        with self._camada.trava:
+            self._camada.contagens = Counter()
+        self.compartilhado.delete_many([PREFIXO_ESTATISTICAS + campo for campo in CAMPOS_ESTATISTICAS])
+
+    # API do cache
+
+    def get(self, key, default=None, version=None):
+        if not self._so_compartilhado(key):
+            valor = self._ler_local(self.make_key(key, version))
+            if valor is not _AUSENTE:
+                self._contar('acerto_local')
+                return valor
+        valor = self.compartilhado.get(key, _AUSENTE, version=version)
+        if valor is _AUSENTE:
+            self._contar('falha')
+            return default
+        self._contar('acerto_compartilhado')
+        # O timeout restante no compartilhado não é conhecido: a cópia local dura LOCAL_TIMEOUT
+        self._gravar_local(key, valor, None, version)
+        return valor
+
+    def get_many(self, keys, version=None):
+        encontrados = {}
+        faltando = []
+        for key in keys:
+            valor = _AUSENTE
+            if not self._so_compartilhado(key):
+                valor = self._ler_local(self.make_key(key, version))
+            if valor is _AUSENTE:
+                faltando.append(key)
+            else:
+                encontrados[key] = valor
+        self._contar('acerto_local', len(encontrados))
+        if faltando:
+            compartilhados = self.compartilhado.get_many(faltando, version=version)
+            self._contar('acerto_compartilhado', len(compartilhados))
+            self._contar('falha', len(faltando) - len(compartilhados))
+            for key, valor in compartilhados.items():
+                self._gravar_local(key, valor, None, version)
+            encontrados.update(compartilhados)
+        return encontrados
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.compartilhado.set(key, value, timeout, version=version)
+        self._gravar_local(key, value, timeout, version)
+        self._contar('gravacao')
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        falhas = self.compartilhado.set_many(data, timeout, version=version)
+        for key, valor in data.items():
+            if key not in falhas:
+                self._gravar_local(key, valor, timeout, version)
+        self._contar('gravacao', len(data) - len(falhas))
+        return falhas
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self.travas.segurando(f'chave:{self.make_key(key, version)}'):
+            adicionado = self.compartilhado.add(key, value, timeout, version=version)
+        if not adicionado:
+            return False
+        self._gravar_local(key, value, timeout, version)
+        self._contar('gravacao')
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._descartar_local(self.make_key(key, version))
+        return self.compartilhado.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._descartar_local(self.make_key(key, version))
+        return self.compartilhado.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._descartar_local(self.make_key(key, version))
+        self.compartilhado.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        if not self._so_compartilhado(key) and self._ler_local(self.make_key(key, version)) is not _AUSENTE:
+            return True
+        return self.compartilhado.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        # Contadores (ex.: versões) vivem só no compartilhado
+        self._descartar_local(self.make_key(key, version))
+        return self._incrementar(key, delta, version)
+
+    def _incrementar(self, key, delta, version=None, inicial=None):
+        """Ler, somar e gravar sob a trava da chave; sem `inicial`, chave ausente é ValueError"""
+        with self.travas.segurando(f'chave:{self.make_key(key, version)}'):
+            valor = self.compartilhado.get(key, _AUSENTE, version=version)
+            if valor is _AUSENTE:
+                if inicial is None:
+                    raise ValueError(f"Key '{key}' not found")
+                valor = inicial
+            valor += delta
+            self.compartilhado.set(key, valor, None, version=version)
+        return valor
+
+    def clear(self):
+        with self._camada.trava:
+            self._camada.entradas.clear()
+        self.compartilhado.clear()
+
+    def close(self, **kwargs):
+        self.compartilhado.close(**kwargs)
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        valor = self.get(key, _AUSENTE, version=version)
+        if valor is not _AUSENTE:
+            return valor
+        if not callable(default):
+            self.add(key, default, timeout, version=version)
+            return self.get(key, default, version=version)
+
+        trava_processo = self._camada.travas_chave[zlib.crc32(self.make_key(key, version).encode()) % TRAVAS_PROCESSO]
+        with trava_processo:
+            # Outra thread pode ter calculado enquanto esperávamos a trava
+            valor = self.get(key, _AUSENTE, version=version)
+            if valor is not _AUSENTE:
+                self._contar('espera')
+                return valor
+
+            chave_trava = f'recalculo:{self.make_key(key, version)}'
+            dono = self.travas.tentar(chave_trava, self.trava_timeout)
+            if dono is None:
+                # Outro processo está calculando: espera o valor (até o timeout da trava)
+                valor = self._esperar(key, chave_trava, version)
+                if valor is not _AUSENTE:
+                    self._contar('espera')
+                    return valor
+            try:
+                valor = default()
+                self.set(key, valor, timeout, version=version)
+                self._contar('recalculo')
+            finally:
+                if dono:
+                    self.travas.liberar(chave_trava, dono)
+            return valor
+
+    def _esperar(self, key, chave_trava, version):
+        limite = time.monotonic() + self.trava_timeout
+        pausa = 0.01
+        while time.monotonic() < limite:
+            time.sleep(pausa)
+            valor = self.compartilhado.get(key, _AUSENTE, version=version)
+            if valor is not _AUSENTE:
+                self._gravar_local(key, valor, None, version)
+                return valor
+            if not self.travas.existe(chave_trava):
+                # O outro processo terminou sem gravar (erro): calcula aqui
+                break
+            pausa = min(pausa * 2, 0.2)
+        return _AUSENTE
@@ -0,0 +1,125 @@
+"""
+Cache de página inteira das páginas públicas para visitantes anônimos
+(index, detalhes_produto, perfil_publico)
+
+A página renderizada fica no cache sob a versão de um namespace
+(versoes_cache): 'catalogo' para o index, produto:<id> e perfil:<id> para as
+demais. A view declara com depende_de() os outros namespaces que a página usa
+(o detalhe do produto mostra o perfil do vendedor); a versão de cada um é
+guardada junto e conferida a cada leitura, então os signals que invalidam
+esses namespaces (produto, perfil, avaliação, certificação) descartam a página
+sem precisar saber a URL.
+
+A chave da página é o caminho mais os parâmetros do GET que a view declara
+(pagina_publica(..., parametros=...)); uma requisição com qualquer outro
+parâmetro passa direto pela view, sem ocupar o cache.
+
+Num acerto não há consulta ao banco nem renderização de template, só leituras
+do cache. O token CSRF dos formulários é trocado por um do próprio visitante
+na hora de servir; o ETag (hash do HTML sem os tokens) e o Last-Modified deixam
+o navegador revalidar com 304.
+
+Usuários logados e visitantes com itens no carrinho (o cabeçalho mostra a
+contagem) passam direto pela view; para eles valem os fragmentos em cache dos
+templates ({% cache %} chaveado por atualizado_em).
+"""
+import hashlib
+import re
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .versoes_cache import chave, versao, versoes
+
+TEMPO_CACHE = 600
+TOKEN_CSRF = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+
+
+def _cacheavel(request):
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.user.is_authenticated
+        and not request.carrinho_itens
+    )
+
+
+def depende_de(request, *namespaces):
+    """Registra namespaces de que a página em renderização depende (sem efeito fora do cache)"""
+    dependencias = getattr(request, 'dependencias_pagina', None)
+    if dependencias is None:
+        return
+    for namespace in namespaces:
+        # Versão lida antes dos dados: uma invalidação durante a renderização não se perde
+        dependencias.setdefault(namespace, versao(namespace))
+
+
+def _responder(request, entrada):
+    resposta = get_conditional_response(request, etag=entrada['etag'], last_modified=entrada['modificado'])
+    if resposta is None:
+        # Um token novo por formulário, como o {% csrf_token %} faria
+        conteudo = TOKEN_CSRF.sub(
+            lambda encontrado: encontrado[1] + get_token(request).encode() + encontrado[2],
+            entrada['conteudo'],
+        )
+        resposta = HttpResponse(conteudo, content_type=entrada['tipo'])
+    resposta['ETag'] = entrada['etag']
+    resposta['Last-Modified'] = http_date(entrada['modificado'])
+    # Só o navegador guarda (o HTML leva o token CSRF do visitante), sempre revalidando
+    patch_cache_control(resposta, private=True, no_cache=True)
+    return resposta
+
+
+def _chave_parametros(request, parametros):
+    """
+    Parte da chave vinda da query string: só os parâmetros que a view lê, em ordem
+    fixa. None se a requisição traz outro parâmetro (não vai para o cache, senão cada
+    ?x=<aleatório> guardaria mais uma cópia da mesma página).
+    """
+    if any(nome not in parametros for nome in request.GET):
+        return None
+    lidos = [(nome, request.GET.getlist(nome)) for nome in parametros if nome in request.GET]
+    return hashlib.md5(repr(lidos).encode()).hexdigest()
+
+
+def pagina_publica(namespace, parametros=()):
+    """
+    Decorator das views públicas; namespace(**kwargs da URL) dá o namespace
+    principal da página e `parametros` os nomes do GET que a view lê
+    """
+    parametros = tuple(sorted(parametros))
+
+    def decorador(view):
+        @wraps(view)
+        def envoltorio(request, *args, **kwargs):
+            if not _cacheavel(request):
+                return view(request, *args, **kwargs)
+            consulta = _chave_parametros(request, parametros)
+            if consulta is None:
+                return view(request, *args, **kwargs)
+
+            chave_pagina = chave(namespace(**kwargs), 'pagina', request.path, consulta)
+            entrada = cache.get(chave_pagina)
+            if entrada is not None and versoes(entrada['dependencias']) == entrada['dependencias']:
+                return _responder(request, entrada)
+
+            request.dependencias_pagina = {}
+            resposta = view(request, *args, **kwargs)
+            if resposta.status_code != 200 or resposta.streaming or resposta.cookies:
+                return resposta
+            conteudo = TOKEN_CSRF.sub(rb'\1\2', resposta.content)
+            entrada = {
+                'conteudo': conteudo,
+                'tipo': resposta['Content-Type'],
+                'etag': quote_etag(hashlib.md5(conteudo).hexdigest()),
+                'modificado': int(time.time()),
+                'dependencias': request.dependencias_pagina,
+            }
+            cache.set(chave_pagina, entrada, TEMPO_CACHE)
+            return _responder(request, entrada)
+        return envoltorio
+    return decorador
@@ -0,0 +1,155 @@
+"""
+Carrinho de compras normalizado (uma linha ItemCarrinho por produto)
+
+Adicionar um produto é um UPDATE com quantidade = F('quantidade') + n na linha
+existente, ou um INSERT quando o produto ainda não está no carrinho; a restrição
+única (carrinho, produto) resolve a corrida entre dois INSERTs simultâneos.
+Nenhuma operação lê e regrava o carrinho inteiro.
+"""
+import hashlib
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .versoes_cache import invalidar, namespace_carrinho
+
+
+def obter_carrinho(request, criar=False):
+    """Carrinho do usuário logado ou da sessão anônima (None se não existir e criar=False)"""
+    from .models import Carrinho
+
+    if request.user.is_authenticated:
+        if criar:
+            return Carrinho.objects.get_or_create(usuario=request.user)[0]
+        return Carrinho.objects.filter(usuario=request.user).first()
+
+    if not request.session.session_key:
+        if not criar:
+            return None
+        request.session.create()
+    sessao_id = request.session.session_key
+    if criar:
+        return Carrinho.objects.get_or_create(sessao_id=sessao_id)[0]
+    return Carrinho.objects.filter(sessao_id=sessao_id).first()
+
+
+def _somar(carrinho_id, produto_id, quantidade, preco):
+    from .models import ItemCarrinho
+
+    linhas = ItemCarrinho.objects.filter(carrinho_id=carrinho_id, produto_id=produto_id)
+    if linhas.update(quantidade=F('quantidade') + quantidade):
+        return
+    try:
+        with transaction.atomic():
+            ItemCarrinho.objects.create(
+                carrinho_id=carrinho_id, produto_id=produto_id, quantidade=quantidade, preco=preco
+            )
+    except IntegrityError:
+        # Outra requisição inseriu o mesmo produto ao mesmo tempo
+        linhas.update(quantidade=F('quantidade') + quantidade)
+
+
+def _tocar(carrinho):
+    """Marca o carrinho como alterado e invalida a contagem em cache (o UPDATE não dispara signals)"""
+    from .models import Carrinho
+    Carrinho.objects.filter(pk=carrinho.pk).update(atualizado_em=timezone.now())
+    invalidar(namespace_carrinho(carrinho.usuario_id, carrinho.sessao_id))
+
+
+def adicionar_item(carrinho, produto, quantidade=1):
+    """Soma `quantidade` do produto ao carrinho (cria a linha com o preço atual se preciso)"""
+    _somar(carrinho.pk, produto.pk, quantidade, produto.preco)
+    _tocar(carrinho)
+
+
+def remover_item(carrinho, produto_id):
+    """Remove o produto do carrinho; retorna se havia a linha"""
+    removidos, _ = carrinho.itens_carrinho.filter(produto_id=produto_id).delete()
+    if removidos:
+        _tocar(carrinho)
+    return bool(removidos)
+
+
+def remover_produtos(carrinho, produto_ids):
+    """Remove vários produtos do carrinho de uma vez (ex.: os que acabaram de ser comprados)"""
+    removidos, _ = carrinho.itens_carrinho.filter(produto_id__in=list(produto_ids)).delete()
+    if removidos:
+        _tocar(carrinho)
+    return removidos
+
+
+def mesclar_carrinhos(origem, destino):
+    """Soma os itens de `origem` em `destino` e exclui `origem`"""
+    for produto_id, quantidade, preco in origem.itens_carrinho.values_list('produto_id', 'quantidade', 'preco'):
+        _somar(destino.pk, produto_id, quantidade, preco)
+    origem.delete()
+    _tocar(destino)
+
+
+def transferir_carrinho_sessao(sessao_id, usuario):
+    """
+    Move o carrinho anônimo da sessão `sessao_id` para o usuário recém-logado.
+    Retorna o carrinho do usuário, ou None se não havia carrinho na sessão.
+    """
+    from .models import Carrinho
+
+    if not sessao_id:
+        return None
+    carrinho_sessao = Carrinho.objects.filter(sessao_id=sessao_id, usuario__isnull=True).first()
+    if not carrinho_sessao or not carrinho_sessao.itens_carrinho.exists():
+        return None
+    carrinho_usuario, _ = Carrinho.objects.get_or_create(usuario=usuario)
+    mesclar_carrinhos(carrinho_sessao, carrinho_usuario)
+    return carrinho_usuario
+
+
+def contar_itens(carrinho):
+    """Quantidade de produtos distintos no carrinho"""
+    return carrinho.itens_carrinho.count() if carrinho else 0
+
+
+def centavos(valor):
+    """Valor em centavos (inteiro) para o Stripe, sem passar por float"""
+    return int((Decimal(valor) * 100).quantize(Decimal('1')))
+
+
+def precificar_carrinho(carrinho):
+    """
+    Resolve todas as linhas do carrinho com os produtos em uma única consulta e calcula
+    subtotais e total em Decimal pelo preço atual do produto. Cada linha indica se o
+    preço mudou desde que foi adicionada e se o produto deixou de estar disponível
+    (inativo); produtos indisponíveis não entram no total.
+    """
+    resultado = {'itens': [], 'total': Decimal('0.00'), 'precos_alterados': [], 'indisponiveis': []}
+    if carrinho is None:
+        return resultado
+
+    for item in carrinho.itens_carrinho.select_related('produto').order_by('adicionado_em', 'pk'):
+        produto = item.produto
+        linha = {
+            'produto': produto,
+            'quantidade': item.quantidade,
+            'preco': produto.preco,
+            'preco_carrinho': item.preco,
+            'subtotal': produto.preco * item.quantidade,
+            'preco_alterado': produto.preco != item.preco,
+            'indisponivel': not produto.ativo,
+        }
+        resultado['itens'].append(linha)
+        if linha['indisponivel']:
+            resultado['indisponiveis'].append(linha)
+            continue
+        if linha['preco_alterado']:
+            resultado['precos_alterados'].append(linha)
+        resultado['total'] += linha['subtotal']
+    return resultado
+
+
+def hash_carrinho(precificacao):
+    """Hash do conteúdo precificado (produto, quantidade, preço): muda se qualquer linha mudar"""
+    linhas = sorted(
+        f"{item['produto'].pk}:{item['quantidade']}:{item['preco']}" for item in precificacao['itens']
+    )
+    return hashlib.sha256('|'.join(linhas).encode()).hexdigest()
@@ -0,0 +1,249 @@
+"""
+Estado de certificação desnormalizado em Produto e Perfil
+
+Cada produto/perfil guarda se tem certificação aprovada vigente, quantas são e até
+quando a mais longa vale (None = alguma aprovada sem validade). Assim as listagens
+filtram e exibem o selo sem join nem consulta por item.
+
+A fila de análise (gerenciar_certificacoes) decide várias de uma vez com trava
+otimista pelo campo versao; a varredura (comando varrer_certificacoes) expira as
+aprovadas vencidas e avisa os produtores das que estão para vencer.
+"""
+import logging
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Q
+from django.utils import timezone
+
+from .tarefas import enfileirar, tarefa
+from .versoes_cache import invalidar, invalidar_perfis, namespace_produto
+
+logger = logging.getLogger(__name__)
+
+# Status que ainda podem ser decididos na fila de análise
+EM_ANALISE = ('enviado_analise', 'reprovada')
+LOTE_VARREDURA = 500
+
+
+def aprovadas_vigentes(queryset, hoje=None):
+    """Filtra certificações aprovadas que ainda não venceram"""
+    hoje = hoje or timezone.localdate()
+    return queryset.filter(status='aprovada').filter(
+        Q(validade__isnull=True) | Q(validade__gte=hoje)
+    )
+
+
+def certificado_vigente(hoje=None):
+    """Condição (Q) de certificação vigente pelas colunas desnormalizadas"""
+    hoje = hoje or timezone.localdate()
+    return Q(certificado=True) & (Q(certificacao_validade__isnull=True) | Q(certificacao_validade__gte=hoje))
+
+
+def filtrar_certificados(queryset, hoje=None):
+    """Filtra produtos (ou perfis) com certificação vigente, usando só as colunas desnormalizadas"""
+    return queryset.filter(certificado_vigente(hoje))
+
+
+def _resumo(campo, ids):
+    """Agrega as certificações vigentes por produto ou perfil em uma única consulta"""
+    from .models import Certificacao
+    linhas = (
+        aprovadas_vigentes(Certificacao.objects.filter(**{f'{campo}__in': ids}))
+        .values(campo)
+        .annotate(
+            total=Count('pk'),
+            ultima_validade=Max('validade'),
+            sem_validade=Count('pk', filter=Q(validade__isnull=True)),
+        )
+    )
+    return {
+        linha[campo]: (linha['total'], None if linha['sem_validade'] else linha['ultima_validade'])
+        for linha in linhas
+    }
+
+
+def _aplicar(modelo, campo, ids):
+    ids = [i for i in set(ids) if i is not None]
+    if not ids:
+        return
+    resumo = _resumo(campo, ids)
+    agora = timezone.now()
+    objetos = list(modelo.objects.filter(pk__in=ids).only(
+        'pk', 'certificado', 'certificacao_validade', 'certificacoes_aprovadas'
+    ))
+    for obj in objetos:
+        total, validade = resumo.get(obj.pk, (0, None))
+        obj.certificado = total > 0
+        obj.certificacoes_aprovadas = total
+        obj.certificacao_validade = validade
+        # Carimbo dos fragmentos em cache (selo e lista de certificações)
+        obj.atualizado_em = agora
+    modelo.objects.bulk_update(
+        objetos, ['certificado', 'certificacao_validade', 'certificacoes_aprovadas', 'atualizado_em'], batch_size=500
+    )
+    return ids
+
+
+@tarefa('certificacoes.atualizar_estado')
+def atualizar_estado_certificacao(produto_ids=(), perfil_ids=()):
+    """Recalcula o estado de certificação dos produtos e perfis informados"""
+    from .facetas import invalidar_facetas
+    from .models import Perfil, Produto
+    atualizados = _aplicar(Produto, 'produto', produto_ids)
+    if atualizados:
+        invalidar_facetas()
+        for produto_id in atualizados:
+            invalidar(namespace_produto(produto_id))
+    invalidar_perfis(_aplicar(Perfil, 'perfil', perfil_ids) or ())
+
+
+def anexar_arquivo(certificacao, arquivo):
+    """
+    Anexa o arquivo enviado à certificação guardando o SHA-256 (calculado no upload).
+    O armazenamento por conteúdo (armazenamento.py) grava a mesma evidência uma vez só.
+    """
+    from .uploads import sha256_arquivo
+
+    certificacao.arquivo_sha256 = sha256_arquivo(arquivo)
+    certificacao.arquivo_certificado = arquivo
+
+
+def administrador_do_usuario(usuario):
+    """Administrador (cadastro próprio, por e-mail) correspondente ao superusuário logado"""
+    from .models import Administrador
+
+    if not usuario.email:
+        return None
+    administrador, _ = Administrador.objects.get_or_create(
+        email=usuario.email, defaults={'nome': usuario.get_full_name() or usuario.username, 'senha': ''}
+    )
+    return administrador
+
+
+def decidir(versoes, aprovar, parecer='', administrador=None):
+    """
+    Aprova ou reprova as certificações de `versoes` ({id: versão que o auditor viu})
+    num único bulk_update. Só entram as que continuam na versão vista (trava otimista):
+    o que outro auditor decidiu nesse meio-tempo é ignorado. Retorna (decididas, conflitos).
+    """
+    from .models import Certificacao
+
+    hoje = timezone.localdate()
+    with transaction.atomic():
+        certificacoes = list(
+            Certificacao.objects.select_for_update()
+            .filter(pk__in=versoes, status__in=EM_ANALISE)
+            .only('pk', 'versao', 'status', 'produto_id', 'perfil_id')
+        )
+        decididas = [c for c in certificacoes if c.versao == versoes[c.pk]]
+        for certificacao in decididas:
+            certificacao.status = 'aprovada' if aprovar else 'reprovada'
+            certificacao.administrador = administrador
+            certificacao.data_certificacao = hoje
+            certificacao.parecer = parecer
+            certificacao.versao += 1
+        Certificacao.objects.bulk_update(
+            decididas, ['status', 'administrador', 'data_certificacao', 'parecer', 'versao'], batch_size=500
+        )
+        if decididas:
+            # bulk_update não dispara os signals de Certificacao
+            enfileirar(
+                'certificacoes.atualizar_estado',
+                produto_ids=sorted({c.produto_id for c in decididas if c.produto_id}),
+                perfil_ids=sorted({c.perfil_id for c in decididas if c.perfil_id}),
+            )
+    return len(decididas), len(versoes) - len(decididas)
+
+
+def _em_lotes(consulta, lote, **valores):
+    """
+    Aplica `valores` às linhas da consulta em lotes de `lote`, sem carregar tudo: cada
+    lote atualizado sai do filtro, então a próxima volta pega o seguinte. Retorna as
+    linhas (pk, produto_id, perfil_id) de cada lote, conforme vai avançando.
+    """
+    from .models import Certificacao
+
+    while True:
+        linhas = list(consulta.order_by('validade', 'pk').values_list('pk', 'produto_id', 'perfil_id')[:lote])
+        if not linhas:
+            return
+        with transaction.atomic():
+            Certificacao.objects.filter(pk__in=[linha[0] for linha in linhas]).update(
+                versao=F('versao') + 1, **valores
+            )
+            yield linhas
+
+
+def expirar_vencidas(hoje=None, lote=LOTE_VARREDURA):
+    """Aprovadas com validade anterior a hoje passam a 'expirada'; retorna quantas"""
+    from .models import Certificacao
+
+    hoje = hoje or timezone.localdate()
+    total = 0
+    for linhas in _em_lotes(
+        Certificacao.objects.filter(status='aprovada', validade__lt=hoje), lote, status='expirada'
+    ):
+        atualizar_estado_certificacao(
+            produto_ids=[linha[1] for linha in linhas], perfil_ids=[linha[2] for linha in linhas]
+        )
+        enfileirar('certificacoes.notificar', certificacao_ids=[linha[0] for linha in linhas], motivo='expirada')
+        total += len(linhas)
+    return total
+
+
+def avisar_vencimento(dias, hoje=None, lote=LOTE_VARREDURA):
+    """Avisa (uma vez) os produtores das aprovadas que vencem nos próximos `dias`; retorna quantas"""
+    from .models import Certificacao
+
+    hoje = hoje or timezone.localdate()
+    consulta = Certificacao.objects.filter(
+        status='aprovada', validade__gte=hoje, validade__lte=hoje + timedelta(days=dias),
+        aviso_vencimento_em__isnull=True,
+    )
+    total = 0
+    for linhas in _em_lotes(consulta, lote, aviso_vencimento_em=timezone.now()):
+        enfileirar('certificacoes.notificar', certificacao_ids=[linha[0] for linha in linhas], motivo='vencendo')
+        total += len(linhas)
+    return total
+
+
+def _remetente():
+    from django.contrib.auth.models import User
+
+    nome = getattr(settings, 'CERTIFICACOES_REMETENTE', '')
+    if nome:
+        return User.objects.filter(username=nome).first()
+    return User.objects.filter(is_superuser=True).order_by('pk').first()
+
+
+@tarefa('certificacoes.notificar')
+def notificar_produtores(certificacao_ids, motivo):
+    """Uma mensagem na caixa de entrada de cada perfil com as certificações expiradas ou a vencer"""
+    from .models import Certificacao, Mensagem
+
+    remetente = _remetente()
+    if remetente is None:
+        logger.warning('Sem remetente para avisos de certificação (CERTIFICACOES_REMETENTE)')
+        return
+    certificacoes = (
+        Certificacao.objects.filter(pk__in=certificacao_ids, perfil__isnull=False)
+        .select_related('perfil', 'produto')
+        .order_by('perfil__user_id', 'validade')
+    )
+    if motivo == 'expirada':
+        assunto = 'Certificações expiradas'
+        abertura = 'As certificações abaixo venceram e deixaram de aparecer como vigentes:'
+    else:
+        assunto = 'Certificações perto do vencimento'
+        abertura = 'As certificações abaixo vencem em breve. Envie a renovação pelo painel:'
+    for usuario_id, grupo in groupby(certificacoes, key=lambda c: c.perfil.user_id):
+        linhas = [
+            f"- {c.produto.nome if c.produto else 'Perfil'}: validade {c.validade:%d/%m/%Y}" for c in grupo
+        ]
+        Mensagem.objects.create(
+            remetente=remetente, destinatario_id=usuario_id, assunto=assunto,
+            corpo='\n'.join([abertura, *linhas]),
+        )
@@ -0,0 +1,183 @@
+"""
+Manutenção do resumo de conversas (Conversa) usado pela caixa de entrada
+
+Cada mensagem é ligada à conversa do par remetente/destinatário; ao enviar, a
+conversa recebe o ponteiro da última mensagem e o contador de não lidas do
+destinatário é incrementado com F(). Ao ler, as mensagens são marcadas e o
+contador é recalculado para o participante. Mudanças nos contadores são avisadas
+às conexões em tempo real (tempo_real) depois do commit.
+
+Excluir a conversa da caixa de entrada vale só para quem excluiu: a conversa
+guarda até qual mensagem cada participante a excluiu (excluida_ate_a/b) e
+ela volta a aparecer, só com as mensagens novas, quando chega outra.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Q, Sum, When
+
+
+def participantes_ordenados(usuario_id_1, usuario_id_2):
+    """Par (menor id, maior id), a chave única da conversa"""
+    return (usuario_id_1, usuario_id_2) if usuario_id_1 <= usuario_id_2 else (usuario_id_2, usuario_id_1)
+
+
+def obter_conversa(usuario_id_1, usuario_id_2, criar=True):
+    """Busca (ou cria) a conversa entre dois usuários"""
+    from .models import Conversa
+
+    a, b = participantes_ordenados(usuario_id_1, usuario_id_2)
+    conversa = Conversa.objects.filter(usuario_a_id=a, usuario_b_id=b).first()
+    if conversa or not criar:
+        return conversa
+    try:
+        with transaction.atomic():
+            return Conversa.objects.create(usuario_a_id=a, usuario_b_id=b)
+    except IntegrityError:
+        # Outra requisição criou a mesma conversa ao mesmo tempo
+        return Conversa.objects.get(usuario_a_id=a, usuario_b_id=b)
+
+
+def campo_nao_lidas(conversa, usuario_id):
+    """Nome do contador de não lidas do participante"""
+    return 'nao_lidas_a' if conversa.usuario_a_id == usuario_id else 'nao_lidas_b'
+
+
+def campo_excluida(conversa, usuario_id):
+    """Nome do campo até onde o participante excluiu a conversa"""
+    return 'excluida_ate_a' if conversa.usuario_a_id == usuario_id else 'excluida_ate_b'
+
+
+def mensagens_visiveis(conversa, usuario_id):
+    """Mensagens da conversa que o participante não excluiu"""
+    return conversa.mensagens.filter(id_mensagem__gt=getattr(conversa, campo_excluida(conversa, usuario_id)))
+
+
+def excluir_da_caixa(conversa, usuario):
+    """Tira a conversa da caixa de entrada do usuário, sem apagar nada do outro participante"""
+    from .models import Conversa
+
+    marcar_lidas(conversa, usuario)
+    Conversa.objects.filter(pk=conversa.pk).update(
+        **{campo_excluida(conversa, usuario.id): F('ultima_mensagem_id')}
+    )
+
+
+def vincular_mensagem(mensagem):
+    """Preenche mensagem.conversa antes de salvar (chamado no pre_save)"""
+    if mensagem.conversa_id is None:
+        mensagem.conversa = obter_conversa(mensagem.remetente_id, mensagem.destinatario_id)
+
+
+def _avisar_nao_lidas(*usuario_ids):
+    from .tempo_real import publicar_nao_lidas
+
+    for usuario_id in usuario_ids:
+        transaction.on_commit(lambda usuario_id=usuario_id: publicar_nao_lidas(usuario_id))
+
+
+def registrar_mensagem(mensagem):
+    """Atualiza a conversa após uma mensagem nova: última mensagem e não lidas do destinatário"""
+    from .models import Conversa
+
+    conversa = mensagem.conversa
+    valores = {
+        'ultima_mensagem': mensagem,
+        'atualizada_em': mensagem.criada_em,
+    }
+    if not mensagem.lida:
+        campo = campo_nao_lidas(conversa, mensagem.destinatario_id)
+        valores[campo] = F(campo) + 1
+    Conversa.objects.filter(pk=conversa.pk).update(**valores)
+
+
+def recalcular_conversa(conversa_id):
+    """Recalcula última mensagem e contadores a partir das mensagens (após exclusões ou 'não lida')"""
+    from .models import Conversa, Mensagem
+
+    conversa = Conversa.objects.filter(pk=conversa_id).first()
+    if conversa is None:
+        return
+    mensagens = Mensagem.objects.filter(conversa_id=conversa_id)
+    ultima = mensagens.order_by('-id_mensagem').first()
+    if ultima is None:
+        conversa.delete()
+        return
+    nao_lidas = mensagens.filter(lida=False).aggregate(
+        a=Sum(Case(When(destinatario_id=conversa.usuario_a_id, then=1), default=0)),
+        b=Sum(Case(When(destinatario_id=conversa.usuario_b_id, then=1), default=0)),
+    )
+    Conversa.objects.filter(pk=conversa_id).update(
+        ultima_mensagem=ultima,
+        atualizada_em=ultima.criada_em,
+        nao_lidas_a=nao_lidas['a'] or 0,
+        nao_lidas_b=nao_lidas['b'] or 0,
+    )
+    _avisar_nao_lidas(conversa.usuario_a_id, conversa.usuario_b_id)
+
+
+def marcar_lidas(conversa, usuario, ids=None):
+    """
+    Marca como lidas as mensagens recebidas pelo usuário na conversa (todas, ou só `ids`)
+    e atualiza o contador dele. Retorna quantas mensagens foram marcadas.
+    """
+    from .models import Conversa, Mensagem
+
+    filtro = Mensagem.objects.filter(conversa=conversa, destinatario=usuario, lida=False)
+    if ids is not None:
+        filtro = filtro.filter(id_mensagem__in=ids)
+    marcadas = filtro.update(lida=True)
+    if marcadas:
+        campo = campo_nao_lidas(conversa, usuario.id)
+        restantes = Mensagem.objects.filter(conversa=conversa, destinatario=usuario, lida=False).count()
+        Conversa.objects.filter(pk=conversa.pk).update(**{campo: restantes})
+        _avisar_nao_lidas(usuario.id)
+    return marcadas
+
+
+def conversas_do_usuario(usuario):
+    """Conversas do usuário (menos as que ele excluiu sem mensagem nova), da mais recente para a mais antiga"""
+    from .models import Conversa
+
+    return (
+        Conversa.objects.filter(
+            Q(usuario_a=usuario, ultima_mensagem_id__gt=F('excluida_ate_a'))
+            | Q(usuario_b=usuario, ultima_mensagem_id__gt=F('excluida_ate_b'))
+        )
+        .select_related('usuario_a', 'usuario_b', 'ultima_mensagem')
+        .order_by('-atualizada_em', '-id_conversa')
+    )
+
+
+def total_nao_lidas(usuario):
+    """Soma das não lidas do usuário em todas as conversas (uma consulta)"""
+    from .models import Conversa
+
+    total = Conversa.objects.filter(Q(usuario_a=usuario) | Q(usuario_b=usuario)).aggregate(
+        total=Sum(Case(When(usuario_a=usuario, then=F('nao_lidas_a')), default=F('nao_lidas_b')))
+    )['total']
+    return total or 0
+
+
+def janela_mensagens(conversa, usuario, tamanho, antes=None):
+    """
+    Últimas `tamanho` mensagens da conversa visíveis ao usuário (ou as anteriores ao id
+    `antes`), em ordem cronológica. Retorna (mensagens, ha_mais_antigas).
+    """
+    mensagens = mensagens_visiveis(conversa, usuario.id)
+    if antes:
+        mensagens = mensagens.filter(id_mensagem__lt=antes)
+    janela = list(mensagens.order_by('-id_mensagem')[:tamanho + 1])
+    return janela[:tamanho][::-1], len(janela) > tamanho
+
+
+def mensagens_desde(conversa, usuario, desde, limite):
+    """Mensagens visíveis ao usuário com id maior que `desde`, em ordem cronológica (para polling)"""
+    mensagens = mensagens_visiveis(conversa, usuario.id)
+    return list(mensagens.filter(id_mensagem__gt=desde).order_by('id_mensagem')[:limite])
+
+
+def marcar_entregues(conversa, usuario, mensagens):
+    """Marca como lidas só as mensagens entregues ao usuário nesta resposta"""
+    ids = [m.id_mensagem for m in mensagens if m.destinatario_id == usuario.id and not m.lida]
+    if ids:
+        marcar_lidas(conversa, usuario, ids=ids)
+    return ids
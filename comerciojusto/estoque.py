@@ -0,0 +1,148 @@
+"""
+Reserva de estoque no checkout (Produto.estoque)
+
+Reservar é um UPDATE condicional: estoque = estoque - n WHERE estoque >= n. Se
+nenhuma linha muda, não há estoque; nada fica travado no Python e duas compras
+simultâneas do último item não passam as duas. Produto com estoque vazio (None)
+não tem controle de estoque e não gera reserva.
+
+A reserva volta para o estoque quando expira (expirar_reservas / comando
+expirar_reservas) ou quando a sessão do Stripe expira ou falha
+(liberar_reservas), e vira venda na confirmação do pagamento
+(converter_reservas) sem uma segunda baixa. Toda troca de status parte de
+'ativa' com um UPDATE condicional, então expirar e converter a mesma reserva ao
+mesmo tempo não devolve nem baixa o estoque duas vezes.
+"""
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+# A reserva dura um pouco mais que a sessão do Stripe: o webhook de pagamento
+# concluído no último minuto ainda encontra a reserva ativa
+MARGEM_RESERVA = timedelta(minutes=5)
+# O Stripe recusa expires_at a menos de 30 min do relógio dele: 1 min de folga
+DURACAO_MINIMA_CHECKOUT = timedelta(minutes=31)
+
+
+class EstoqueInsuficiente(Exception):
+    def __init__(self, produto_id, quantidade):
+        super().__init__(f'Estoque insuficiente para o produto {produto_id} (pedido: {quantidade})')
+        self.produto_id = produto_id
+        self.quantidade = quantidade
+
+
+def duracao_checkout():
+    """
+    Validade da sessão de checkout (settings.ESTOQUE_RESERVA_MINUTOS; o Stripe aceita de
+    30 min a 24 h), nunca abaixo de DURACAO_MINIMA_CHECKOUT
+    """
+    return max(timedelta(minutes=getattr(settings, 'ESTOQUE_RESERVA_MINUTOS', 30)), DURACAO_MINIMA_CHECKOUT)
+
+
+def _baixar(produto_id, quantidade):
+    from .models import Produto
+    return Produto.objects.filter(pk=produto_id, estoque__gte=quantidade).update(
+        estoque=F('estoque') - quantidade
+    )
+
+
+def baixar_sem_reserva(produto_id, quantidade):
+    """
+    Baixa na hora uma quantidade paga sem reserva válida, com o mesmo UPDATE condicional
+    da reserva. Retorna False se o produto controla estoque e não há o suficiente.
+    """
+    from .models import Produto
+    if _baixar(produto_id, quantidade):
+        return True
+    return not Produto.objects.filter(pk=produto_id, estoque__isnull=False).exists()
+
+
+def reservar(usuario, itens):
+    """
+    Reserva tudo ou nada. `itens` é um iterável de (produto_id, quantidade).
+    Retorna a referência provisória das reservas (troque pelo id da sessão com
+    vincular_reservas) ou levanta EstoqueInsuficiente.
+    """
+    from .models import Produto, ReservaEstoque
+
+    quantidades = Counter()
+    for produto_id, quantidade in itens:
+        quantidades[produto_id] += quantidade
+    controlados = sorted(
+        Produto.objects.filter(pk__in=quantidades, estoque__isnull=False).values_list('pk', flat=True)
+    )
+    referencia = f'reserva_{uuid.uuid4().hex}'
+    if not controlados:
+        return referencia
+
+    # Reservas vencidas desses produtos voltam antes, senão seguram estoque à toa
+    expirar_reservas(produto_ids=controlados)
+    expira_em = timezone.now() + duracao_checkout() + MARGEM_RESERVA
+    with transaction.atomic():
+        # Ordem fixa dos produtos: duas compras com os mesmos itens não se travam
+        for produto_id in controlados:
+            if not _baixar(produto_id, quantidades[produto_id]):
+                raise EstoqueInsuficiente(produto_id, quantidades[produto_id])
+        ReservaEstoque.objects.bulk_create([
+            ReservaEstoque(
+                produto_id=produto_id, usuario=usuario, quantidade=quantidades[produto_id],
+                referencia=referencia, expira_em=expira_em,
+            )
+            for produto_id in controlados
+        ])
+    return referencia
+
+
+def vincular_reservas(referencia, nova_referencia):
+    """Troca a referência provisória pelo id da sessão de checkout"""
+    from .models import ReservaEstoque
+    ReservaEstoque.objects.filter(referencia=referencia).update(referencia=nova_referencia)
+
+
+def _devolver(reservas, status):
+    """Devolve ao estoque as reservas ativas do queryset, marcando-as com `status`"""
+    from .models import Produto, ReservaEstoque
+
+    devolvidas = 0
+    for pk, produto_id, quantidade in reservas.filter(status='ativa').values_list('pk', 'produto_id', 'quantidade'):
+        with transaction.atomic():
+            if ReservaEstoque.objects.filter(pk=pk, status='ativa').update(status=status):
+                Produto.objects.filter(pk=produto_id, estoque__isnull=False).update(estoque=F('estoque') + quantidade)
+                devolvidas += 1
+    return devolvidas
+
+
+def expirar_reservas(produto_ids=None):
+    """Devolve as reservas vencidas (opcionalmente só dos produtos informados); retorna quantas"""
+    from .models import ReservaEstoque
+
+    reservas = ReservaEstoque.objects.filter(expira_em__lte=timezone.now())
+    if produto_ids is not None:
+        reservas = reservas.filter(produto_id__in=produto_ids)
+    return _devolver(reservas, 'expirada')
+
+
+def liberar_reservas(referencia):
+    """Devolve as reservas de um checkout que não foi pago"""
+    from .models import ReservaEstoque
+    return _devolver(ReservaEstoque.objects.filter(referencia=referencia), 'liberada')
+
+
+def converter_reservas(referencia):
+    """
+    Marca como venda as reservas ativas do checkout pago. Retorna {produto_id: quantidade}
+    do que já estava baixado do estoque (o resto precisa de baixa na hora).
+    """
+    from .models import ReservaEstoque
+
+    convertidas = Counter()
+    ativas = ReservaEstoque.objects.filter(referencia=referencia, status='ativa')
+    for pk, produto_id, quantidade in ativas.values_list('pk', 'produto_id', 'quantidade'):
+        if ReservaEstoque.objects.filter(pk=pk, status='ativa').update(status='convertida'):
+            convertidas[produto_id] += quantidade
+    return convertidas
@@ -0,0 +1,261 @@
+"""
+Navegação por facetas do catálogo: categoria, faixa de preço, certificado, estado e estoque
+
+As contagens saem de um "cubo": uma única consulta agrupada por todas as
+facetas ao mesmo tempo (uma linha por combinação existente, poucos milhares no
+máximo), guardada no cache. Qualquer combinação de filtros é respondida
+somando as linhas do cubo em Python, sem um COUNT por faceta nem consulta nova
+a cada clique.
+
+Cada faceta é contada com os filtros das outras, mas não com os dela (valores
+da mesma faceta se somam com OU): o número ao lado de uma opção é quantos
+produtos aparecem ao marcá-la.
+
+Com uma pesquisa, o cubo é contado na hora só sobre os resultados dela (cada
+texto é diferente, guardar no cache não compensa). Com o filtro por distância,
+as contagens saem dos produtos no raio (a lista já ordenada por geo.py) e o cubo
+deles fica no cache sob essa lista.
+
+O cubo é descartado pela versão do namespace 'catalogo' (signals de Produto e
+Perfil, atualização das certificações). Baixas de estoque feitas por UPDATE
+direto (estoque.py) aparecem nas contagens depois de TEMPO_CACHE.
+"""
+import hashlib
+from collections import Counter
+
+from django.core.cache import cache
+from django.db.models import BooleanField, Case, CharField, Count, Q, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .busca import buscar_produtos, tokenizar
+from .certificacoes import certificado_vigente
+from .geo import UFS
+from .versoes_cache import chave, invalidar
+
+NAMESPACE = 'catalogo'
+TEMPO_CACHE = 300
+LOTE_IN = 500
+
+# chave, rótulo, mínimo (inclusive), máximo (exclusivo)
+FAIXAS_PRECO = (
+    ('ate-10', 'Até R$ 10', None, 10),
+    ('10-25', 'R$ 10 a R$ 25', 10, 25),
+    ('25-50', 'R$ 25 a R$ 50', 25, 50),
+    ('50-100', 'R$ 50 a R$ 100', 50, 100),
+    ('acima-100', 'Acima de R$ 100', 100, None),
+)
+
+# Ordem das colunas do cubo; as duas últimas são sim/não
+FACETAS = ('categoria', 'faixa', 'estado', 'certificado', 'estoque')
+MULTIPLAS = ('categoria', 'faixa', 'estado')
+# Parâmetros do GET lidos por ler_filtros
+PARAMETROS = (*MULTIPLAS, 'certificado', 'estoque')
+
+
+def categorias():
+    """Categorias de Produto.CATEGORIA_CHOICES ('todas' é o padrão de produto sem categoria)"""
+    from .models import Produto
+    return [(valor, rotulo) for valor, rotulo in Produto.CATEGORIA_CHOICES if valor != 'todas']
+
+
+def invalidar_facetas():
+    invalidar(NAMESPACE)
+
+
+def ler_filtros(parametros):
+    """Filtros das facetas a partir do GET; valores desconhecidos são ignorados"""
+    validos = {
+        'categoria': {valor for valor, _ in categorias()},
+        'faixa': {faixa[0] for faixa in FAIXAS_PRECO},
+        'estado': set(UFS),
+    }
+    filtros = {}
+    for faceta in MULTIPLAS:
+        valores = (v.strip() for v in parametros.getlist(faceta))
+        if faceta == 'estado':
+            valores = (v.upper() for v in valores)
+        filtros[faceta] = {v for v in valores if v in validos[faceta]}
+    filtros['certificado'] = parametros.get('certificado') == '1'
+    filtros['estoque'] = parametros.get('estoque') == '1'
+    return filtros
+
+
+def _q_faixa(minimo, maximo):
+    condicao = Q()
+    if minimo is not None:
+        condicao &= Q(preco__gte=minimo)
+    if maximo is not None:
+        condicao &= Q(preco__lt=maximo)
+    return condicao
+
+
+def _q_estoque():
+    # Estoque vazio = sem controle de estoque, sempre disponível
+    return Q(estoque__isnull=True) | Q(estoque__gt=0)
+
+
+def _q_estado(ufs):
+    # Produtos antigos só têm o perfil pelo produtor
+    return Q(perfil__estado__in=ufs) | Q(perfil__isnull=True, produtor__perfil__estado__in=ufs)
+
+
+def filtrar(produtos, filtros, hoje=None):
+    """Aplica os filtros das facetas ao queryset de produtos"""
+    if filtros['categoria']:
+        produtos = produtos.filter(categoria__in=filtros['categoria'])
+    if filtros['faixa']:
+        faixas = Q()
+        for valor, _, minimo, maximo in FAIXAS_PRECO:
+            if valor in filtros['faixa']:
+                faixas |= _q_faixa(minimo, maximo)
+        produtos = produtos.filter(faixas)
+    if filtros['estado']:
+        produtos = produtos.filter(_q_estado(filtros['estado']))
+    if filtros['certificado']:
+        produtos = produtos.filter(certificado_vigente(hoje))
+    if filtros['estoque']:
+        produtos = produtos.filter(_q_estoque())
+    return produtos
+
+
+def _calcular_cubo(produtos, hoje):
+    consulta = produtos.order_by().annotate(
+        faceta_faixa=Case(
+            *[When(_q_faixa(minimo, maximo), then=Value(valor)) for valor, _, minimo, maximo in FAIXAS_PRECO],
+            default=Value(''), output_field=CharField(),
+        ),
+        faceta_estado=Coalesce('perfil__estado', 'produtor__perfil__estado', Value(''), output_field=CharField()),
+        faceta_certificado=Case(
+            When(certificado_vigente(hoje), then=Value(True)), default=Value(False), output_field=BooleanField(),
+        ),
+        faceta_estoque=Case(
+            When(_q_estoque(), then=Value(True)), default=Value(False), output_field=BooleanField(),
+        ),
+    ).values(
+        'categoria', 'faceta_faixa', 'faceta_estado', 'faceta_certificado', 'faceta_estoque'
+    ).annotate(total=Count('pk'))
+    return [
+        (
+            linha['categoria'], linha['faceta_faixa'], linha['faceta_estado'],
+            linha['faceta_certificado'], linha['faceta_estoque'], linha['total'],
+        )
+        for linha in consulta
+    ]
+
+
+def cubo(pesquisa='', hoje=None):
+    """
+    Linhas (categoria, faixa, estado, certificado, estoque, total) dos produtos do catálogo,
+    pelo cache, ou do resultado da pesquisa, contadas na hora
+    """
+    from .models import Produto
+
+    hoje = hoje or timezone.localdate()
+    if tokenizar(pesquisa):
+        # Só os ids: a relevância anotada pela busca não entra no agrupamento
+        resultados = buscar_produtos(Produto.objects.all(), pesquisa).values('pk')
+        return _calcular_cubo(Produto.objects.filter(pk__in=resultados), hoje)
+
+    chave_cubo = chave(NAMESPACE, 'cubo', hoje.isoformat())
+    # Com o cache em camadas, um só worker recalcula o cubo depois de uma invalidação
+    return cache.get_or_set(chave_cubo, lambda: _calcular_cubo(Produto.objects.all(), hoje), TEMPO_CACHE)
+
+
+def cubo_produtos(ids, hoje=None):
+    """Linhas do cubo só dos produtos `ids` (os do raio da busca por distância), pelo cache"""
+    from .models import Produto
+
+    hoje = hoje or timezone.localdate()
+    ids = sorted(ids)
+    assinatura = hashlib.md5(','.join(map(str, ids)).encode()).hexdigest()
+
+    def calcular():
+        somadas = Counter()
+        for inicio in range(0, len(ids), LOTE_IN):
+            lote = Produto.objects.filter(pk__in=ids[inicio:inicio + LOTE_IN])
+            for *valores, total in _calcular_cubo(lote, hoje):
+                somadas[tuple(valores)] += total
+        return [(*valores, total) for valores, total in somadas.items()]
+
+    return cache.get_or_set(chave(NAMESPACE, 'cubo_produtos', hoje.isoformat(), assinatura), calcular, TEMPO_CACHE)
+
+
+def _aceita(faceta, valor, filtros):
+    selecionado = filtros[faceta]
+    if faceta in MULTIPLAS:
+        return not selecionado or valor in selecionado
+    return not selecionado or valor
+
+
+def contar(linhas, filtros):
+    """
+    (total com todos os filtros, {faceta: Counter}) em que cada faceta é contada
+    com os filtros das demais
+    """
+    contagens = {faceta: Counter() for faceta in FACETAS}
+    total = 0
+    for *valores, quantidade in linhas:
+        recusadas = [faceta for faceta, valor in zip(FACETAS, valores) if not _aceita(faceta, valor, filtros)]
+        if len(recusadas) > 1:
+            continue
+        if not recusadas:
+            total += quantidade
+        for faceta, valor in zip(FACETAS, valores):
+            if not recusadas or recusadas[0] == faceta:
+                contagens[faceta][valor] += quantidade
+    return total, contagens
+
+
+def _url(parametros, faceta, valor=None):
+    """Querystring com `valor` marcado/desmarcado na faceta (ou a faceta limpa, se valor for None)"""
+    parametros = parametros.copy()
+    parametros.pop('cursor', None)
+    atuais = parametros.getlist(faceta)
+    if faceta == 'categoria':
+        atuais = [v for v in atuais if v != 'todas']
+    if valor is None:
+        novos = []
+    elif valor in atuais:
+        novos = [v for v in atuais if v != valor]
+    else:
+        novos = atuais + [valor]
+    parametros.setlist(faceta, novos)
+    return '?' + parametros.urlencode()
+
+
+def montar(parametros, filtros, pesquisa='', ids=None):
+    """
+    Contagens e links da barra de facetas do catálogo; com `ids` (produtos no raio do
+    filtro por distância) as contagens ficam restritas a eles
+    """
+    linhas = cubo(pesquisa) if ids is None else cubo_produtos(ids)
+    total, contagens = contar(linhas, filtros)
+    return {
+        'total': total,
+        'total_categorias': sum(contagens['categoria'].values()),
+        'limpar_categorias': _url(parametros, 'categoria'),
+        'categorias': [
+            {'valor': valor, 'rotulo': rotulo, 'total': contagens['categoria'][valor],
+             'ativo': valor in filtros['categoria'], 'url': _url(parametros, 'categoria', valor)}
+            for valor, rotulo in categorias()
+        ],
+        'faixas': [
+            {'valor': valor, 'rotulo': rotulo, 'total': contagens['faixa'][valor],
+             'ativo': valor in filtros['faixa'], 'url': _url(parametros, 'faixa', valor)}
+            for valor, rotulo, _, _ in FAIXAS_PRECO
+        ],
+        'estados': [
+            {'valor': uf, 'rotulo': uf, 'total': contagens['estado'][uf],
+             'ativo': uf in filtros['estado'], 'url': _url(parametros, 'estado', uf)}
+            for uf in UFS if contagens['estado'][uf] or uf in filtros['estado']
+        ],
+        'certificado': {
+            'total': contagens['certificado'][True], 'ativo': filtros['certificado'],
+            'url': _url(parametros, 'certificado', '1'),
+        },
+        'estoque': {
+            'total': contagens['estoque'][True], 'ativo': filtros['estoque'],
+            'url': _url(parametros, 'estoque', '1'),
+        },
+    }
@@ -0,0 +1,191 @@
+"""
+Geolocalização offline dos perfis e catálogo por distância
+
+dados/municipios.csv traz as coordenadas das localidades brasileiras com mais
+de 500 habitantes (GeoNames, CC BY 4.0), então Perfil.cidade/estado viram
+latitude/longitude sem nenhuma chamada de rede (geocodificar).
+
+Para "produtos a até N km", os perfis geolocalizados ficam em memória num
+índice em grade (células de TAMANHO_CELULA graus): a consulta só mede a
+distância dos perfis das células que cobrem o raio. O índice é do processo e é
+reconstruído quando a versão do namespace 'geo' muda (versoes_cache), ou seja,
+quando algum perfil muda de lugar. A lista ordenada de produtos de uma busca
+por distância fica no cache sob as versões de 'geo' e do catálogo: as páginas
+seguintes (e outros visitantes no mesmo ponto) só leem a página do banco.
+"""
+import csv
+import hashlib
+import math
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db.models.functions import Coalesce
+
+from .busca import normalizar
+from .versoes_cache import chave, invalidar, versao
+
+ARQUIVO_MUNICIPIOS = Path(__file__).resolve().parent / 'dados' / 'municipios.csv'
+NAMESPACE = 'geo'
+TAMANHO_CELULA = 0.5  # graus (~55 km de latitude)
+RAIO_TERRA_KM = 6371.0
+KM_POR_GRAU = 111.2
+RAIO_MAXIMO_KM = 1000
+RAIOS = (10, 25, 50, 100, 250, 500)
+LOTE_IN = 500
+TEMPO_CACHE = 300
+CASAS_ORIGEM = 3  # origem arredondada (~100 m) para as buscas do mesmo ponto dividirem o cache
+
+UFS = (
+    'AC', 'AL', 'AM', 'AP', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MG', 'MS', 'MT', 'PA',
+    'PB', 'PE', 'PI', 'PR', 'RJ', 'RN', 'RO', 'RR', 'RS', 'SC', 'SE', 'SP', 'TO',
+)
+
+_indice = {'versao': None, 'grade': None}
+_trava = threading.Lock()
+
+
+def _chave_nome(nome):
+    """Chave de comparação de nomes: sem acento, minúsculas, sem hífen/apóstrofo"""
+    return ' '.join(normalizar(nome).replace('-', ' ').replace("'", ' ').split())
+
+
+@lru_cache(maxsize=1)
+def _municipios():
+    """{(uf, nome): (lat, lon)} e {nome: [(lat, lon), ...]} (para cidade sem UF)"""
+    por_uf, por_nome = {}, {}
+    with open(ARQUIVO_MUNICIPIOS, encoding='utf-8', newline='') as arquivo:
+        for linha in csv.DictReader(arquivo):
+            coordenadas = (float(linha['latitude']), float(linha['longitude']))
+            nome = _chave_nome(linha['nome'])
+            por_uf[(linha['uf'], nome)] = coordenadas
+            por_nome.setdefault(nome, []).append(coordenadas)
+    return por_uf, por_nome
+
+
+def geocodificar(cidade, estado=None):
+    """(latitude, longitude) da cidade pela tabela local; None se não achar (ou se for ambígua sem UF)"""
+    nome = _chave_nome(cidade)
+    if not nome:
+        return None
+    por_uf, por_nome = _municipios()
+    uf = (estado or '').strip().upper()
+    if uf:
+        return por_uf.get((uf, nome))
+    candidatos = por_nome.get(nome, [])
+    return candidatos[0] if len(candidatos) == 1 else None
+
+
+def ler_local(texto, estado=None):
+    """Coordenadas de um texto digitado como "Campinas/SP", "Campinas - SP" ou "Campinas" (+ estado)"""
+    texto = (texto or '').strip()
+    for separador in ('/', ',', ' - '):
+        cidade, _, uf = texto.rpartition(separador)
+        if cidade and uf.strip().upper() in UFS:
+            return geocodificar(cidade, uf)
+    return geocodificar(texto, estado)
+
+
+def localizar_perfil(perfil):
+    """Preenche latitude/longitude do perfil pela cidade/estado; retorna True se mudou"""
+    coordenadas = geocodificar(perfil.cidade, perfil.estado) or (None, None)
+    if (perfil.latitude, perfil.longitude) == coordenadas:
+        return False
+    perfil.latitude, perfil.longitude = coordenadas
+    return True
+
+
+def distancia_km(lat1, lon1, lat2, lon2):
+    """Distância pela fórmula de haversine"""
+    fi1, fi2 = math.radians(lat1), math.radians(lat2)
+    dfi = fi2 - fi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dfi / 2) ** 2 + math.cos(fi1) * math.cos(fi2) * math.sin(dlambda / 2) ** 2
+    return 2 * RAIO_TERRA_KM * math.asin(math.sqrt(a))
+
+
+def _celula(lat, lon):
+    return math.floor(lat / TAMANHO_CELULA), math.floor(lon / TAMANHO_CELULA)
+
+
+class IndiceGrade:
+    """Pontos (id, lat, lon) agrupados por célula da grade"""
+
+    def __init__(self, pontos):
+        self.celulas = {}
+        self.total = 0
+        for ponto in pontos:
+            self.celulas.setdefault(_celula(ponto[1], ponto[2]), []).append(ponto)
+            self.total += 1
+
+    def proximos(self, lat, lon, raio_km):
+        """[(id, distância)] dos pontos a até raio_km de (lat, lon), do mais perto ao mais longe"""
+        raio_km = min(raio_km, RAIO_MAXIMO_KM)
+        delta_lat = raio_km / KM_POR_GRAU
+        delta_lon = raio_km / max(KM_POR_GRAU * math.cos(math.radians(lat)), 1.0)
+        linha_min, coluna_min = _celula(lat - delta_lat, lon - delta_lon)
+        linha_max, coluna_max = _celula(lat + delta_lat, lon + delta_lon)
+
+        encontrados = []
+        for linha in range(linha_min, linha_max + 1):
+            for coluna in range(coluna_min, coluna_max + 1):
+                for id_ponto, lat_ponto, lon_ponto in self.celulas.get((linha, coluna), ()):
+                    distancia = distancia_km(lat, lon, lat_ponto, lon_ponto)
+                    if distancia <= raio_km:
+                        encontrados.append((id_ponto, distancia))
+        encontrados.sort(key=lambda item: (item[1], item[0]))
+        return encontrados
+
+
+def indice():
+    """Índice dos perfis geolocalizados deste processo, reconstruído se estiver desatualizado"""
+    from .models import Perfil
+
+    atual = versao(NAMESPACE)
+    if _indice['versao'] != atual:
+        with _trava:
+            if _indice['versao'] != atual:
+                pontos = Perfil.objects.filter(latitude__isnull=False, longitude__isnull=False)
+                _indice['grade'] = IndiceGrade(pontos.values_list('pk', 'latitude', 'longitude').iterator())
+                _indice['versao'] = atual
+    return _indice['grade']
+
+
+def invalidar_indice():
+    invalidar(NAMESPACE)
+
+
+def produtos_proximos(produtos, lat, lon, raio_km):
+    """
+    Produtos do queryset cujo perfil está a até raio_km, do mais perto ao mais longe:
+    lista de (distância, -id_produto, id_produto), pronta para paginacao.paginar_lista.
+    Vem do cache enquanto nenhum perfil mudar de lugar e o catálogo não mudar.
+    """
+    from .facetas import NAMESPACE as NAMESPACE_CATALOGO
+
+    lat, lon = round(lat, CASAS_ORIGEM), round(lon, CASAS_ORIGEM)
+    try:
+        consulta = str(produtos.order_by().query)
+    except EmptyResultSet:
+        return []
+    assinatura = hashlib.md5(f'{consulta}|{lat}|{lon}|{raio_km}'.encode()).hexdigest()
+    chave_lista = chave(NAMESPACE, 'proximos', versao(NAMESPACE_CATALOGO), assinatura)
+    return cache.get_or_set(chave_lista, lambda: _ordenar_proximos(produtos, lat, lon, raio_km), TEMPO_CACHE)
+
+
+def _ordenar_proximos(produtos, lat, lon, raio_km):
+    distancias = dict(indice().proximos(lat, lon, raio_km))
+    if not distancias:
+        return []
+    # Produtos antigos só têm o perfil pelo produtor
+    produtos = produtos.annotate(perfil_dono=Coalesce('perfil_id', 'produtor__perfil_id'))
+    ids = list(distancias)
+    chaves = []
+    for inicio in range(0, len(ids), LOTE_IN):
+        lote = produtos.filter(perfil_dono__in=ids[inicio:inicio + LOTE_IN])
+        for id_produto, perfil_id in lote.values_list('id_produto', 'perfil_dono'):
+            chaves.append((round(distancias[perfil_id], 3), -id_produto, id_produto))
+    chaves.sort()
+    return chaves
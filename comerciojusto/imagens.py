@@ -0,0 +1,152 @@
+"""
+Variantes redimensionadas de Produto.imagem e Perfil.logo
+
+Cada upload gera, fora da requisição (tarefa 'imagens.gerar'), larguras fixas em
+JPEG, WebP e AVIF (quando o Pillow tem suporte) com nomes determinísticos:
+
+    produtos/foto.jpg -> derivadas/produtos/foto-320.webp
+
+O campo <campo>_variantes guarda o nome do original processado e as larguras e
+formatos gerados; enquanto ele não corresponde ao arquivo atual, a tag
+{% imagem_responsiva %} (templatetags/midia.py) serve o original.
+"""
+import io
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from .armazenamento import armazenamento_midia
+from .tarefas import tarefa
+from .versoes_cache import invalidar, namespace_perfil, namespace_produto, namespace_usuario
+
+PASTA_DERIVADAS = 'derivadas'
+
+# Larguras geradas por campo (cards do catálogo têm ~350px; detalhe do produto ~600px)
+LARGURAS = {
+    'imagem': (320, 640, 1024),
+    'logo': (96, 192, 384),
+}
+
+# extensão, formato do Pillow, tipo MIME, opções de gravação (do mais ao menos compacto)
+FORMATOS = (
+    ('avif', 'AVIF', 'image/avif', {'quality': 55, 'speed': 6}),
+    ('webp', 'WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    ('jpg', 'JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+# Campo de imagem -> campo com as variantes, por modelo
+CAMPOS = {
+    'Produto': ('imagem', 'imagem_variantes'),
+    'Perfil': ('logo', 'logo_variantes'),
+}
+
+
+def formatos_disponiveis():
+    """Formatos que este Pillow consegue gravar (JPEG sempre)"""
+    return [f for f in FORMATOS if f[0] == 'jpg' or features.check(f[0])]
+
+
+def nome_variante(nome_original, largura, extensao):
+    base, _ = posixpath.splitext(nome_original)
+    return f'{PASTA_DERIVADAS}/{base}-{largura}.{extensao}'
+
+
+def _abrir(nome, largura_maxima):
+    # Original no storage dos campos de mídia; as variantes vão para o default_storage
+    with armazenamento_midia().open(nome, 'rb') as arquivo:
+        imagem = Image.open(arquivo)
+        # JPEG decodifica direto em escala reduzida: fotos de celular abrem bem mais rápido
+        imagem.draft('RGB', (largura_maxima, largura_maxima))
+        imagem = ImageOps.exif_transpose(imagem)
+        imagem.load()
+    tem_alfa = imagem.mode in ('RGBA', 'LA') or (imagem.mode == 'P' and 'transparency' in imagem.info)
+    return imagem.convert('RGBA' if tem_alfa else 'RGB'), tem_alfa
+
+
+def _gravar(imagem, nome, formato, opcoes):
+    saida = io.BytesIO()
+    imagem.save(saida, formato, **opcoes)
+    if default_storage.exists(nome):
+        default_storage.delete(nome)
+    default_storage.save(nome, ContentFile(saida.getvalue()))
+
+
+def gerar_variantes(nome, campo):
+    """
+    Gera as variantes do arquivo `nome` (do storage) para o campo e retorna o dicionário
+    guardado em <campo>_variantes. Larguras maiores que o original não são geradas.
+    """
+    larguras_campo = LARGURAS[campo]
+    imagem, tem_alfa = _abrir(nome, max(larguras_campo))
+    larguras = [l for l in larguras_campo if l <= imagem.width] or [imagem.width]
+    formatos = formatos_disponiveis()
+
+    for largura in larguras:
+        altura = max(1, round(imagem.height * largura / imagem.width))
+        reduzida = imagem.resize((largura, altura), Image.LANCZOS, reducing_gap=3.0)
+        for extensao, formato, _, opcoes in formatos:
+            saida = reduzida
+            if formato == 'JPEG' and tem_alfa:
+                # JPEG não tem transparência: fundo branco
+                saida = Image.new('RGB', reduzida.size, 'white')
+                saida.paste(reduzida, mask=reduzida.getchannel('A'))
+            _gravar(saida, nome_variante(nome, largura, extensao), formato, opcoes)
+
+    return {
+        'nome': nome,
+        'larguras': larguras,
+        'formatos': [f[0] for f in formatos],
+    }
+
+
+def variantes_atuais(arquivo, variantes):
+    """As variantes, se correspondem ao arquivo atual do campo (senão None)"""
+    if arquivo and variantes and variantes.get('nome') == arquivo.name:
+        return variantes
+    return None
+
+
+def precisa_gerar(arquivo, variantes):
+    return bool(arquivo) and variantes_atuais(arquivo, variantes) is None
+
+
+def salvar_variantes(modelo, pk, nome, variantes):
+    """Grava as variantes se o arquivo do objeto ainda for `nome` (sem disparar signals)"""
+    from django.apps import apps
+
+    Modelo = apps.get_model('comerciojusto', modelo)
+    campo, campo_variantes = CAMPOS[modelo]
+    atualizados = Modelo.objects.filter(pk=pk, **{campo: nome}).update(
+        **{campo_variantes: variantes}, atualizado_em=timezone.now()
+    )
+    if atualizados and modelo == 'Perfil':
+        # O perfil fica em cache (middleware.perfil_usuario) e nas páginas públicas
+        usuario_id = Modelo.objects.filter(pk=pk).values_list('user_id', flat=True).first()
+        invalidar(namespace_usuario(usuario_id))
+        invalidar(namespace_perfil(pk))
+    elif atualizados:
+        # Miniaturas não mudam nenhuma faceta: o cubo do catálogo fica, e a página do
+        # catálogo em cache (que ainda aponta para a imagem original) se renova pelo TEMPO_CACHE
+        invalidar(namespace_produto(pk))
+        perfil_id = Modelo.objects.filter(pk=pk).values_list('perfil_id', flat=True).first()
+        if perfil_id:
+            invalidar(namespace_perfil(perfil_id))
+    return bool(atualizados)
+
+
+@tarefa('imagens.gerar')
+def gerar_variantes_objeto(modelo, pk):
+    """Tarefa enfileirada pelos signals de Produto/Perfil após um upload"""
+    from django.apps import apps
+
+    campo, campo_variantes = CAMPOS[modelo]
+    obj = apps.get_model('comerciojusto', modelo).objects.filter(pk=pk).only(campo, campo_variantes).first()
+    if obj is None:
+        return
+    arquivo = getattr(obj, campo)
+    if not precisa_gerar(arquivo, getattr(obj, campo_variantes)):
+        return
+    salvar_variantes(modelo, pk, arquivo.name, gerar_variantes(arquivo.name, campo))
@@ -0,0 +1,210 @@
+import random
+import statistics
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from comerciojusto.models import Avaliacao, Carrinho, Certificacao, Conversa, Mensagem, Perfil, Produto
+from comerciojusto.views import CERTIFICACOES_POR_PAGINA, ORDENACAO_CATALOGO
+
+# Índices do plano (migração 0025) comparados pelo benchmark
+INDICES = {
+    Produto: ('produto_catalogo_idx', 'produto_categoria_idx', 'produto_perfil_ativo_idx'),
+    Avaliacao: ('avaliacao_perfil_data_idx',),
+    Carrinho: ('carrinho_sessao_idx',),
+    Mensagem: ('mensagem_nao_lidas_idx',),
+}
+LOTE = 2000
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark dos índices das consultas quentes: popula o banco com volumes realistas, compara '
+        'EXPLAIN e tempo das consultas de cada view com e sem os índices e desfaz tudo no fim'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--produtos', type=int, default=50000)
+        parser.add_argument('--perfis', type=int, default=2000)
+        parser.add_argument('--avaliacoes', type=int, default=100000)
+        parser.add_argument('--mensagens', type=int, default=100000)
+        parser.add_argument('--carrinhos', type=int, default=30000)
+        parser.add_argument('--certificacoes', type=int, default=20000)
+        parser.add_argument('--repeticoes', type=int, default=30, help='Execuções de cada consulta por medição')
+        parser.add_argument('--planos', action='store_true', help='Mostra o EXPLAIN completo de cada consulta')
+
+    def handle(self, *args, **options):
+        self.repeticoes = options['repeticoes']
+        self.mostrar_planos = options['planos']
+        # Tudo numa transação desfeita no fim: o banco volta como estava (inclusive os índices)
+        with transaction.atomic():
+            inicio = time.perf_counter()
+            amostra = self._popular(options)
+            self._analisar()
+            self.stdout.write(f'Dados gerados em {time.perf_counter() - inicio:.1f}s\n')
+
+            consultas = self._consultas(amostra)
+            depois = self._medir(consultas)
+            self._remover_indices()
+            self._analisar()
+            antes = self._medir(consultas)
+            transaction.set_rollback(True)
+
+        self._relatorio(consultas, antes, depois)
+
+    def _popular(self, options):
+        rnd = random.Random(42)
+        sufixo = uuid.uuid4().hex[:8]
+        categorias = [valor for valor, _ in Produto.CATEGORIA_CHOICES if valor != 'todas']
+
+        total_usuarios = max(options['perfis'] * 2, 2)
+        User.objects.bulk_create(
+            [User(username=f'benchmark_{sufixo}_{i}') for i in range(total_usuarios)], batch_size=LOTE
+        )
+        usuarios = list(User.objects.filter(username__startswith=f'benchmark_{sufixo}_').values_list('pk', flat=True))
+
+        Perfil.objects.bulk_create(
+            [Perfil(user_id=usuarios[i], tipo=rnd.choice(('produtor', 'empresa'))) for i in range(options['perfis'])],
+            batch_size=LOTE,
+        )
+        perfis = list(Perfil.objects.filter(user_id__in=usuarios).values_list('pk', flat=True))
+
+        # Vendas com cauda longa e poucos destaques, como no catálogo real
+        Produto.objects.bulk_create(
+            [
+                Produto(
+                    nome=f'Benchmark {sufixo} {i}', categoria=rnd.choice(categorias), preco=rnd.randint(1, 200),
+                    perfil_id=rnd.choice(perfis), vendas=int(rnd.paretovariate(1.2)) - 1,
+                    destaque=rnd.random() < 0.02, ativo=rnd.random() < 0.9,
+                )
+                for i in range(options['produtos'])
+            ],
+            batch_size=LOTE,
+        )
+        produtos = list(Produto.objects.filter(nome__startswith=f'Benchmark {sufixo} ').values_list('pk', flat=True))
+
+        Avaliacao.objects.bulk_create(
+            [
+                Avaliacao(
+                    perfil_id=rnd.choice(perfis), usuario_id=rnd.choice(usuarios), estrelas=rnd.randint(1, 5),
+                )
+                for _ in range(options['avaliacoes'])
+            ],
+            batch_size=LOTE,
+        )
+
+        status = [valor for valor, _ in Certificacao.STATUS_CHOICES]
+        Certificacao.objects.bulk_create(
+            [
+                Certificacao(
+                    perfil_id=rnd.choice(perfis), produto_id=rnd.choice(produtos),
+                    # A fila de análise é uma fração pequena do histórico
+                    status='enviado_analise' if rnd.random() < 0.05 else rnd.choice(status),
+                )
+                for _ in range(options['certificacoes'])
+            ],
+            batch_size=LOTE,
+        )
+
+        # Carrinhos anônimos (sessao_id) e de usuários (sessao_id vazio)
+        Carrinho.objects.bulk_create(
+            [Carrinho(sessao_id=uuid.uuid4().hex) for _ in range(options['carrinhos'])]
+            + [Carrinho(usuario_id=usuario) for usuario in usuarios[:len(usuarios) // 2]],
+            batch_size=LOTE,
+        )
+        sessao = Carrinho.objects.filter(sessao_id__isnull=False).order_by('-pk').values_list('sessao_id', flat=True)[0]
+
+        pares = {tuple(sorted(rnd.sample(usuarios, 2))) for _ in range(max(options['mensagens'] // 20, 1))}
+        Conversa.objects.bulk_create([Conversa(usuario_a_id=a, usuario_b_id=b) for a, b in pares], batch_size=LOTE)
+        conversas = list(Conversa.objects.filter(usuario_a_id__in=usuarios).values_list('pk', 'usuario_a_id', 'usuario_b_id'))
+        mensagens = []
+        for _ in range(options['mensagens']):
+            conversa, a, b = rnd.choice(conversas)
+            remetente, destinatario = (a, b) if rnd.random() < 0.5 else (b, a)
+            mensagens.append(Mensagem(
+                conversa_id=conversa, remetente_id=remetente, destinatario_id=destinatario,
+                assunto='Benchmark', corpo='...', lida=rnd.random() < 0.9,
+            ))
+        Mensagem.objects.bulk_create(mensagens, batch_size=LOTE)
+
+        self.stdout.write(
+            f'Populado: {len(produtos)} produtos, {len(perfis)} perfis, {options["avaliacoes"]} avaliações, '
+            f'{options["certificacoes"]} certificações, {options["carrinhos"]} carrinhos anônimos, '
+            f'{len(mensagens)} mensagens em {len(conversas)} conversas'
+        )
+        conversa, a, b = max(conversas, key=lambda linha: linha[0])
+        return {
+            'perfil': rnd.choice(perfis),
+            'categoria': rnd.choice(categorias),
+            'sessao': sessao,
+            'conversa': conversa,
+            'destinatario': b,
+        }
+
+    def _consultas(self, amostra):
+        """(view, descrição, queryset) com as consultas que as views fazem a cada requisição"""
+        tamanho = 24
+        produtos_perfil = Produto.objects.filter(perfil_id=amostra['perfil'], ativo=True)
+        return [
+            ('index', 'primeira página do catálogo',
+             Produto.objects.order_by(*ORDENACAO_CATALOGO)[:tamanho + 1]),
+            ('index', f'catálogo: categoria={amostra["categoria"]}',
+             Produto.objects.filter(categoria=amostra['categoria']).order_by(*ORDENACAO_CATALOGO)[:tamanho + 1]),
+            ('perfil_publico', 'produtos ativos do perfil', produtos_perfil),
+            ('perfil_publico', 'contagem dos produtos do perfil', produtos_perfil.order_by().values('pk')),
+            ('perfil_publico', 'últimas avaliações',
+             Avaliacao.objects.filter(perfil_id=amostra['perfil']).order_by('-data_avaliacao')[:10]),
+            ('gerenciar_certificacoes', 'fila de análise',
+             Certificacao.objects.filter(status='enviado_analise').order_by('id_certificacao')[:CERTIFICACOES_POR_PAGINA]),
+            ('middleware', 'carrinho da sessão', Carrinho.objects.filter(sessao_id=amostra['sessao'])[:1]),
+            ('conversa', 'mensagens não lidas',
+             Mensagem.objects.filter(
+                 conversa_id=amostra['conversa'], destinatario_id=amostra['destinatario'], lida=False,
+             ).values('pk')),
+        ]
+
+    def _analisar(self):
+        # Estatísticas atualizadas para o planejador (desfeitas junto com a transação)
+        if connection.vendor in ('sqlite', 'postgresql'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def _remover_indices(self):
+        # DROP INDEX direto: o schema editor do SQLite não roda dentro de uma transação
+        with connection.cursor() as cursor:
+            for nomes in INDICES.values():
+                for nome in nomes:
+                    cursor.execute(f'DROP INDEX {connection.ops.quote_name(nome)}')
+
+    def _medir(self, consultas):
+        resultados = []
+        for _, _, queryset in consultas:
+            plano = queryset.explain()
+            tempos = []
+            for _ in range(self.repeticoes):
+                inicio = time.perf_counter()
+                list(queryset.all())
+                tempos.append(time.perf_counter() - inicio)
+            resultados.append((plano, statistics.median(tempos) * 1000))
+        return resultados
+
+    def _relatorio(self, consultas, antes, depois):
+        melhores = 0
+        for (view, descricao, _), (plano_antes, ms_antes), (plano_depois, ms_depois) in zip(consultas, antes, depois):
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{view}: {descricao}'))
+            if self.mostrar_planos or plano_antes != plano_depois:
+                self.stdout.write('  sem índices:')
+                self.stdout.write(''.join(f'    {linha}\n' for linha in plano_antes.splitlines()), ending='')
+                self.stdout.write('  com índices:')
+                self.stdout.write(''.join(f'    {linha}\n' for linha in plano_depois.splitlines()), ending='')
+            else:
+                self.stdout.write('  plano igual com e sem os índices')
+            ganho = ms_antes / ms_depois if ms_depois else float('inf')
+            melhores += ganho > 1.1
+            self.stdout.write(f'  mediana: {ms_antes:.2f} ms -> {ms_depois:.2f} ms ({ganho:.1f}x)')
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {melhores} de {len(consultas)} consultas mais rápidas com os índices (dados do benchmark desfeitos)'
+        ))
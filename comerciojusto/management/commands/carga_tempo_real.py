@@ -0,0 +1,207 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+import tracemalloc
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from comerciojusto.tempo_real import fluxo_eventos, obter_broker
+
+
+class Command(BaseCommand):
+    help = (
+        'Teste de carga do canal em tempo real: conexões SSE por worker e latência de entrega (fan-out). '
+        'Por padrão consome fluxo_eventos direto sobre o broker, sem HTTP; com --asgi cada conexão é uma '
+        'requisição a /eventos/ pela aplicação ASGI do projeto (middlewares, sessão e view), ainda num '
+        'processo só: a rede e o servidor ASGI (uvicorn, daphne) ficam de fora'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conexoes', type=int, default=2000, help='Conexões abertas no worker (um loop asyncio)')
+        parser.add_argument('--usuarios', type=int, default=500, help='Usuários distintos entre as conexões')
+        parser.add_argument('--eventos', type=int, default=500, help='Eventos publicados')
+        parser.add_argument('--intervalo', type=float, default=2.0, help='Intervalo entre publicações (ms)')
+        parser.add_argument(
+            '--asgi', action='store_true',
+            help='Abre as conexões pelo endpoint /eventos/ da aplicação ASGI, com usuários temporários (excluídos no fim)',
+        )
+
+    def handle(self, *args, **options):
+        conexoes = options['conexoes']
+        usuarios = max(1, min(options['usuarios'], conexoes))
+        self.sessoes = None
+        if options['asgi']:
+            # A view publica no broker do processo: o teste precisa usar o mesmo
+            broker = obter_broker()
+            self.aplicacao = get_asgi_application()
+            self.sessoes = self._criar_usuarios(usuarios)
+        else:
+            broker = import_string(settings.TEMPO_REAL_BROKER)()
+
+        self.stdout.write(
+            f'Broker {type(broker).__name__}{" via ASGI" if self.sessoes else ""}: {conexoes} conexões, '
+            f'{usuarios} usuários, {options["eventos"]} eventos...'
+        )
+        try:
+            resultado = asyncio.run(
+                self._executar(broker, conexoes, usuarios, options['eventos'], options['intervalo'] / 1000)
+            )
+        finally:
+            if self.sessoes:
+                self._excluir_usuarios()
+
+        latencias = sorted(resultado['latencias'])
+        if not latencias:
+            self.stdout.write(self.style.ERROR('Nenhum evento entregue.'))
+            return
+
+        def percentil(p):
+            return latencias[min(len(latencias) - 1, int(len(latencias) * p))] * 1000
+
+        self.stdout.write(f'  Conexões ativas: {resultado["conectadas"]} (abertas em {resultado["tempo_conexao"]:.2f}s)')
+        self.stdout.write(f'  Memória por conexão: {resultado["memoria"] / conexoes / 1024:.1f} KiB')
+        self.stdout.write(f'  Entregas: {len(latencias)} de {resultado["esperadas"]} esperadas')
+        self.stdout.write(
+            f'  Latência (ms): média {statistics.mean(latencias) * 1000:.2f} | p50 {percentil(0.5):.2f} | '
+            f'p95 {percentil(0.95):.2f} | p99 {percentil(0.99):.2f} | máx {latencias[-1] * 1000:.2f}'
+        )
+        self.stdout.write(self.style.SUCCESS(f'✓ {len(latencias) / resultado["duracao"]:.0f} entregas/s'))
+
+    async def _executar(self, broker, conexoes, usuarios, eventos, intervalo):
+        latencias = []
+        recebidas = asyncio.Event()
+        esperadas = 0
+        por_usuario = [0] * usuarios
+
+        desconectar = asyncio.Event()
+
+        def receber(bloco):
+            if not bloco.startswith('event: carga'):
+                return
+            dados = json.loads(bloco.split('data: ', 1)[1])
+            latencias.append(time.perf_counter() - dados['t'])
+            if len(latencias) >= esperadas:
+                recebidas.set()
+
+        async def consumir(usuario_id):
+            if self.sessoes:
+                await self._requisicao_asgi(self.sessoes[usuario_id][1], receber, desconectar)
+                return
+            # Consome o mesmo gerador usado como corpo da resposta SSE
+            async for bloco in fluxo_eventos(usuario_id, broker):
+                receber(bloco)
+
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        tarefas = []
+        for i in range(conexoes):
+            usuario_id = i % usuarios
+            por_usuario[usuario_id] += 1
+            tarefas.append(asyncio.create_task(consumir(usuario_id)))
+        while broker.total_conexoes() < conexoes:
+            for tarefa in tarefas:
+                if tarefa.done():
+                    tarefa.result()  # propaga o erro da conexão (ex.: resposta diferente de 200)
+                    raise CommandError('Uma conexão terminou antes do fim do teste')
+            await asyncio.sleep(0.01)
+        tempo_conexao = time.perf_counter() - inicio
+        memoria = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        esperadas = sum(por_usuario[i % usuarios] for i in range(eventos))
+        destinos = [self.sessoes[i][0] for i in range(usuarios)] if self.sessoes else list(range(usuarios))
+
+        def publicar():
+            # Simula as views síncronas publicando a partir de outra thread
+            for i in range(eventos):
+                broker.publicar(destinos[i % usuarios], {'tipo': 'carga', 't': time.perf_counter()})
+                if intervalo:
+                    time.sleep(intervalo)
+
+        inicio = time.perf_counter()
+        publicador = threading.Thread(target=publicar)
+        publicador.start()
+        try:
+            await asyncio.wait_for(recebidas.wait(), timeout=60)
+        except asyncio.TimeoutError:
+            pass
+        duracao = time.perf_counter() - inicio
+        await asyncio.to_thread(publicador.join)
+
+        conectadas = broker.total_conexoes()
+        # Pelo ASGI o cliente desconecta e o Django encerra a resposta; direto, cancela
+        desconectar.set()
+        if not self.sessoes:
+            for tarefa in tarefas:
+                tarefa.cancel()
+        resultados = await asyncio.gather(*tarefas, return_exceptions=True)
+        erros = [r for r in resultados if isinstance(r, Exception) and not isinstance(r, asyncio.CancelledError)]
+        if erros:
+            raise erros[0]
+
+        return {
+            'latencias': latencias,
+            'esperadas': esperadas,
+            'conectadas': conectadas,
+            'tempo_conexao': tempo_conexao,
+            'memoria': memoria,
+            'duracao': duracao,
+        }
+
+    def _criar_usuarios(self, quantidade):
+        """[(id do usuário, cookie da sessão logada)] de usuários temporários"""
+        sufixo = uuid.uuid4().hex[:8]
+        User.objects.bulk_create([User(username=f'carga_{sufixo}_{i}') for i in range(quantidade)])
+        sessoes = []
+        for usuario in User.objects.filter(username__startswith=f'carga_{sufixo}_').order_by('pk'):
+            sessao = SessionStore()
+            sessao[SESSION_KEY] = str(usuario.pk)
+            sessao[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+            sessao[HASH_SESSION_KEY] = usuario.get_session_auth_hash()
+            sessao.create()
+            sessoes.append((usuario.pk, f'{settings.SESSION_COOKIE_NAME}={sessao.session_key}'))
+        self.prefixo_usuarios = f'carga_{sufixo}_'
+        return sessoes
+
+    def _excluir_usuarios(self):
+        Session.objects.filter(session_key__in=[cookie.split('=', 1)[1] for _, cookie in self.sessoes]).delete()
+        User.objects.filter(username__startswith=self.prefixo_usuarios).delete()
+
+    async def _requisicao_asgi(self, cookie, receber, desconectar):
+        """GET /eventos/ pela aplicação ASGI, repassando cada bloco do corpo até `desconectar`"""
+        hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*']
+        caminho = reverse('eventos')
+        escopo = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': caminho, 'raw_path': caminho.encode(), 'query_string': b'',
+            'root_path': '', 'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+            'headers': [(b'host', (hosts[0] if hosts else 'localhost').encode()), (b'cookie', cookie.encode())],
+        }
+        corpo_enviado = False
+
+        async def receive():
+            nonlocal corpo_enviado
+            if not corpo_enviado:
+                corpo_enviado = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await desconectar.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(mensagem):
+            if mensagem['type'] == 'http.response.start' and mensagem['status'] != 200:
+                raise CommandError(f'{caminho} respondeu {mensagem["status"]} (servido pelo ASGI? sessão válida?)')
+            if mensagem['type'] == 'http.response.body' and mensagem.get('body'):
+                receber(mensagem['body'].decode())
+
+        await self.aplicacao(escopo, receive, send)
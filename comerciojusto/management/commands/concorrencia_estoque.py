@@ -0,0 +1,92 @@
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+
+from comerciojusto.estoque import EstoqueInsuficiente, liberar_reservas, reservar
+from comerciojusto.models import Produto, ReservaEstoque
+
+
+class Command(BaseCommand):
+    help = 'Benchmark de contenção: muitos compradores simultâneos reservando o mesmo produto (verifica que não há venda além do estoque)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--compradores', type=int, default=200, help='Tentativas de compra')
+        parser.add_argument('--estoque', type=int, default=50, help='Estoque inicial do produto')
+        parser.add_argument('--quantidade', type=int, default=1, help='Unidades por compra')
+        parser.add_argument('--threads', type=int, default=16, help='Compradores em paralelo')
+        parser.add_argument('--liberar', type=float, default=0.0, help='Fração das reservas liberadas (checkout abandonado)')
+
+    def handle(self, *args, **options):
+        sufixo = uuid.uuid4().hex[:8]
+        comprador = User.objects.create_user(f'benchmark_estoque_{sufixo}')
+        produto = Produto.objects.create(nome=f'Benchmark estoque {sufixo}', preco=1, estoque=options['estoque'])
+        quantidade = options['quantidade']
+        resultados = {'reservadas': 0, 'sem_estoque': 0, 'liberadas': 0, 'repeticoes': 0}
+        latencias = []
+        trava = threading.Lock()
+
+        def comprar(i):
+            inicio = time.perf_counter()
+            try:
+                for _ in range(20):
+                    try:
+                        referencia = reservar(comprador, [(produto.pk, quantidade)])
+                        break
+                    except OperationalError:
+                        # SQLite: banco travado por outra escrita, tenta de novo
+                        with trava:
+                            resultados['repeticoes'] += 1
+                        time.sleep(0.005)
+                else:
+                    raise CommandError('Banco travado demais para concluir o benchmark')
+                liberar = options['liberar'] and i % round(1 / options['liberar']) == 0
+                if liberar:
+                    liberar_reservas(referencia)
+                with trava:
+                    resultados['liberadas' if liberar else 'reservadas'] += 1
+            except EstoqueInsuficiente:
+                with trava:
+                    resultados['sem_estoque'] += 1
+            finally:
+                with trava:
+                    latencias.append(time.perf_counter() - inicio)
+                connections.close_all()
+
+        self.stdout.write(
+            f'{options["compradores"]} compradores ({options["threads"]} em paralelo) disputando '
+            f'{options["estoque"]} unidades, {quantidade} por compra...'
+        )
+        inicio = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+                list(executor.map(comprar, range(options['compradores'])))
+            duracao = time.perf_counter() - inicio
+
+            produto.refresh_from_db()
+            ativas = ReservaEstoque.objects.filter(produto=produto, status='ativa')
+            reservado = sum(ativas.values_list('quantidade', flat=True))
+            esperado = min(options['estoque'] // quantidade, options['compradores'] - resultados['liberadas'])
+        finally:
+            ReservaEstoque.objects.filter(produto=produto).delete()
+            produto.delete()
+            comprador.delete()
+
+        latencias.sort()
+        self.stdout.write(f'  Reservas: {resultados["reservadas"]} | liberadas: {resultados["liberadas"]} | sem estoque: {resultados["sem_estoque"]}')
+        self.stdout.write(f'  Estoque final: {produto.estoque} | reservado: {reservado} | repetições por trava: {resultados["repeticoes"]}')
+        self.stdout.write(
+            f'  Latência (ms): média {statistics.mean(latencias) * 1000:.2f} | '
+            f'p95 {latencias[int(len(latencias) * 0.95)] * 1000:.2f} | {options["compradores"] / duracao:.0f} compras/s'
+        )
+
+        if produto.estoque < 0 or produto.estoque + reservado != options['estoque']:
+            raise CommandError('Venda além do estoque ou estoque perdido!')
+        if resultados['reservadas'] < esperado and produto.estoque >= quantidade:
+            raise CommandError('Compras recusadas com estoque disponível!')
+        self.stdout.write(self.style.SUCCESS('✓ Nenhuma venda além do estoque'))
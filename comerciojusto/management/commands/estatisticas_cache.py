@@ -0,0 +1,26 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Mostra acertos e falhas do cache em camadas somados de todos os processos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--zerar', action='store_true', help='Zera as contagens depois de mostrar')
+
+    def handle(self, *args, **options):
+        if not hasattr(cache, 'estatisticas'):
+            self.stdout.write(self.style.WARNING(
+                f'O cache configurado ({type(cache).__name__}) não registra estatísticas'
+            ))
+            return
+        dados = cache.estatisticas()
+        self.stdout.write(f"Acertos na camada local:        {dados['acerto_local']}")
+        self.stdout.write(f"Acertos na camada compartilhada: {dados['acerto_compartilhado']}")
+        self.stdout.write(f"Falhas:                          {dados['falha']}")
+        self.stdout.write(f"Gravações:                       {dados['gravacao']}")
+        self.stdout.write(f"Recálculos (get_or_set):         {dados['recalculo']}")
+        self.stdout.write(f"Esperas por recálculo alheio:    {dados['espera']}")
+        if options['zerar']:
+            cache.zerar_estatisticas()
+        self.stdout.write(self.style.SUCCESS(f"✓ Taxa de acerto: {dados['taxa_acerto']:.1%}"))
@@ -0,0 +1,59 @@
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from comerciojusto.models import Tarefa
+from comerciojusto.tarefas import executar_por_id, iniciar_processo_filho, reivindicar
+
+
+class Command(BaseCommand):
+    help = 'Worker da fila de tarefas em segundo plano (tabela tarefa)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Tarefas em paralelo num pool de threads')
+        parser.add_argument('--processos', type=int, default=0, help='Usa um pool de processos (tarefas pesadas de CPU, ex.: imagens)')
+        parser.add_argument('--lote', type=int, default=20, help='Tarefas reivindicadas por vez')
+        parser.add_argument('--continuo', action='store_true', help='Fica rodando e consulta a fila periodicamente')
+        parser.add_argument('--intervalo', type=float, default=1.0, help='Espera entre consultas com a fila vazia (s)')
+        parser.add_argument('--limpar-dias', type=int, default=0, help='Exclui antes as tarefas concluídas há mais de N dias')
+
+    def handle(self, *args, **options):
+        if options['limpar_dias']:
+            limite = timezone.now() - timedelta(days=options['limpar_dias'])
+            excluidas, _ = Tarefa.objects.filter(status='concluida', atualizada_em__lt=limite).delete()
+            self.stdout.write(f'{excluidas} tarefa(s) concluída(s) excluída(s)')
+
+        if options['processos']:
+            # As conexões abertas não podem ser herdadas pelos processos filhos
+            connections.close_all()
+            pool = ProcessPoolExecutor(max_workers=options['processos'], initializer=iniciar_processo_filho)
+            descricao = f'{options["processos"]} processo(s)'
+        else:
+            pool = ThreadPoolExecutor(max_workers=options['threads'], thread_name_prefix='tarefas')
+            descricao = f'{options["threads"]} thread(s)'
+        self.stdout.write(f'Executando tarefas com {descricao}...')
+
+        total = Counter()
+        try:
+            while True:
+                lote = reivindicar(options['lote'])
+                if lote:
+                    resultados = Counter(pool.map(executar_por_id, [registro.pk for registro in lote]))
+                    total.update(resultados)
+                    self.stdout.write(', '.join(f'{status}: {qtd}' for status, qtd in sorted(resultados.items())))
+                    continue
+                if not options['continuo']:
+                    break
+                time.sleep(options['intervalo'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            pool.shutdown(wait=True)
+
+        resumo = ', '.join(f'{status}: {qtd}' for status, qtd in sorted(total.items())) or 'fila vazia'
+        self.stdout.write(self.style.SUCCESS(f'✓ {sum(total.values())} tarefa(s) executada(s) ({resumo})'))
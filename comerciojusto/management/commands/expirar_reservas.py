@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from comerciojusto.estoque import expirar_reservas
+
+
+class Command(BaseCommand):
+    help = 'Devolve ao estoque as reservas de checkout vencidas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--continuo', action='store_true', help='Fica rodando e verifica periodicamente')
+        parser.add_argument('--intervalo', type=float, default=60.0, help='Espera entre verificações (s)')
+
+    def handle(self, *args, **options):
+        while True:
+            total = expirar_reservas()
+            if total or not options['continuo']:
+                self.stdout.write(self.style.SUCCESS(f'✓ {total} reserva(s) devolvida(s) ao estoque'))
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
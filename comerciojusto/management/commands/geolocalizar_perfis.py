@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from comerciojusto import geo
+from comerciojusto.models import Perfil
+
+
+class Command(BaseCommand):
+    help = 'Preenche latitude/longitude dos perfis pela cidade/estado (tabela local de municípios, sem rede)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Perfis gravados por lote')
+
+    def handle(self, *args, **options):
+        alterados = []
+        sem_local = 0
+        perfis = Perfil.objects.only('pk', 'cidade', 'estado', 'latitude', 'longitude').order_by('pk')
+        for perfil in perfis.iterator(chunk_size=options['lote']):
+            if geo.localizar_perfil(perfil):
+                alterados.append(perfil)
+            if perfil.latitude is None and perfil.cidade:
+                sem_local += 1
+            if len(alterados) >= options['lote']:
+                Perfil.objects.bulk_update(alterados, ['latitude', 'longitude'])
+                alterados = []
+        Perfil.objects.bulk_update(alterados, ['latitude', 'longitude'])
+        geo.invalidar_indice()
+
+        if sem_local:
+            self.stdout.write(self.style.WARNING(f'  {sem_local} perfil(is) com cidade não reconhecida'))
+        self.stdout.write(self.style.SUCCESS('✓ Coordenadas dos perfis atualizadas!'))
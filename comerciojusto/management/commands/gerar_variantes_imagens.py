@@ -0,0 +1,51 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from comerciojusto.imagens import CAMPOS, gerar_variantes, salvar_variantes
+from comerciojusto.models import Perfil, Produto
+from comerciojusto.tarefas import iniciar_processo_filho
+
+
+class Command(BaseCommand):
+    help = 'Gera as miniaturas (JPEG/WebP/AVIF) das imagens de produtos e logos de perfis já enviadas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processos', type=int, default=None, help='Processos em paralelo (padrão: núcleos da CPU)')
+        parser.add_argument('--forcar', action='store_true', help='Gera de novo mesmo as que já têm variantes')
+
+    def handle(self, *args, **options):
+        pendentes = []
+        for modelo in (Produto, Perfil):
+            campo, campo_variantes = CAMPOS[modelo.__name__]
+            objetos = modelo.objects.exclude(**{campo: ''}).exclude(**{f'{campo}__isnull': True})
+            for pk, nome, variantes in objetos.values_list('pk', campo, campo_variantes).iterator():
+                if options['forcar'] or (variantes or {}).get('nome') != nome:
+                    pendentes.append((modelo.__name__, pk, campo, nome))
+
+        if not pendentes:
+            self.stdout.write(self.style.SUCCESS('✓ Todas as imagens já têm variantes'))
+            return
+
+        self.stdout.write(f'Gerando variantes de {len(pendentes)} imagem(ns)...')
+        inicio = time.perf_counter()
+        geradas = erros = 0
+        # Os processos filhos não podem herdar as conexões abertas
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['processos'], initializer=iniciar_processo_filho) as pool:
+            futuros = {pool.submit(gerar_variantes, nome, campo): (modelo, pk, nome) for modelo, pk, campo, nome in pendentes}
+            for futuro in as_completed(futuros):
+                modelo, pk, nome = futuros[futuro]
+                try:
+                    salvar_variantes(modelo, pk, nome, futuro.result())
+                    geradas += 1
+                except Exception as e:
+                    erros += 1
+                    self.stdout.write(self.style.WARNING(f'  {nome}: {e}'))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {geradas} imagem(ns) processada(s) em {time.perf_counter() - inicio:.1f}s'
+            + (f', {erros} com erro' if erros else '')
+        ))
@@ -1,11 +1,46 @@
-from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
 from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+from comerciojusto.models import Perfil, Produto
+from comerciojusto.versoes_cache import invalidar
+
+# Namespaces por id (versoes_cache) -> modelo de onde vêm os ids, para "produto:*"
+NAMESPACES_POR_ID = {
+    'produto': Produto,
+    'perfil': Perfil,
+    'usuario': User,
+}
 
 
 class Command(BaseCommand):
-    help = 'Limpa todo o cache da aplicação'
+    help = 'Limpa o cache da aplicação (tudo, ou só os namespaces informados)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--namespace', action='append', default=[],
+            help='Namespace a invalidar (ex.: catalogo, geo, produto:12, perfil:*); pode repetir',
+        )
+
+    def handle(self, *args, **options):
+        if not options['namespace']:
+            self.stdout.write('Limpando cache...')
+            cache.clear()
+            self.stdout.write(self.style.SUCCESS('✓ Cache limpo com sucesso!'))
+            return
 
-    def handle(self, *args, **kwargs):
-        self.stdout.write('Limpando cache...')
-        cache.clear()
-        self.stdout.write(self.style.SUCCESS('✓ Cache limpo com sucesso!'))
+        total = 0
+        for namespace in options['namespace']:
+            # Invalidar é avançar a versão: as entradas antigas expiram sozinhas
+            if namespace.endswith(':*'):
+                prefixo = namespace[:-2]
+                if prefixo not in NAMESPACES_POR_ID:
+                    raise CommandError(f'Namespace desconhecido: {namespace} (use {", ".join(NAMESPACES_POR_ID)})')
+                ids = NAMESPACES_POR_ID[prefixo].objects.values_list('pk', flat=True)
+                for pk in ids.iterator():
+                    invalidar(f'{prefixo}:{pk}')
+                    total += 1
+            else:
+                invalidar(namespace)
+                total += 1
+        self.stdout.write(self.style.SUCCESS(f'✓ {total} namespace(s) invalidado(s)'))
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from comerciojusto.armazenamento import coletar, recontar_referencias
+
+
+class Command(BaseCommand):
+    help = 'Recalcula as referências das mídias gravadas por conteúdo e apaga os arquivos sem uso'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--carencia', type=float, default=24.0,
+            help='Horas sem referência antes de apagar (protege uploads ainda não confirmados)',
+        )
+        parser.add_argument('--simular', action='store_true', help='Só informa o que seria apagado')
+
+    def handle(self, *args, **options):
+        corrigidos = recontar_referencias()
+        self.stdout.write(f'{corrigidos} contagem(ns) de referências corrigida(s)')
+        apagados, liberados = coletar(timedelta(hours=options['carencia']), simular=options['simular'])
+        acao = 'seriam apagados' if options['simular'] else 'apagado(s)'
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {apagados} arquivo(s) {acao}, {liberados / 1024 / 1024:.1f} MB'
+        ))
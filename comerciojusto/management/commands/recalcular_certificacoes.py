@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from comerciojusto.models import Perfil, Produto
+from comerciojusto.certificacoes import atualizar_estado_certificacao
+
+
+class Command(BaseCommand):
+    help = 'Recalcula o estado de certificação desnormalizado de todos os produtos e perfis'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Registros processados por lote')
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        self.stdout.write('Recalculando estado de certificação...')
+
+        for modelo, chave in ((Produto, 'produto_ids'), (Perfil, 'perfil_ids')):
+            ids = list(modelo.objects.order_by('pk').values_list('pk', flat=True))
+            for inicio in range(0, len(ids), lote):
+                atualizar_estado_certificacao(**{chave: ids[inicio:inicio + lote]})
+            self.stdout.write(f'  {len(ids)} {modelo._meta.verbose_name_plural.lower()} atualizados')
+
+        self.stdout.write(self.style.SUCCESS('✓ Estado de certificação recalculado!'))
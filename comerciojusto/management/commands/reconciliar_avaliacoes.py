@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from comerciojusto.avaliacoes import reconciliar_avaliacoes
+
+
+class Command(BaseCommand):
+    help = 'Recalcula média, total e histograma de avaliações de todos os perfis'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write('Reconciliando avaliações...')
+        total = reconciliar_avaliacoes()
+        self.stdout.write(self.style.SUCCESS(f'✓ {total} perfis reconciliados!'))
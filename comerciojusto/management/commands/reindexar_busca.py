@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from comerciojusto.models import Produto, TermoBusca
+from comerciojusto.busca import termos_produto
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o índice de busca de produtos em lote'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=2000, help='Produtos processados por lote')
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        self.stdout.write('Reconstruindo índice de busca...')
+
+        total_produtos = 0
+        total_termos = 0
+        with transaction.atomic():
+            TermoBusca.objects.all().delete()
+
+            # Percorre os produtos por chave primária para manter a memória constante
+            ultimo_id = 0
+            while True:
+                produtos = list(
+                    Produto.objects.filter(id_produto__gt=ultimo_id)
+                    .order_by('id_produto')
+                    .only('id_produto', 'nome', 'descricao', 'categoria')[:lote]
+                )
+                if not produtos:
+                    break
+                termos = [termo for produto in produtos for termo in termos_produto(produto)]
+                TermoBusca.objects.bulk_create(termos, batch_size=5000)
+                total_produtos += len(produtos)
+                total_termos += len(termos)
+                ultimo_id = produtos[-1].id_produto
+                self.stdout.write(f'  {total_produtos} produtos indexados')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Índice reconstruído: {total_produtos} produtos, {total_termos} termos'
+        ))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from comerciojusto.certificacoes import LOTE_VARREDURA, avisar_vencimento, expirar_vencidas
+
+
+class Command(BaseCommand):
+    help = 'Expira as certificações aprovadas vencidas e avisa os produtores das que estão para vencer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--aviso-dias', type=int, default=30, help='Avisa quem tem certificação vencendo nesse prazo')
+        parser.add_argument('--lote', type=int, default=LOTE_VARREDURA, help='Certificações por transação')
+        parser.add_argument('--continuo', action='store_true', help='Fica rodando e varre periodicamente')
+        parser.add_argument('--intervalo', type=float, default=3600.0, help='Espera entre varreduras (s)')
+
+    def handle(self, *args, **options):
+        while True:
+            expiradas = expirar_vencidas(lote=options['lote'])
+            avisadas = avisar_vencimento(options['aviso_dias'], lote=options['lote'])
+            if expiradas or avisadas or not options['continuo']:
+                self.stdout.write(self.style.SUCCESS(
+                    f'✓ {expiradas} certificação(ões) expirada(s), {avisadas} aviso(s) de vencimento enfileirado(s)'
+                ))
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
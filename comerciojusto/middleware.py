@@ -1,100 +1,123 @@
 """
 Middleware customizado para otimizações de cache e performance
+
+Cada middleware pendura no request um valor preguiçoso (SimpleLazyObject, como o
+request.user do Django): nada é consultado até a view ou o template usar. Os
+valores ficam no cache com chaves versionadas (versoes_cache) e são invalidados
+pelos signals de User, Perfil e Carrinho (e pelas funções de carrinho.py).
 """
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.core.cache import cache
-from django.contrib.auth.models import AnonymousUser
+from django.utils.functional import SimpleLazyObject
+
+from .versoes_cache import chave, namespace_carrinho, namespace_usuario
+
+TEMPO_CACHE_USUARIO = 300
+TEMPO_CACHE_PERFIL = 600
+TEMPO_CACHE_CARRINHO = 600
+
 
+def dados_usuario(user):
+    """Dados básicos do usuário autenticado, do cache"""
+    if not user.is_authenticated:
+        return None
+    cache_key = chave(namespace_usuario(user.id), 'dados')
+    user_data = cache.get(cache_key)
+    if user_data is None:
+        user_data = {
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'first_name': user.first_name,
+            'is_staff': user.is_staff,
+            'is_superuser': user.is_superuser,
+        }
+        cache.set(cache_key, user_data, TEMPO_CACHE_USUARIO)
+    return user_data
 
-class UserCacheMiddleware:
+
+def perfil_usuario(user):
     """
-    Middleware para cachear informações do usuário autenticado
-    Reduz consultas ao banco de dados
+    Perfil do usuário autenticado, do cache (None se não tiver perfil).
+    Serve para leitura: para salvar use save(update_fields=...) com os campos alterados.
     """
-    def __init__(self, get_response):
-        self.get_response = get_response
+    if not user.is_authenticated:
+        return None
+    cache_key = chave(namespace_usuario(user.id), 'perfil')
+    perfil = cache.get(cache_key)
+    if perfil is None:
+        from .models import Perfil
+        perfil = Perfil.objects.select_related('user').filter(user=user).first()
+        # Guarda False para "sem perfil" e não consultar de novo a cada request
+        cache.set(cache_key, perfil or False, TEMPO_CACHE_PERFIL)
+    return perfil or None
 
-    def __call__(self, request):
-        # Cachear usuário autenticado
-        if request.user.is_authenticated:
-            cache_key = f'user_data_{request.user.id}'
-            user_data = cache.get(cache_key)
-            
-            if user_data is None:
-                # Armazenar dados do usuário no cache
-                user_data = {
-                    'id': request.user.id,
-                    'username': request.user.username,
-                    'email': request.user.email,
-                    'first_name': request.user.first_name,
-                    'is_staff': request.user.is_staff,
-                    'is_superuser': request.user.is_superuser,
-                }
-                cache.set(cache_key, user_data, 300)  # 5 minutos
-            
-            # Adicionar dados cacheados ao request
-            request.cached_user_data = user_data
-        
-        response = self.get_response(request)
-        return response
-
-
-class PerfilCacheMiddleware:
+
+def itens_carrinho(request):
+    """Quantidade de produtos no carrinho do usuário ou da sessão, do cache"""
+    if request.user.is_authenticated:
+        namespace = namespace_carrinho(usuario_id=request.user.id)
+    elif request.session.session_key:
+        namespace = namespace_carrinho(sessao_id=request.session.session_key)
+    else:
+        return 0
+    cache_key = chave(namespace, 'contagem')
+    contagem = cache.get(cache_key)
+    if contagem is None:
+        from .carrinho import contar_itens, obter_carrinho
+        contagem = contar_itens(obter_carrinho(request))
+        cache.set(cache_key, contagem, TEMPO_CACHE_CARRINHO)
+    return contagem
+
+
+class ContextoMiddleware:
     """
-    Middleware para cachear perfil do usuário (Produtor/Empresa)
+    Base dos middlewares de contexto: só penduram valores preguiçosos no request,
+    então funcionam tanto no WSGI quanto no ASGI sem trocar de thread.
     """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        if request.user.is_authenticated:
-            cache_key = f'perfil_{request.user.id}'
-            perfil = cache.get(cache_key)
-            
-            if perfil is None:
-                try:
-                    from .models import Perfil
-                    perfil = Perfil.objects.select_related('user').get(user=request.user)
-                    # Cachear o perfil por 10 minutos
-                    cache.set(cache_key, perfil, 600)
-                except:
-                    perfil = None
-            
-            request.cached_perfil = perfil
-        
-        response = self.get_response(request)
-        return response
-
-
-class CarrinhoCountMiddleware:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self.preparar(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        self.preparar(request)
+        return await self.get_response(request)
+
+    def preparar(self, request):
+        raise NotImplementedError
+
+
+class UserCacheMiddleware(ContextoMiddleware):
     """
-    Middleware para otimizar contagem de itens no carrinho
+    Middleware para cachear informações do usuário autenticado
+    Reduz consultas ao banco de dados
     """
-    def __init__(self, get_response):
-        self.get_response = get_response
+    def preparar(self, request):
+        request.cached_user_data = SimpleLazyObject(lambda: dados_usuario(request.user))
 
-    def __call__(self, request):
-        # Verificar se já existe contagem na sessão
-        if 'carrinho_itens' not in request.session:
-            if request.user.is_authenticated:
-                # Buscar do banco
-                from .models import Carrinho
-                carrinho = Carrinho.objects.filter(usuario=request.user).first()
-                if carrinho and carrinho.itens:
-                    request.session['carrinho_itens'] = len(carrinho.itens)
-                else:
-                    request.session['carrinho_itens'] = 0
-            else:
-                # Buscar da sessão
-                sessao_id = request.session.session_key
-                if sessao_id:
-                    from .models import Carrinho
-                    carrinho = Carrinho.objects.filter(sessao_id=sessao_id).first()
-                    if carrinho and carrinho.itens:
-                        request.session['carrinho_itens'] = len(carrinho.itens)
-                    else:
-                        request.session['carrinho_itens'] = 0
-                else:
-                    request.session['carrinho_itens'] = 0
-        
-        response = self.get_response(request)
-        return response
+
+class PerfilCacheMiddleware(ContextoMiddleware):
+    """
+    Middleware para cachear perfil do usuário (Produtor/Empresa): request.perfil
+    """
+    def preparar(self, request):
+        request.perfil = SimpleLazyObject(lambda: perfil_usuario(request.user))
+        request.cached_perfil = request.perfil
+
+
+class CarrinhoCountMiddleware(ContextoMiddleware):
+    """
+    Middleware para otimizar contagem de itens no carrinho: request.carrinho_itens
+    """
+    def preparar(self, request):
+        request.carrinho_itens = SimpleLazyObject(lambda: itens_carrinho(request))
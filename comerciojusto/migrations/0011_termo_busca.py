@@ -0,0 +1,49 @@
+# Generated by Django 6.0 on 2026-10-18 12:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def indexar_produtos_existentes(apps, schema_editor):
+    from comerciojusto.busca import pesos_produto
+
+    Produto = apps.get_model('comerciojusto', 'Produto')
+    TermoBusca = apps.get_model('comerciojusto', 'TermoBusca')
+    # Grava por lote, como o reindexar_busca, para a memória não crescer com o catálogo
+    termos = []
+    produtos = Produto.objects.only('id_produto', 'nome', 'descricao', 'categoria').order_by('id_produto')
+    for produto in produtos.iterator(chunk_size=2000):
+        termos.extend(
+            TermoBusca(termo=termo, produto_id=produto.pk, peso=peso)
+            for termo, peso in pesos_produto(produto).items()
+        )
+        if len(termos) >= 5000:
+            TermoBusca.objects.bulk_create(termos)
+            termos = []
+    TermoBusca.objects.bulk_create(termos)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comerciojusto', '0010_delete_publicacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TermoBusca',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('termo', models.CharField(max_length=60)),
+                ('peso', models.FloatField(default=1)),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='termos_busca', to='comerciojusto.produto')),
+            ],
+            options={
+                'verbose_name': 'Termo de Busca',
+                'verbose_name_plural': 'Termos de Busca',
+                'db_table': 'termo_busca',
+                'constraints': [models.UniqueConstraint(fields=('termo', 'produto'), name='termo_busca_termo_produto_uniq')],
+            },
+        ),
+        migrations.RunPython(indexar_produtos_existentes, migrations.RunPython.noop),
+    ]
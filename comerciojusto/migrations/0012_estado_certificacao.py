@@ -0,0 +1,67 @@
+# Generated by Django 6.0 on 2026-10-18 12:21
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+
+def preencher_estado_certificacao(apps, schema_editor):
+    Certificacao = apps.get_model('comerciojusto', 'Certificacao')
+    hoje = timezone.localdate()
+    vigentes = Certificacao.objects.filter(status='aprovada').filter(
+        Q(validade__isnull=True) | Q(validade__gte=hoje)
+    )
+    for nome_modelo, campo in (('Produto', 'produto'), ('Perfil', 'perfil')):
+        modelo = apps.get_model('comerciojusto', nome_modelo)
+        linhas = vigentes.exclude(**{f'{campo}__isnull': True}).values(campo).annotate(
+            total=Count('pk'),
+            ultima_validade=Max('validade'),
+            sem_validade=Count('pk', filter=Q(validade__isnull=True)),
+        )
+        for linha in linhas:
+            modelo.objects.filter(pk=linha[campo]).update(
+                certificado=True,
+                certificacoes_aprovadas=linha['total'],
+                certificacao_validade=None if linha['sem_validade'] else linha['ultima_validade'],
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comerciojusto', '0011_termo_busca'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='perfil',
+            name='certificacao_validade',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='perfil',
+            name='certificacoes_aprovadas',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='perfil',
+            name='certificado',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='certificacao_validade',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='certificacoes_aprovadas',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='certificado',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.RunPython(preencher_estado_certificacao, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 6.0 on 2026-10-18 12:22
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def preencher_agregados(apps, schema_editor):
+    Avaliacao = apps.get_model('comerciojusto', 'Avaliacao')
+    Perfil = apps.get_model('comerciojusto', 'Perfil')
+    linhas = Avaliacao.objects.order_by().values('perfil_id').annotate(
+        total=Count('pk'),
+        soma=Sum('estrelas'),
+        **{f'e{n}': Count('pk', filter=Q(estrelas=n)) for n in range(1, 6)},
+    )
+    for linha in linhas:
+        Perfil.objects.filter(pk=linha['perfil_id']).update(
+            total_avaliacoes=linha['total'],
+            soma_avaliacoes=linha['soma'],
+            taxa_avaliacao=round(linha['soma'] / linha['total'], 2),
+            **{f'estrelas_{n}': linha[f'e{n}'] for n in range(1, 6)},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comerciojusto', '0012_estado_certificacao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='perfil',
+            name='estrelas_1',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='perfil',
+            name='estrelas_2',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='perfil',
+            name='estrelas_3',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='perfil',
+            name='estrelas_4',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='perfil',
+            name='estrelas_5',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='perfil',
+            name='soma_avaliacoes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(preencher_agregados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 6.0 on 2026-10-18 12:23
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def agrupar_mensagens_em_conversas(apps, schema_editor):
+    Conversa = apps.get_model('comerciojusto', 'Conversa')
+    Mensagem = apps.get_model('comerciojusto', 'Mensagem')
+
+    resumos = {}
+    for id_mensagem, remetente_id, destinatario_id, lida, criada_em in (
+        Mensagem.objects.order_by('id_mensagem')
+        .values_list('id_mensagem', 'remetente_id', 'destinatario_id', 'lida', 'criada_em')
+        .iterator()
+    ):
+        par = tuple(sorted((remetente_id, destinatario_id)))
+        resumo = resumos.setdefault(par, {'ids': [], 'ultima': None, 'criada_em': None, 'a': 0, 'b': 0})
+        resumo['ids'].append(id_mensagem)
+        resumo['ultima'], resumo['criada_em'] = id_mensagem, criada_em
+        if not lida:
+            resumo['a' if destinatario_id == par[0] else 'b'] += 1
+
+    for (a, b), resumo in resumos.items():
+        conversa = Conversa.objects.create(
+            usuario_a_id=a,
+            usuario_b_id=b,
+            ultima_mensagem_id=resumo['ultima'],
+            atualizada_em=resumo['criada_em'],
+            nao_lidas_a=resumo['a'],
+            nao_lidas_b=resumo['b'],
+        )
+        for inicio in range(0, len(resumo['ids']), 500):
+            Mensagem.objects.filter(id_mensagem__in=resumo['ids'][inicio:inicio + 500]).update(conversa=conversa)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comerciojusto', '0013_agregados_avaliacao'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversa',
+            fields=[
+                ('id_conversa', models.AutoField(primary_key=True, serialize=False)),
+                ('atualizada_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('nao_lidas_a', models.PositiveIntegerField(default=0)),
+                ('nao_lidas_b', models.PositiveIntegerField(default=0)),
+                ('ultima_mensagem', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='comerciojusto.mensagem')),
+                ('usuario_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversas_como_a', to=settings.AUTH_USER_MODEL)),
+                ('usuario_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversas_como_b', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Conversa',
+                'verbose_name_plural': 'Conversas',
+                'db_table': 'conversa',
+            },
+        ),
+        migrations.AddField(
+            model_name='mensagem',
+            name='conversa',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='mensagens', to='comerciojusto.conversa'),
+        ),
+        migrations.AddIndex(
+            model_name='mensagem',
+            index=models.Index(fields=['conversa', 'id_mensagem'], name='mensagem_conversa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversa',
+            index=models.Index(fields=['usuario_a', '-atualizada_em'], name='conversa_a_atualizada_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversa',
+            index=models.Index(fields=['usuario_b', '-atualizada_em'], name='conversa_b_atualizada_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='conversa',
+            constraint=models.UniqueConstraint(fields=('usuario_a', 'usuario_b'), name='conversa_participantes_uniq'),
+        ),
+        migrations.RunPython(agrupar_mensagens_em_conversas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 6.0 on 2026-10-18 12:28
+
+import django.db.models.deletion
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+
+
+def converter_carrinhos_json(apps, schema_editor):
+    Carrinho = apps.get_model('comerciojusto', 'Carrinho')
+    ItemCarrinho = apps.get_model('comerciojusto', 'ItemCarrinho')
+    Produto = apps.get_model('comerciojusto', 'Produto')
+
+    precos = dict(Produto.objects.values_list('id_produto', 'preco'))
+    novos = []
+    for carrinho_id, itens in Carrinho.objects.values_list('id_carrinho', 'itens').iterator():
+        for produto_id, dados in (itens or {}).items():
+            try:
+                produto_id = int(produto_id)
+                quantidade = int(dados.get('quantidade', 1))
+            except (TypeError, ValueError, AttributeError):
+                continue
+            if produto_id not in precos or quantidade < 1:
+                continue
+            try:
+                preco = Decimal(str(dados.get('preco')))
+            except (InvalidOperation, TypeError):
+                preco = precos[produto_id]
+            novos.append(ItemCarrinho(carrinho_id=carrinho_id, produto_id=produto_id, quantidade=quantidade, preco=preco))
+    ItemCarrinho.objects.bulk_create(novos, batch_size=500)
+
+
+def restaurar_carrinhos_json(apps, schema_editor):
+    Carrinho = apps.get_model('comerciojusto', 'Carrinho')
+    ItemCarrinho = apps.get_model('comerciojusto', 'ItemCarrinho')
+
+    itens = {}
+    for item in ItemCarrinho.objects.select_related('produto').iterator():
+        itens.setdefault(item.carrinho_id, {})[str(item.produto_id)] = {
+            'quantidade': item.quantidade,
+            'preco': str(item.preco),
+            'nome': item.produto.nome,
+        }
+    for carrinho_id, dados in itens.items():
+        Carrinho.objects.filter(pk=carrinho_id).update(itens=dados, rascunho_json=dados)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comerciojusto', '0014_conversa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemCarrinho',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade', models.PositiveIntegerField(default=1)),
+                ('preco', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('adicionado_em', models.DateTimeField(auto_now_add=True)),
+                ('carrinho', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='itens_carrinho', to='comerciojusto.carrinho')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='itens_carrinho', to='comerciojusto.produto')),
+            ],
+            options={
+                'verbose_name': 'Item do Carrinho',
+                'verbose_name_plural': 'Itens dos Carrinhos',
+                'db_table': 'item_carrinho',
+                'constraints': [models.UniqueConstraint(fields=('carrinho', 'produto'), name='item_carrinho_produto_uniq')],
+            },
+        ),
+        migrations.RunPython(converter_carrinhos_json, restaurar_carrinhos_json),
+        migrations.RemoveField(
+            model_name='carrinho',
+            name='itens',
+        ),
+        migrations.RemoveField(
+            model_name='carrinho',
+            name='rascunho_json',
+        ),
+    ]
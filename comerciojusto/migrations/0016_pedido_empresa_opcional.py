@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-18 12:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comerciojusto', '0015_item_carrinho'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pedido',
+            name='empresa',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pedidos', to='comerciojusto.empresa'),
+        ),
+    ]
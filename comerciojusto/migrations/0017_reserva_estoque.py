@@ -0,0 +1,53 @@
+# Generated by Django 6.0 on 2026-10-18 12:39
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def estoque_zerado_sem_controle(apps, schema_editor):
+    # Nenhum formulário preenchia o estoque: o 0 padrão não é um estoque real
+    Produto = apps.get_model('comerciojusto', 'Produto')
+    Produto.objects.filter(estoque=0).update(estoque=None)
+
+
+def estoque_sem_controle_zerado(apps, schema_editor):
+    Produto = apps.get_model('comerciojusto', 'Produto')
+    Produto.objects.filter(estoque__isnull=True).update(estoque=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comerciojusto', '0016_pedido_empresa_opcional'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='produto',
+            name='estoque',
+            field=models.IntegerField(blank=True, default=None, null=True),
+        ),
+        migrations.RunPython(estoque_zerado_sem_controle, estoque_sem_controle_zerado),
+        migrations.CreateModel(
+            name='ReservaEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade', models.PositiveIntegerField()),
+                ('referencia', models.CharField(blank=True, db_index=True, default='', max_length=255)),
+                ('status', models.CharField(choices=[('ativa', 'Ativa'), ('convertida', 'Convertida em venda'), ('expirada', 'Expirada'), ('liberada', 'Liberada')], default='ativa', max_length=20)),
+                ('criada_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expira_em', models.DateTimeField()),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='comerciojusto.produto')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas_estoque', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Reserva de Estoque',
+                'verbose_name_plural': 'Reservas de Estoque',
+                'db_table': 'reserva_estoque',
+                'indexes': [models.Index(fields=['status', 'expira_em'], name='reserva_estoque_expira_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 6.0 on 2026-10-18 12:44
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comerciojusto', '0017_reserva_estoque'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarefa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=100)),
+                ('argumentos', models.JSONField(default=dict)),
+                ('chave', models.CharField(blank=True, default='', max_length=255)),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('executando', 'Executando'), ('concluida', 'Concluída'), ('falhou', 'Falhou')], default='pendente', max_length=20)),
+                ('tentativas', models.PositiveIntegerField(default=0)),
+                ('max_tentativas', models.PositiveIntegerField(default=5)),
+                ('erro', models.TextField(blank=True, default='')),
+                ('executar_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('criada_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('atualizada_em', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Tarefa',
+                'verbose_name_plural': 'Tarefas',
+                'db_table': 'tarefa',
+                'indexes': [models.Index(fields=['status', 'executar_em'], name='tarefa_fila_idx'), models.Index(fields=['nome', 'chave', 'status'], name='tarefa_chave_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 12:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comerciojusto', '0018_tarefa'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='perfil',
+            name='logo_variantes',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='imagem_variantes',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
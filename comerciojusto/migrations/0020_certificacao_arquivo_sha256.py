@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comerciojusto', '0019_variantes_imagem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificacao',
+            name='arquivo_sha256',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+import comerciojusto.armazenamento
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comerciojusto', '0020_certificacao_arquivo_sha256'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='certificacao',
+            name='arquivo_certificado',
+            field=models.FileField(blank=True, null=True, storage=comerciojusto.armazenamento.armazenamento_midia, upload_to='certificacoes/'),
+        ),
+        migrations.AlterField(
+            model_name='perfil',
+            name='logo',
+            field=models.ImageField(blank=True, null=True, storage=comerciojusto.armazenamento.armazenamento_midia, upload_to='perfis/logos/'),
+        ),
+        migrations.AlterField(
+            model_name='produto',
+            name='imagem',
+            field=models.ImageField(blank=True, null=True, storage=comerciojusto.armazenamento.armazenamento_midia, upload_to='produtos/'),
+        ),
+        migrations.CreateModel(
+            name='BlobMidia',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('nome', models.CharField(max_length=255)),
+                ('tamanho', models.PositiveBigIntegerField(default=0)),
+                ('referencias', models.PositiveIntegerField(default=0)),
+                ('criado_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('atualizado_em', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Arquivo de mídia',
+                'verbose_name_plural': 'Arquivos de mídia',
+                'db_table': 'blob_midia',
+                'indexes': [models.Index(fields=['referencias', 'atualizado_em'], name='blob_midia_coleta_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comerciojusto', '0021_armazenamento_conteudo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificacao',
+            name='aviso_vencimento_em',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='certificacao',
+            name='versao',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='certificacao',
+            name='status',
+            field=models.CharField(choices=[('nao_disponivel', 'Não Disponível'), ('enviado_analise', 'Enviado para Análise'), ('aprovada', 'Aprovada'), ('reprovada', 'Reprovada'), ('expirada', 'Expirada')], default='enviado_analise', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='certificacao',
+            index=models.Index(fields=['status', 'validade'], name='certificacao_validade_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='certificacao',
+            index=models.Index(fields=['status', 'id_certificacao'], name='certificacao_fila_idx'),
+        ),
+    ]
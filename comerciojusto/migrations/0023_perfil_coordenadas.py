@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+def geolocalizar_perfis(apps, schema_editor):
+    # Tabela local de municípios (comerciojusto/geo.py): sem chamadas de rede
+    from comerciojusto.geo import geocodificar
+
+    Perfil = apps.get_model('comerciojusto', 'Perfil')
+    alterados = []
+    for perfil in Perfil.objects.exclude(cidade__isnull=True).exclude(cidade='').only('pk', 'cidade', 'estado').iterator():
+        coordenadas = geocodificar(perfil.cidade, perfil.estado)
+        if coordenadas:
+            perfil.latitude, perfil.longitude = coordenadas
+            alterados.append(perfil)
+    Perfil.objects.bulk_update(alterados, ['latitude', 'longitude'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comerciojusto', '0022_certificacao_fila_validade'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='perfil',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='perfil',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='perfil',
+            name='estado',
+            field=models.CharField(blank=True, db_index=True, max_length=2, null=True),
+        ),
+        migrations.RunPython(geolocalizar_perfis, migrations.RunPython.noop),
+    ]
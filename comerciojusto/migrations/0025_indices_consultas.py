@@ -0,0 +1,39 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comerciojusto', '0024_produto_atualizado_em'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='avaliacao',
+            index=models.Index(fields=['perfil', '-data_avaliacao'], name='avaliacao_perfil_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carrinho',
+            index=models.Index(condition=models.Q(('sessao_id__isnull', False)), fields=['sessao_id'], name='carrinho_sessao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mensagem',
+            index=models.Index(condition=models.Q(('lida', False)), fields=['destinatario', 'conversa'], name='mensagem_nao_lidas_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['-destaque', '-vendas', '-id_produto'], name='produto_catalogo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['categoria', '-destaque', '-vendas', '-id_produto'], name='produto_categoria_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(condition=models.Q(('ativo', True)), fields=['perfil', '-destaque', '-vendas'], name='produto_perfil_ativo_idx'),
+        ),
+    ]
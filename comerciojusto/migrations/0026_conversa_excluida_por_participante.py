@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comerciojusto', '0025_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversa',
+            name='excluida_ate_a',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversa',
+            name='excluida_ate_b',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+import django.core.validators
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def limitar_estrelas(apps, schema_editor):
+    """Traz para 1-5 as avaliações gravadas fora da faixa e refaz os agregados desses perfis"""
+    Avaliacao = apps.get_model('comerciojusto', 'Avaliacao')
+    Perfil = apps.get_model('comerciojusto', 'Perfil')
+    fora = Avaliacao.objects.filter(Q(estrelas__lt=1) | Q(estrelas__gt=5))
+    perfis = set(fora.values_list('perfil_id', flat=True))
+    if not perfis:
+        return
+    Avaliacao.objects.filter(estrelas__lt=1).update(estrelas=1)
+    Avaliacao.objects.filter(estrelas__gt=5).update(estrelas=5)
+    linhas = Avaliacao.objects.filter(perfil_id__in=perfis).order_by().values('perfil_id').annotate(
+        total=Count('pk'),
+        soma=Sum('estrelas'),
+        **{f'e{n}': Count('pk', filter=Q(estrelas=n)) for n in range(1, 6)},
+    )
+    for linha in linhas:
+        Perfil.objects.filter(pk=linha['perfil_id']).update(
+            total_avaliacoes=linha['total'],
+            soma_avaliacoes=linha['soma'],
+            taxa_avaliacao=round(linha['soma'] / linha['total'], 2),
+            **{f'estrelas_{n}': linha[f'e{n}'] for n in range(1, 6)},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comerciojusto', '0026_conversa_excluida_por_participante'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(limitar_estrelas, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='avaliacao',
+            name='estrelas',
+            field=models.IntegerField(choices=[(1, 1), (2, 2), (3, 3), (4, 4), (5, 5)], validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)]),
+        ),
+        migrations.AddConstraint(
+            model_name='avaliacao',
+            constraint=models.CheckConstraint(condition=models.Q(('estrelas__gte', 1), ('estrelas__lte', 5)), name='avaliacao_estrelas_1_a_5'),
+        ),
+    ]
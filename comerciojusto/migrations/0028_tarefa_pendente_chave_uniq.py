@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def descartar_duplicadas(apps, schema_editor):
+    """Das tarefas pendentes repetidas (mesmo nome e chave), fica a mais antiga"""
+    Tarefa = apps.get_model('comerciojusto', 'Tarefa')
+    pendentes = Tarefa.objects.filter(status='pendente').exclude(chave='')
+    repetidas = (
+        pendentes.order_by().values('nome', 'chave')
+        .annotate(quantidade=Count('pk'), primeira=Min('pk')).filter(quantidade__gt=1)
+    )
+    for linha in repetidas:
+        pendentes.filter(nome=linha['nome'], chave=linha['chave']).exclude(pk=linha['primeira']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comerciojusto', '0027_avaliacao_estrelas_1_a_5'),
+    ]
+
+    operations = [
+        migrations.RunPython(descartar_duplicadas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='tarefa',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pendente'), models.Q(('chave', ''), _negated=True)), fields=('nome', 'chave'), name='tarefa_pendente_chave_uniq'),
+        ),
+    ]
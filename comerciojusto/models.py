@@ -1,8 +1,11 @@
 
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from .armazenamento import armazenamento_midia
+
 # Pedido de compra
 
 class Pedido(models.Model):
@@ -12,14 +15,15 @@ class Pedido(models.Model):
         ('entregue', 'Entregue'),
     ]
     id_pedido = models.AutoField(primary_key=True)
-    empresa = models.ForeignKey('Empresa', on_delete=models.CASCADE, related_name='pedidos')
+    empresa = models.ForeignKey('Empresa', on_delete=models.CASCADE, related_name='pedidos', null=True, blank=True)  # vazio em compras de quem não é empresa
     usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pedidos')
     produtos = models.ManyToManyField('Produto', through='ItemPedido')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='solicitado')
     data_pedido = models.DateTimeField(default=timezone.now)
 
     def __str__(self):
-        return f"Pedido {self.id_pedido} - {self.empresa.nome} - {self.get_status_display()}"
+        comprador = self.empresa.nome if self.empresa_id else self.usuario.username
+        return f"Pedido {self.id_pedido} - {comprador} - {self.get_status_display()}"
 
     class Meta:
         db_table = 'pedido'
@@ -49,7 +53,8 @@ class Perfil(models.Model):
         ('produtor', 'Produtor'),
         ('empresa', 'Empresa'),
     ])
-    logo = models.ImageField(upload_to='perfis/logos/', blank=True, null=True)
+    logo = models.ImageField(upload_to='perfis/logos/', storage=armazenamento_midia, blank=True, null=True)
+    logo_variantes = models.JSONField(default=dict, blank=True)  # miniaturas WebP/AVIF geradas por imagens.py
     bio = models.TextField(blank=True, null=True, verbose_name='Biografia')
     descricao = models.TextField(blank=True, null=True)
     noticia = models.TextField(blank=True, null=True)
@@ -57,17 +62,47 @@ class Perfil(models.Model):
     cpf_cnpj = models.CharField(max_length=20, blank=True, null=True)
     endereco = models.CharField(max_length=255, blank=True, null=True)
     cidade = models.CharField(max_length=100, blank=True, null=True)
-    estado = models.CharField(max_length=2, blank=True, null=True)
+    estado = models.CharField(max_length=2, blank=True, null=True, db_index=True)
+    # Coordenadas da cidade (geo.py, tabela local de municípios); vazias se a cidade não foi reconhecida
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
     taxa_avaliacao = models.DecimalField(max_digits=3, decimal_places=2, default=5.0)
     total_vendas = models.IntegerField(default=0)
     total_avaliacoes = models.IntegerField(default=0)
+    # Agregados incrementais das avaliações (mantidos por avaliacoes.py)
+    soma_avaliacoes = models.IntegerField(default=0)
+    estrelas_1 = models.IntegerField(default=0)
+    estrelas_2 = models.IntegerField(default=0)
+    estrelas_3 = models.IntegerField(default=0)
+    estrelas_4 = models.IntegerField(default=0)
+    estrelas_5 = models.IntegerField(default=0)
     verificado = models.BooleanField(default=False)
+    # Estado de certificação desnormalizado (mantido por certificacoes.py)
+    certificado = models.BooleanField(default=False, db_index=True)
+    certificacao_validade = models.DateField(blank=True, null=True)
+    certificacoes_aprovadas = models.PositiveIntegerField(default=0)
     criado_em = models.DateTimeField(auto_now_add=True, null=True)
     atualizado_em = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.user.username} - {self.tipo}"
 
+    @property
+    def certificado_vigente(self):
+        """Certificado e ainda dentro da validade (sem validade = não expira)"""
+        return self.certificado and (
+            self.certificacao_validade is None or self.certificacao_validade >= timezone.localdate()
+        )
+
+    @property
+    def histograma_estrelas(self):
+        """Lista (estrelas, quantidade, percentual) da maior para a menor nota"""
+        total = self.total_avaliacoes or 0
+        return [
+            (n, getattr(self, f'estrelas_{n}'), round(100 * getattr(self, f'estrelas_{n}') / total) if total else 0)
+            for n in range(5, 0, -1)
+        ]
+
     class Meta:
         db_table = 'perfil'
         verbose_name = 'Perfil'
@@ -127,25 +162,50 @@ class Produto(models.Model):
     categoria = models.CharField(max_length=50, choices=CATEGORIA_CHOICES, default='todas')
     preco = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     preco_original = models.DecimalField(max_digits=10, decimal_places=2, default=0, blank=True, null=True)
-    imagem = models.ImageField(upload_to='produtos/', blank=True, null=True)
+    imagem = models.ImageField(upload_to='produtos/', storage=armazenamento_midia, blank=True, null=True)
+    imagem_variantes = models.JSONField(default=dict, blank=True)  # miniaturas WebP/AVIF geradas por imagens.py
     data_producao = models.DateField(blank=True, null=True)
     status_logistica = models.CharField(max_length=30, blank=True, null=True)
     produtor = models.ForeignKey(Produtor, on_delete=models.CASCADE, null=True, blank=True)
     perfil = models.ForeignKey(Perfil, on_delete=models.CASCADE, null=True, blank=True, related_name='produtos')
-    estoque = models.IntegerField(default=0)
+    estoque = models.IntegerField(default=None, blank=True, null=True)  # vazio = sem controle de estoque (ver estoque.py)
     vendas = models.IntegerField(default=0)
     taxa_avaliacao = models.DecimalField(max_digits=3, decimal_places=2, default=5.0)
     ativo = models.BooleanField(default=True)
     destaque = models.BooleanField(default=False)
+    # Estado de certificação desnormalizado (mantido por certificacoes.py)
+    certificado = models.BooleanField(default=False, db_index=True)
+    certificacao_validade = models.DateField(blank=True, null=True)
+    certificacoes_aprovadas = models.PositiveIntegerField(default=0)
+    # Carimbo das chaves de cache dos fragmentos (também avançado pelos UPDATEs em lote)
+    atualizado_em = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.nome
 
+    @property
+    def certificado_vigente(self):
+        """Certificado e ainda dentro da validade (sem validade = não expira)"""
+        return self.certificado and (
+            self.certificacao_validade is None or self.certificacao_validade >= timezone.localdate()
+        )
+
     class Meta:
         db_table = 'produto'
         ordering = ['-destaque', '-vendas']
         verbose_name = 'Produto'
         verbose_name_plural = 'Produtos'
+        # Índices das consultas do catálogo e do perfil público (ver comando benchmark_indices)
+        indexes = [
+            # Primeira página e cursor do catálogo (ORDENACAO_CATALOGO em views.py)
+            models.Index(fields=['-destaque', '-vendas', '-id_produto'], name='produto_catalogo_idx'),
+            models.Index(fields=['categoria', '-destaque', '-vendas', '-id_produto'], name='produto_categoria_idx'),
+            # Vitrine do perfil: só produtos ativos, na ordenação padrão
+            models.Index(
+                fields=['perfil', '-destaque', '-vendas'], condition=models.Q(ativo=True),
+                name='produto_perfil_ativo_idx',
+            ),
+        ]
 
 # o que seria Documento?
 class Documento(models.Model):
@@ -184,6 +244,7 @@ class Certificacao(models.Model):
         ('enviado_analise', 'Enviado para Análise'),
         ('aprovada', 'Aprovada'),
         ('reprovada', 'Reprovada'),
+        ('expirada', 'Expirada'),  # aprovada cuja validade passou (comando varrer_certificacoes)
     ]
     
     id_certificacao = models.AutoField(primary_key=True)
@@ -193,24 +254,27 @@ class Certificacao(models.Model):
     data_certificacao = models.DateField(blank=True, null=True)
     validade = models.DateField(blank=True, null=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='enviado_analise')
-    arquivo_certificado = models.FileField(upload_to='certificacoes/', blank=True, null=True)
+    arquivo_certificado = models.FileField(upload_to='certificacoes/', storage=armazenamento_midia, blank=True, null=True)
+    arquivo_sha256 = models.CharField(max_length=64, blank=True, default='', db_index=True)  # Arquivos iguais são gravados uma vez só
     parecer = models.TextField(blank=True, null=True)  # Parecer do administrador
+    versao = models.PositiveIntegerField(default=0)  # trava otimista da fila de análise
+    aviso_vencimento_em = models.DateTimeField(blank=True, null=True)  # quando o produtor foi avisado do vencimento
 
     def clean(self):
         super().clean()
+        from django.core.exceptions import ValidationError
+        from .uploads import REGRAS, mensagem_tamanho, mensagem_tipo, tipo_do_arquivo
+
         arquivo = self.arquivo_certificado
         if arquivo:
-            # Validação de tamanho (máx 5MB)
-            if arquivo.size > 5 * 1024 * 1024:
-                from django.core.exceptions import ValidationError
-                raise ValidationError({'arquivo_certificado': 'O arquivo não pode exceder 5MB.'})
-            # Validação de extensão
-            ext = arquivo.name.split('.')[-1].lower()
-            extensoes_permitidas = ['pdf', 'jpg', 'jpeg', 'png']
-            extensoes_proibidas = ['exe', 'bat']
-            if ext not in extensoes_permitidas or ext in extensoes_proibidas:
-                from django.core.exceptions import ValidationError
-                raise ValidationError({'arquivo_certificado': 'Extensão de arquivo não permitida. Apenas PDF ou imagem (JPG, JPEG, PNG).'})
+            # O handler de upload (uploads.py) já recusa no recebimento; aqui vale para
+            # arquivos que chegam por outros caminhos (admin, shell)
+            limite, tipos, _ = REGRAS['arquivo_certificado']
+            if arquivo.size > limite:
+                raise ValidationError({'arquivo_certificado': mensagem_tamanho('arquivo_certificado')})
+            # Tipo pela assinatura do conteúdo, não pela extensão
+            if tipo_do_arquivo(arquivo) not in tipos:
+                raise ValidationError({'arquivo_certificado': mensagem_tipo('arquivo_certificado')})
         return arquivo
     def __str__(self):
         return f"Certificação {self.id_certificacao} - {self.get_status_display()}"
@@ -219,13 +283,19 @@ class Certificacao(models.Model):
         db_table = 'certificacao'
         verbose_name = 'Certificação'
         verbose_name_plural = 'Certificações'
+        indexes = [
+            models.Index(fields=['status', 'validade'], name='certificacao_validade_idx'),
+            models.Index(fields=['status', 'id_certificacao'], name='certificacao_fila_idx'),
+        ]
 
     # Prototipo bom, mas falta otimizar
 class Avaliacao(models.Model):
     id_avaliacao = models.AutoField(primary_key=True)
     perfil = models.ForeignKey(Perfil, on_delete=models.CASCADE, related_name='avaliacoes')
     usuario = models.ForeignKey(User, on_delete=models.CASCADE)
-    estrelas = models.IntegerField(choices=[(i, i) for i in range(1, 6)])
+    estrelas = models.IntegerField(
+        choices=[(i, i) for i in range(1, 6)], validators=[MinValueValidator(1), MaxValueValidator(5)]
+    )
     comentario = models.TextField(blank=True, null=True)
     data_avaliacao = models.DateTimeField(auto_now_add=True)
     verificado_compra = models.BooleanField(default=True)
@@ -238,6 +308,14 @@ class Avaliacao(models.Model):
         ordering = ['-data_avaliacao']
         verbose_name = 'Avaliação'
         verbose_name_plural = 'Avaliações'
+        indexes = [
+            # Últimas avaliações do perfil (detalhes do produto e perfil público)
+            models.Index(fields=['perfil', '-data_avaliacao'], name='avaliacao_perfil_data_idx'),
+        ]
+        constraints = [
+            # Os agregados do Perfil (avaliacoes.py) só contam 1 a 5 estrelas
+            models.CheckConstraint(condition=models.Q(estrelas__gte=1, estrelas__lte=5), name='avaliacao_estrelas_1_a_5'),
+        ]
 
 # melhorar essa implementação (seria para divulgar o produto fora do site?)
 class AnuncioMarketplace(models.Model):
@@ -260,10 +338,8 @@ class Carrinho(models.Model):
     id_carrinho = models.AutoField(primary_key=True)
     usuario = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True)
     sessao_id = models.CharField(max_length=255, blank=True, null=True)
-    itens = models.JSONField(default=dict)
     criado_em = models.DateTimeField(auto_now_add=True, null=True)
     atualizado_em = models.DateTimeField(auto_now=True)
-    rascunho_json = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return f"Carrinho {self.id_carrinho}"
@@ -272,9 +348,101 @@ class Carrinho(models.Model):
         db_table = 'carrinho'
         verbose_name = 'Carrinho'
         verbose_name_plural = 'Carrinhos'
+        indexes = [
+            # Carrinho do visitante anônimo, procurado a cada requisição; os de usuários têm sessao_id vazio
+            models.Index(
+                fields=['sessao_id'], condition=models.Q(sessao_id__isnull=False), name='carrinho_sessao_idx',
+            ),
+        ]
+
+# Uma linha por produto no carrinho; quantidade somada com F() (ver carrinho.py)
+# preco guarda o valor do produto no momento em que foi adicionado
+class ItemCarrinho(models.Model):
+    carrinho = models.ForeignKey(Carrinho, on_delete=models.CASCADE, related_name='itens_carrinho')
+    produto = models.ForeignKey('Produto', on_delete=models.CASCADE, related_name='itens_carrinho')
+    quantidade = models.PositiveIntegerField(default=1)
+    preco = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    adicionado_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.produto_id} x{self.quantidade}"
+
+    class Meta:
+        db_table = 'item_carrinho'
+        verbose_name = 'Item do Carrinho'
+        verbose_name_plural = 'Itens dos Carrinhos'
+        constraints = [
+            models.UniqueConstraint(fields=['carrinho', 'produto'], name='item_carrinho_produto_uniq'),
+        ]
+
+# Quantidade separada do estoque durante um checkout: baixada de Produto.estoque na criação
+# e devolvida se o pagamento não for concluído até expira_em (ver estoque.py)
+# referencia é o id da sessão de checkout do Stripe
+class ReservaEstoque(models.Model):
+    STATUS_CHOICES = [
+        ('ativa', 'Ativa'),
+        ('convertida', 'Convertida em venda'),
+        ('expirada', 'Expirada'),
+        ('liberada', 'Liberada'),
+    ]
+    produto = models.ForeignKey('Produto', on_delete=models.CASCADE, related_name='reservas')
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reservas_estoque')
+    quantidade = models.PositiveIntegerField()
+    referencia = models.CharField(max_length=255, blank=True, default='', db_index=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ativa')
+    criada_em = models.DateTimeField(default=timezone.now)
+    expira_em = models.DateTimeField()
+
+    def __str__(self):
+        return f"Reserva {self.produto_id} x{self.quantidade} ({self.get_status_display()})"
+
+    class Meta:
+        db_table = 'reserva_estoque'
+        verbose_name = 'Reserva de Estoque'
+        verbose_name_plural = 'Reservas de Estoque'
+        indexes = [
+            models.Index(fields=['status', 'expira_em'], name='reserva_estoque_expira_idx'),
+        ]
+
+# Conversa entre dois usuários: resumo mantido a cada mensagem enviada/lida (ver conversas.py)
+# usuario_a é sempre o participante de menor id, para que o par seja único
+class Conversa(models.Model):
+    id_conversa = models.AutoField(primary_key=True)
+    usuario_a = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversas_como_a')
+    usuario_b = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversas_como_b')
+    ultima_mensagem = models.ForeignKey('Mensagem', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    atualizada_em = models.DateTimeField(default=timezone.now)
+    nao_lidas_a = models.PositiveIntegerField(default=0)
+    nao_lidas_b = models.PositiveIntegerField(default=0)
+    # Última mensagem que cada participante excluiu da própria caixa de entrada (0 = nenhuma);
+    # as mensagens continuam valendo para o outro participante
+    excluida_ate_a = models.PositiveIntegerField(default=0)
+    excluida_ate_b = models.PositiveIntegerField(default=0)
+
+    def outro_participante(self, usuario):
+        return self.usuario_b if self.usuario_a_id == usuario.id else self.usuario_a
+
+    def nao_lidas_para(self, usuario):
+        return self.nao_lidas_a if self.usuario_a_id == usuario.id else self.nao_lidas_b
+
+    def __str__(self):
+        return f"Conversa {self.usuario_a_id} <-> {self.usuario_b_id}"
+
+    class Meta:
+        db_table = 'conversa'
+        verbose_name = 'Conversa'
+        verbose_name_plural = 'Conversas'
+        constraints = [
+            models.UniqueConstraint(fields=['usuario_a', 'usuario_b'], name='conversa_participantes_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['usuario_a', '-atualizada_em'], name='conversa_a_atualizada_idx'),
+            models.Index(fields=['usuario_b', '-atualizada_em'], name='conversa_b_atualizada_idx'),
+        ]
 
 class Mensagem(models.Model):
     id_mensagem = models.AutoField(primary_key=True)
+    conversa = models.ForeignKey(Conversa, on_delete=models.CASCADE, null=True, blank=True, related_name='mensagens')
     remetente = models.ForeignKey(User, on_delete=models.CASCADE, related_name='mensagens_enviadas')
     destinatario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='mensagens_recebidas')
     assunto = models.CharField(max_length=255)
@@ -288,4 +456,86 @@ class Mensagem(models.Model):
     class Meta:
         db_table = 'mensagem'
         verbose_name = 'Mensagem'
-        verbose_name_plural = 'Mensagens'
\ No newline at end of file
+        verbose_name_plural = 'Mensagens'
+        indexes = [
+            models.Index(fields=['conversa', 'id_mensagem'], name='mensagem_conversa_idx'),
+            # Só as não lidas (marcar_lidas e contadores em conversas.py): fica pequeno
+            models.Index(
+                fields=['destinatario', 'conversa'], condition=models.Q(lida=False), name='mensagem_nao_lidas_idx',
+            ),
+        ]
+# Índice invertido da busca de produtos (um termo normalizado por linha, mantido por busca.py)
+class TermoBusca(models.Model):
+    termo = models.CharField(max_length=60)
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='termos_busca')
+    peso = models.FloatField(default=1)
+
+    def __str__(self):
+        return f"{self.termo} -> {self.produto_id}"
+
+    class Meta:
+        db_table = 'termo_busca'
+        verbose_name = 'Termo de Busca'
+        verbose_name_plural = 'Termos de Busca'
+        constraints = [
+            models.UniqueConstraint(fields=['termo', 'produto'], name='termo_busca_termo_produto_uniq'),
+        ]
+
+# Tarefa em segundo plano (fila guardada no banco, executada por tarefas.py / comando executar_tarefas)
+class Tarefa(models.Model):
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('executando', 'Executando'),
+        ('concluida', 'Concluída'),
+        ('falhou', 'Falhou'),
+    ]
+    nome = models.CharField(max_length=100)  # nome registrado com @tarefa
+    argumentos = models.JSONField(default=dict)
+    chave = models.CharField(max_length=255, blank=True, default='')  # evita duplicar a mesma tarefa pendente
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    tentativas = models.PositiveIntegerField(default=0)
+    max_tentativas = models.PositiveIntegerField(default=5)
+    erro = models.TextField(blank=True, default='')
+    executar_em = models.DateTimeField(default=timezone.now)  # próxima execução (atrasada pelo backoff)
+    criada_em = models.DateTimeField(default=timezone.now)
+    atualizada_em = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.nome} ({self.get_status_display()})"
+
+    class Meta:
+        db_table = 'tarefa'
+        verbose_name = 'Tarefa'
+        verbose_name_plural = 'Tarefas'
+        indexes = [
+            models.Index(fields=['status', 'executar_em'], name='tarefa_fila_idx'),
+            models.Index(fields=['nome', 'chave', 'status'], name='tarefa_chave_idx'),
+        ]
+        constraints = [
+            # Uma só tarefa pendente por nome e chave (enfileirar), garantida pelo banco
+            models.UniqueConstraint(
+                fields=['nome', 'chave'], condition=models.Q(status='pendente') & ~models.Q(chave=''),
+                name='tarefa_pendente_chave_uniq',
+            ),
+        ]
+
+
+# Arquivo de mídia gravado por conteúdo (armazenamento.py): um registro por SHA-256
+class BlobMidia(models.Model):
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    nome = models.CharField(max_length=255)  # caminho no storage
+    tamanho = models.PositiveBigIntegerField(default=0)
+    referencias = models.PositiveIntegerField(default=0)  # campos que apontam para o arquivo
+    criado_em = models.DateTimeField(default=timezone.now)
+    atualizado_em = models.DateTimeField(default=timezone.now)  # última mudança de referências
+
+    def __str__(self):
+        return f"{self.nome} ({self.referencias} ref.)"
+
+    class Meta:
+        db_table = 'blob_midia'
+        verbose_name = 'Arquivo de mídia'
+        verbose_name_plural = 'Arquivos de mídia'
+        indexes = [
+            models.Index(fields=['referencias', 'atualizado_em'], name='blob_midia_coleta_idx'),
+        ]
@@ -0,0 +1,178 @@
+"""
+Paginação por cursor (keyset/seek) para listagens grandes
+
+Ao contrário do OFFSET, a próxima página é buscada a partir dos valores de
+ordenação do último item exibido (WHERE (destaque, vendas, id) < (...)),
+então o custo da consulta não cresce com a profundidade da página.
+"""
+import base64
+import bisect
+import json
+import math
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import BooleanField, DecimalField, FloatField, IntegerField, Q
+
+
+def codificar_cursor(valores, direcao='proxima'):
+    """Gera um token opaco (base64 url-safe) a partir dos valores de ordenação"""
+    bruto = json.dumps({'d': direcao, 'v': valores}, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(bruto.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(token):
+    """Lê um token gerado por codificar_cursor; retorna (direcao, valores) ou None se inválido"""
+    if not token:
+        return None
+    try:
+        preenchimento = '=' * (-len(token) % 4)
+        dados = json.loads(base64.urlsafe_b64decode(token + preenchimento))
+        direcao, valores = dados['d'], dados['v']
+    except (ValueError, TypeError, KeyError):
+        return None
+    if direcao not in ('proxima', 'anterior') or not isinstance(valores, list):
+        return None
+    return direcao, valores
+
+
+def tamanho_pagina(request, padrao=None, maximo=None):
+    """Tamanho de página pedido via ?por_pagina=, limitado pelas configurações"""
+    padrao = padrao or getattr(settings, 'CATALOGO_POR_PAGINA', 24)
+    maximo = maximo or getattr(settings, 'CATALOGO_POR_PAGINA_MAXIMO', 96)
+    try:
+        tamanho = int(request.GET.get('por_pagina', padrao))
+    except (TypeError, ValueError):
+        tamanho = padrao
+    return max(1, min(tamanho, maximo))
+
+
+def _filtro_apos(ordenacao, valores, inverter=False):
+    """
+    Monta o Q equivalente a (c1, c2, ..., cn) > (v1, v2, ..., vn) respeitando a
+    direção de cada campo. Com inverter=True monta a comparação contrária (página anterior).
+    """
+    filtro = Q()
+    for i, campo in enumerate(ordenacao):
+        nome = campo.lstrip('-')
+        decrescente = campo.startswith('-') != inverter
+        condicao = Q(**{f'{nome}__{"lt" if decrescente else "gt"}': valores[i]})
+        for anterior, valor in zip(ordenacao[:i], valores[:i]):
+            condicao &= Q(**{anterior.lstrip('-'): valor})
+        filtro |= condicao
+    return filtro
+
+
+def _numero(valor):
+    return isinstance(valor, (int, float)) and not isinstance(valor, bool) and math.isfinite(valor)
+
+
+def _campo(queryset, nome):
+    anotacao = queryset.query.annotations.get(nome)
+    return anotacao.output_field if anotacao is not None else queryset.model._meta.get_field(nome)
+
+
+def _valores_cursor(queryset, ordenacao, valores):
+    """
+    Confere os valores de um cursor com o tipo de cada campo da ordenação. Retorna os
+    valores prontos para o filtro, ou None se o cursor foi adulterado ou é de outra
+    ordenação (trate como cursor ilegível: primeira página).
+    """
+    if len(valores) != len(ordenacao):
+        return None
+    convertidos = []
+    for campo, valor in zip(ordenacao, valores):
+        modelo = _campo(queryset, campo.lstrip('-'))
+        if isinstance(modelo, BooleanField):
+            valido = isinstance(valor, bool)
+        elif isinstance(modelo, IntegerField):  # inclui AutoField
+            valido = _numero(valor) and isinstance(valor, int)
+        elif isinstance(modelo, (FloatField, DecimalField)) and not isinstance(valor, str):
+            valido = _numero(valor)
+        else:
+            # Datas e decimais chegam como texto (codificar_cursor usa str)
+            valido = isinstance(valor, (str, int, float))
+        if not valido:
+            return None
+        try:
+            valor = modelo.to_python(valor)
+            # Faixa do banco (ex: inteiro grande demais para a coluna)
+            modelo.run_validators(valor)
+        except (ValidationError, TypeError, ValueError):
+            return None
+        if valor is None:
+            return None
+        convertidos.append(valor)
+    return convertidos
+
+
+def _valores(obj, ordenacao):
+    return [getattr(obj, campo.lstrip('-')) for campo in ordenacao]
+
+
+def paginar_keyset(queryset, ordenacao, cursor=None, tamanho=24):
+    """
+    Pagina um queryset por keyset.
+
+    ordenacao: campos no formato do order_by (ex: ['-destaque', '-vendas', '-id_produto']);
+    o último campo precisa ser único para servir de desempate.
+    Retorna um dict com 'itens', 'proximo_cursor' e 'cursor_anterior'.
+    """
+    ordenacao = list(ordenacao)
+    dados_cursor = decodificar_cursor(cursor)
+    if dados_cursor:
+        valores = _valores_cursor(queryset, ordenacao, dados_cursor[1])
+        dados_cursor = (dados_cursor[0], valores) if valores is not None else None
+
+    if dados_cursor and dados_cursor[0] == 'anterior':
+        # Percorre a ordenação invertida e desvira o resultado
+        invertida = [c[1:] if c.startswith('-') else f'-{c}' for c in ordenacao]
+        itens = list(
+            queryset.filter(_filtro_apos(ordenacao, dados_cursor[1], inverter=True))
+            .order_by(*invertida)[:tamanho + 1]
+        )
+        tem_anterior = len(itens) > tamanho
+        itens = itens[:tamanho][::-1]
+        tem_proxima = True
+    else:
+        if dados_cursor:
+            queryset = queryset.filter(_filtro_apos(ordenacao, dados_cursor[1]))
+        itens = list(queryset.order_by(*ordenacao)[:tamanho + 1])
+        tem_proxima = len(itens) > tamanho
+        itens = itens[:tamanho]
+        tem_anterior = dados_cursor is not None
+
+    return {
+        'itens': itens,
+        'proximo_cursor': codificar_cursor(_valores(itens[-1], ordenacao)) if itens and tem_proxima else None,
+        'cursor_anterior': codificar_cursor(_valores(itens[0], ordenacao), 'anterior') if itens and tem_anterior else None,
+    }
+
+
+def paginar_lista(chaves, cursor=None, tamanho=24):
+    """
+    Mesma paginação por cursor sobre uma lista já ordenada em memória (ex: produtos
+    por distância em geo.py). Cada chave é uma tupla de ordenação crescente cujo
+    último elemento é o id. Retorna 'itens' (as chaves da página), 'proximo_cursor' e
+    'cursor_anterior'.
+    """
+    dados_cursor = decodificar_cursor(cursor)
+    inicio = 0
+    # Cada valor precisa ser comparável com a chave (número com número), senão o bisect falha
+    if dados_cursor and chaves and len(dados_cursor[1]) == len(chaves[0]) and all(
+        _numero(valor) if _numero(exemplo) else type(valor) is type(exemplo)
+        for exemplo, valor in zip(chaves[0], dados_cursor[1])
+    ):
+        direcao, valores = dados_cursor
+        if direcao == 'anterior':
+            fim = bisect.bisect_left(chaves, tuple(valores))
+            inicio = max(0, fim - tamanho)
+        else:
+            inicio = bisect.bisect_right(chaves, tuple(valores))
+    pagina = chaves[inicio:inicio + tamanho]
+    tem_proxima = inicio + tamanho < len(chaves)
+    return {
+        'itens': pagina,
+        'proximo_cursor': codificar_cursor(list(pagina[-1])) if pagina and tem_proxima else None,
+        'cursor_anterior': codificar_cursor(list(pagina[0]), 'anterior') if pagina and inicio > 0 else None,
+    }
@@ -0,0 +1,88 @@
+"""
+Seções do painel do vendedor (dashboard_perfil) carregadas sob demanda
+
+Cada seção tem sua consulta paginada, já com select_related/prefetch_related,
+o template parcial e um orçamento de consultas SQL. O orçamento é garantido
+pelos testes (OrcamentoConsultasPainelTests em tests.py, com 200 pedidos); em
+produção a view secao_dashboard conta as consultas de cada renderização e
+registra um aviso no log quando uma seção passa dele (sinal de N+1 voltando).
+"""
+import logging
+from contextlib import contextmanager
+
+from django.db import connection
+from django.db.models import Prefetch
+
+logger = logging.getLogger(__name__)
+
+TIPOS_VENDEDOR = ('produtor', 'empresa')
+
+
+def _produtos(perfil):
+    from .models import Produto
+    return (
+        Produto.objects.filter(perfil=perfil)
+        .only('id_produto', 'nome', 'preco', 'estoque', 'descricao', 'imagem', 'imagem_variantes', 'perfil_id')
+        .order_by('-id_produto')
+    )
+
+
+def _pedidos(perfil):
+    from .models import ItemPedido, Pedido
+    return (
+        Pedido.objects.filter(itempedido__produto__perfil=perfil)
+        .distinct()
+        .select_related('usuario')
+        .prefetch_related(
+            Prefetch('itempedido_set', queryset=ItemPedido.objects.select_related('produto').order_by('pk'))
+        )
+        .order_by('-data_pedido', '-id_pedido')
+    )
+
+
+def _certificacoes(perfil):
+    return perfil.certificacoes.select_related('produto').order_by('-id_certificacao')
+
+
+def _avaliacoes(perfil):
+    return perfil.avaliacoes.select_related('usuario').order_by('-data_avaliacao', '-pk')
+
+
+# nome: (consulta, template, itens por página, orçamento de consultas, só para vendedores)
+# O orçamento conta a contagem do paginador, a página e os prefetches.
+SECOES = {
+    'produtos': (_produtos, 'comerciojusto/includes/painel_produtos.html', 12, 2, True),
+    'pedidos': (_pedidos, 'comerciojusto/includes/painel_pedidos.html', 20, 3, True),
+    'certificacoes': (_certificacoes, 'comerciojusto/includes/painel_certificacoes.html', 10, 2, False),
+    'avaliacoes': (_avaliacoes, 'comerciojusto/includes/painel_avaliacoes.html', 10, 2, False),
+}
+
+
+def secoes_do_perfil(perfil):
+    """Nomes das seções visíveis para o tipo do perfil, na ordem do painel"""
+    return [
+        nome for nome, (_, _, _, _, so_vendedor) in SECOES.items()
+        if not so_vendedor or perfil.tipo in TIPOS_VENDEDOR
+    ]
+
+
+@contextmanager
+def contar_consultas():
+    """Conta as consultas SQL executadas no bloco (sem depender de DEBUG)"""
+    contagem = {'total': 0}
+
+    def contar(execute, sql, params, many, context):
+        contagem['total'] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(contar):
+        yield contagem
+
+
+def verificar_orcamento(secao, consultas):
+    orcamento = SECOES[secao][3]
+    if consultas > orcamento:
+        logger.warning(
+            'Seção "%s" do painel usou %d consultas (orçamento: %d)', secao, consultas, orcamento
+        )
+    return consultas <= orcamento
@@ -0,0 +1,78 @@
+"""
+Papéis do usuário (grupos Produtor/Empresa) resolvidos uma vez por request
+
+Os nomes dos grupos do usuário ficam no cache (namespace versionado do usuário)
+e memorizados no próprio objeto user, então checar vários papéis na mesma
+request não consulta o banco de novo. O cache é invalidado pelos signals de
+m2m_changed em User.groups e de alteração/exclusão de Group.
+"""
+from functools import wraps
+
+from django.core.cache import cache
+from django.shortcuts import redirect
+
+from .versoes_cache import chave, invalidar, namespace_usuario
+
+PRODUTOR = 'Produtor'
+EMPRESA = 'Empresa'
+
+# Grupo exigido para cada tipo de Perfil
+GRUPO_POR_TIPO = {
+    'produtor': PRODUTOR,
+    'empresa': EMPRESA,
+}
+
+TEMPO_CACHE_GRUPOS = 600
+
+
+def grupos_do_usuario(user):
+    """Conjunto com os nomes dos grupos do usuário"""
+    if not user.is_authenticated:
+        return frozenset()
+    grupos = getattr(user, '_grupos_cache', None)
+    if grupos is None:
+        cache_key = chave(namespace_usuario(user.pk), 'grupos')
+        grupos = cache.get(cache_key)
+        if grupos is None:
+            grupos = frozenset(user.groups.values_list('name', flat=True))
+            cache.set(cache_key, grupos, TEMPO_CACHE_GRUPOS)
+        user._grupos_cache = grupos
+    return grupos
+
+
+def tem_papel(user, *papeis):
+    """Verifica se o usuário pertence a algum dos grupos informados"""
+    return not grupos_do_usuario(user).isdisjoint(papeis)
+
+
+def pode_acessar_perfil(user, perfil_tipo):
+    """Verifica se o usuário tem acesso ao tipo de perfil especificado (superusuário sempre tem)"""
+    if user.is_superuser:
+        return True
+    grupo = GRUPO_POR_TIPO.get(perfil_tipo)
+    return grupo is not None and tem_papel(user, grupo)
+
+
+def invalidar_grupos(*usuario_ids):
+    """Descarta os grupos em cache dos usuários informados"""
+    for usuario_id in usuario_ids:
+        invalidar(namespace_usuario(usuario_id))
+
+
+def perfil_requerido(view):
+    """
+    Decorator para views do painel: exige request.perfil e acesso ao tipo do perfil.
+    Sem perfil, superusuário/staff vai para o admin e os demais para completar o cadastro.
+    Use depois de @login_required.
+    """
+    @wraps(view)
+    def _view(request, *args, **kwargs):
+        perfil = request.perfil
+        if not perfil:
+            if request.user.is_superuser or request.user.is_staff:
+                return redirect('/admin/')
+            return redirect('completar_cadastro_social')
+        if not pode_acessar_perfil(request.user, perfil.tipo):
+            return redirect('acesso_negado')
+        return view(request, *args, **kwargs)
+    return _view
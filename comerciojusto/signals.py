@@ -0,0 +1,241 @@
+"""
+Signals que mantêm estruturas derivadas (índice de busca, cache etc.) em sincronia com os modelos
+"""
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from django.contrib.auth.models import Group, User
+
+from .models import Avaliacao, Carrinho, Certificacao, Conversa, Mensagem, Perfil, Produto, Produtor
+from . import armazenamento, avaliacoes, conversas, facetas, geo, imagens, papeis, tarefas, tempo_real
+from .versoes_cache import invalidar, namespace_carrinho, namespace_perfil, namespace_produto, namespace_usuario
+
+# Campos que alteram o texto indexado de um produto
+CAMPOS_BUSCA = {'nome', 'descricao', 'categoria'}
+
+
+@receiver(post_save, sender=Produto)
+def indexar_produto_salvo(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    """Reindexa o produto quando um campo pesquisável muda (a exclusão é feita via CASCADE)"""
+    if raw:
+        return
+    if update_fields is not None and not CAMPOS_BUSCA.intersection(update_fields):
+        return
+    # Fora da requisição: a busca pode ficar alguns instantes sem o texto novo
+    tarefas.enfileirar('busca.indexar_produto', chave=str(instance.pk), produto_id=instance.pk)
+
+
+@receiver(post_save, sender=Produto)
+@receiver(post_save, sender=Perfil)
+def gerar_variantes_imagem(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Miniaturas do upload novo em segundo plano (imagens.py)"""
+    campo, campo_variantes = imagens.CAMPOS[sender.__name__]
+    if raw or (update_fields is not None and campo not in update_fields):
+        return
+    if imagens.precisa_gerar(getattr(instance, campo), getattr(instance, campo_variantes)):
+        tarefas.enfileirar('imagens.gerar', chave=f'{sender.__name__}:{instance.pk}', modelo=sender.__name__, pk=instance.pk)
+
+
+@receiver(pre_save, sender=Produto)
+@receiver(pre_save, sender=Perfil)
+@receiver(pre_save, sender=Certificacao)
+def guardar_arquivo_anterior(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Arquivo que um upload novo (ou a remoção) vai substituir, para liberar a referência dele"""
+    campo = armazenamento.CAMPOS[sender.__name__]
+    arquivo = getattr(instance, campo)
+    if raw or instance.pk is None or (update_fields is not None and campo not in update_fields):
+        return
+    if arquivo and arquivo._committed:
+        # Mesmo arquivo: nada muda nas referências
+        return
+    instance._arquivo_anterior = sender.objects.filter(pk=instance.pk).values_list(campo, flat=True).first()
+
+
+@receiver(post_save, sender=Produto)
+@receiver(post_save, sender=Perfil)
+@receiver(post_save, sender=Certificacao)
+def liberar_arquivo_substituido(sender, instance, **kwargs):
+    anterior = instance.__dict__.pop('_arquivo_anterior', None)
+    if anterior:
+        armazenamento.liberar(anterior)
+
+
+@receiver(post_delete, sender=Produto)
+@receiver(post_delete, sender=Perfil)
+@receiver(post_delete, sender=Certificacao)
+def liberar_arquivo_excluido(sender, instance, **kwargs):
+    """O arquivo fica no disco até o limpar_midia (outros registros podem usar o mesmo conteúdo)"""
+    armazenamento.liberar(getattr(instance, armazenamento.CAMPOS[sender.__name__]).name)
+
+
+@receiver(post_save, sender=Certificacao)
+@receiver(post_delete, sender=Certificacao)
+def atualizar_certificacao(sender, instance, raw=False, **kwargs):
+    """Mantém o estado de certificação do produto e do perfil após aprovar/reprovar/excluir (em segundo plano)"""
+    if raw:
+        return
+    tarefas.enfileirar(
+        'certificacoes.atualizar_estado',
+        chave=f'{instance.produto_id}:{instance.perfil_id}',
+        produto_ids=[instance.produto_id],
+        perfil_ids=[instance.perfil_id],
+    )
+
+
+@receiver(pre_save, sender=Avaliacao)
+def guardar_avaliacao_anterior(sender, instance, raw=False, **kwargs):
+    """Guarda as estrelas antigas para ajustar os agregados numa edição"""
+    if raw or instance.pk is None:
+        return
+    instance._anterior = Avaliacao.objects.filter(pk=instance.pk).values('perfil_id', 'estrelas').first()
+
+
+@receiver(post_save, sender=Avaliacao)
+def agregar_avaliacao_salva(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    anterior = getattr(instance, '_anterior', None)
+    if not created and anterior:
+        if (anterior['perfil_id'], anterior['estrelas']) == (instance.perfil_id, instance.estrelas):
+            return
+        avaliacoes.remover_avaliacao(Avaliacao(perfil_id=anterior['perfil_id'], estrelas=anterior['estrelas']))
+    avaliacoes.registrar_avaliacao(instance)
+
+
+@receiver(post_delete, sender=Avaliacao)
+def agregar_avaliacao_excluida(sender, instance, **kwargs):
+    avaliacoes.remover_avaliacao(instance)
+
+
+@receiver(pre_save, sender=Mensagem)
+def vincular_mensagem_conversa(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    conversas.vincular_mensagem(instance)
+
+
+@receiver(post_save, sender=Mensagem)
+def atualizar_conversa_mensagem(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+    conversas.registrar_mensagem(instance)
+    transaction.on_commit(lambda: tempo_real.publicar_mensagem(instance))
+
+
+@receiver(post_delete, sender=Mensagem)
+def atualizar_conversa_exclusao(sender, instance, origin=None, **kwargs):
+    """Recalcula a conversa após excluir mensagens avulsas (não quando a própria conversa/usuário é excluída)"""
+    modelo_origem = getattr(origin, 'model', type(origin))
+    if modelo_origem in (Conversa, User) or instance.conversa_id is None:
+        return
+    conversas.recalcular_conversa(instance.conversa_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidar_cache_usuario(sender, instance, **kwargs):
+    """Dados do usuário e o perfil em cache (que traz o user junto)"""
+    invalidar(namespace_usuario(instance.pk))
+
+
+@receiver(post_save, sender=Perfil)
+def geolocalizar_perfil(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Coordenadas da cidade/estado (tabela local, sem rede) e índice de distância do catálogo"""
+    if raw or (update_fields is not None and not {'cidade', 'estado'}.intersection(update_fields)):
+        return
+    if geo.localizar_perfil(instance):
+        Perfil.objects.filter(pk=instance.pk).update(latitude=instance.latitude, longitude=instance.longitude)
+        geo.invalidar_indice()
+
+
+@receiver(post_delete, sender=Perfil)
+def remover_perfil_indice(sender, instance, **kwargs):
+    if instance.latitude is not None:
+        geo.invalidar_indice()
+
+
+# Campos do usuário exibidos nas páginas públicas do perfil
+CAMPOS_PUBLICOS_USUARIO = {'username', 'first_name', 'last_name', 'email'}
+
+
+@receiver(post_save, sender=User)
+def carimbar_perfil_usuario(sender, instance, created=False, update_fields=None, raw=False, **kwargs):
+    """Nome e e-mail aparecem nos fragmentos do perfil: avança o carimbo e descarta as páginas"""
+    if raw or created or (update_fields is not None and not CAMPOS_PUBLICOS_USUARIO.intersection(update_fields)):
+        return
+    for perfil_id in Perfil.objects.filter(user_id=instance.pk).values_list('pk', flat=True):
+        Perfil.objects.filter(pk=perfil_id).update(atualizado_em=timezone.now())
+        invalidar(namespace_perfil(perfil_id))
+
+
+@receiver(post_save, sender=Perfil)
+@receiver(post_delete, sender=Perfil)
+def invalidar_cache_perfil(sender, instance, **kwargs):
+    """Perfil em cache do usuário e as páginas públicas do perfil (cache_paginas.py)"""
+    invalidar(namespace_usuario(instance.user_id))
+    invalidar(namespace_perfil(instance.pk))
+
+
+@receiver(post_save, sender=Produto)
+@receiver(post_delete, sender=Produto)
+def invalidar_paginas_produto(sender, instance, raw=False, **kwargs):
+    """Páginas em cache do produto e do perfil que lista o produto (cache_paginas.py)"""
+    if raw:
+        return
+    invalidar(namespace_produto(instance.pk))
+    perfil_id = instance.perfil_id
+    if perfil_id is None and instance.produtor_id:
+        perfil_id = Produtor.objects.filter(pk=instance.produtor_id).values_list('perfil_id', flat=True).first()
+    if perfil_id:
+        invalidar(namespace_perfil(perfil_id))
+
+
+@receiver(post_save, sender=Produto)
+@receiver(post_delete, sender=Produto)
+def invalidar_facetas_produto(sender, instance, raw=False, **kwargs):
+    """Contagens das facetas do catálogo (facetas.py)"""
+    if not raw:
+        facetas.invalidar_facetas()
+
+
+@receiver(post_save, sender=Perfil)
+@receiver(post_delete, sender=Perfil)
+def invalidar_facetas_perfil(sender, instance, update_fields=None, raw=False, **kwargs):
+    # A faceta de estado vem do perfil dono do produto
+    if not raw and (update_fields is None or 'estado' in update_fields):
+        facetas.invalidar_facetas()
+
+
+@receiver(post_save, sender=Carrinho)
+@receiver(post_delete, sender=Carrinho)
+def invalidar_cache_carrinho(sender, instance, **kwargs):
+    """Contagem do carrinho em cache (as alterações de itens via carrinho.py invalidam direto)"""
+    invalidar(namespace_carrinho(instance.usuario_id, instance.sessao_id))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidar_grupos_alterados(sender, instance, action, reverse, pk_set, **kwargs):
+    """Grupos do usuário em cache (papeis.py), tanto via user.groups quanto via group.user_set"""
+    if action == 'pre_clear' and reverse:
+        # Depois do clear não há como saber quem estava no grupo
+        instance._membros_removidos = list(instance.user_set.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        usuario_ids = pk_set if action != 'post_clear' else getattr(instance, '_membros_removidos', [])
+    else:
+        usuario_ids = [instance.pk]
+        instance.__dict__.pop('_grupos_cache', None)
+    papeis.invalidar_grupos(*usuario_ids)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalidar_membros_grupo(sender, instance, created=False, **kwargs):
+    """Renomear ou excluir um grupo muda os papéis de todos os membros"""
+    if created:
+        return
+    papeis.invalidar_grupos(*instance.user_set.values_list('pk', flat=True))
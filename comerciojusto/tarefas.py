@@ -0,0 +1,192 @@
+"""
+Tarefas em segundo plano com a fila guardada no banco (modelo Tarefa), sem broker externo
+
+    @tarefa('busca.indexar_produto')
+    def indexar_produto_id(produto_id): ...
+
+    enfileirar('busca.indexar_produto', chave=str(pk), produto_id=pk)
+
+A tarefa é gravada na mesma transação de quem enfileira, então só existe para
+os workers depois do commit. Os workers reivindicam tarefas com um UPDATE
+condicional (como os eventos do Stripe em payments/ingestao.py); em caso de
+erro a tarefa volta para a fila com espera exponencial até max_tentativas.
+
+Sem worker rodando (desenvolvimento), TAREFAS_EM_THREAD executa a fila numa
+thread do próprio processo após o commit; retentativas e tarefas com atraso só
+rodam na próxima drenagem. Em produção use False e rode
+python manage.py executar_tarefas --continuo.
+"""
+import logging
+import random
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+MAX_TENTATIVAS = 5
+ESPERA_BASE = 10  # segundos antes da 2ª tentativa; dobra a cada falha
+ESPERA_MAXIMA = 3600
+# Tarefa "executando" há mais tempo que isso é de um worker que morreu: volta para a fila
+TEMPO_REIVINDICACAO = timedelta(minutes=10)
+THREADS_NO_PROCESSO = 2
+
+_registro = {}
+_trava = threading.Lock()
+_no_processo = {'executor': None, 'agendado': False}
+
+
+def tarefa(nome, max_tentativas=MAX_TENTATIVAS):
+    """Registra a função como tarefa; os argumentos precisam ser serializáveis em JSON"""
+    def registrar(funcao):
+        _registro[nome] = (funcao, max_tentativas)
+        return funcao
+    return registrar
+
+
+def enfileirar(nome, chave='', atraso=0, **argumentos):
+    """
+    Enfileira a tarefa `nome` para rodar daqui a `atraso` segundos. Com `chave`, não
+    cria outra se já houver uma pendente com o mesmo nome e chave (retorna None); a
+    restrição única tarefa_pendente_chave_uniq garante isso entre processos.
+    """
+    from .models import Tarefa
+
+    if nome not in _registro:
+        raise LookupError(f'Tarefa não registrada: {nome}')
+    if chave and Tarefa.objects.filter(nome=nome, chave=chave, status='pendente').exists():
+        return None
+    try:
+        with transaction.atomic():
+            nova = Tarefa.objects.create(
+                nome=nome,
+                argumentos=argumentos,
+                chave=chave,
+                max_tentativas=_registro[nome][1],
+                executar_em=timezone.now() + timedelta(seconds=atraso),
+            )
+    except IntegrityError:
+        # Outra requisição enfileirou a mesma chave entre a consulta e o INSERT
+        return None
+    if getattr(settings, 'TAREFAS_EM_THREAD', True) and not atraso:
+        transaction.on_commit(_agendar_no_processo)
+    return nova
+
+
+def espera(tentativas):
+    """Segundos até a próxima tentativa: exponencial com variação aleatória, para não sincronizar falhas"""
+    return min(ESPERA_BASE * 2 ** (tentativas - 1), ESPERA_MAXIMA) * random.uniform(0.5, 1.0)
+
+
+def _fila(agora):
+    return (
+        Q(status='pendente', executar_em__lte=agora)
+        | Q(status='executando', atualizada_em__lt=agora - TEMPO_REIVINDICACAO)
+    )
+
+
+def reivindicar(limite=10):
+    """Marca até `limite` tarefas vencidas como 'executando' para este worker e as retorna"""
+    from .models import Tarefa
+
+    agora = timezone.now()
+    ids = list(
+        Tarefa.objects.filter(_fila(agora)).order_by('executar_em').values_list('pk', flat=True)[:limite]
+    )
+    if not ids:
+        return []
+    # O horário do UPDATE serve de marca: cada worker só leva as que ele próprio trocou
+    marca = timezone.now()
+    Tarefa.objects.filter(_fila(agora), pk__in=ids).update(status='executando', atualizada_em=marca)
+    return list(Tarefa.objects.filter(pk__in=ids, status='executando', atualizada_em=marca).order_by('executar_em'))
+
+
+def executar(registro):
+    """Executa uma tarefa já reivindicada; retorna o status final"""
+    funcao, _ = _registro.get(registro.nome, (None, 0))
+    registro.tentativas += 1
+    try:
+        if funcao is None:
+            raise LookupError(f'Tarefa não registrada: {registro.nome}')
+        with transaction.atomic():
+            funcao(**registro.argumentos)
+    except Exception as e:
+        logger.exception('Falha na tarefa %s (%s)', registro.nome, registro.pk)
+        registro.erro = ''.join(traceback.format_exception_only(e)).strip()
+        if registro.tentativas >= registro.max_tentativas:
+            registro.status = 'falhou'
+        else:
+            registro.status = 'pendente'
+            registro.executar_em = timezone.now() + timedelta(seconds=espera(registro.tentativas))
+    else:
+        registro.status = 'concluida'
+        registro.erro = ''
+    registro.atualizada_em = timezone.now()
+    campos = ['status', 'tentativas', 'erro', 'executar_em', 'atualizada_em']
+    try:
+        with transaction.atomic():
+            registro.save(update_fields=campos)
+    except IntegrityError:
+        # Enquanto esta executava, a mesma chave foi enfileirada de novo: a pendente
+        # nova já refaz o trabalho, então esta não volta para a fila
+        registro.status = 'falhou'
+        registro.erro += '\n(retentativa descartada: já há uma tarefa pendente com a mesma chave)'
+        registro.save(update_fields=campos)
+    return registro.status
+
+
+def iniciar_processo_filho():
+    """Initializer de pools de processos: com fork o Django já vem configurado, com spawn/forkserver precisa do setup"""
+    import django
+    django.setup()
+    connections.close_all()
+
+
+def executar_por_id(tarefa_id):
+    """Ponto de entrada dos pools do comando executar_tarefas (threads ou processos)"""
+    from .models import Tarefa
+
+    close_old_connections()
+    try:
+        return executar(Tarefa.objects.get(pk=tarefa_id))
+    finally:
+        close_old_connections()
+
+
+def executar_pendentes(limite=10):
+    """Reivindica e executa um lote neste thread; retorna quantas tarefas rodaram"""
+    lote = reivindicar(limite)
+    for registro in lote:
+        executar(registro)
+    return len(lote)
+
+
+def _drenar():
+    with _trava:
+        _no_processo['agendado'] = False
+    try:
+        while executar_pendentes():
+            pass
+    except Exception:
+        logger.exception('Falha ao executar a fila de tarefas no processo')
+    finally:
+        connections.close_all()
+
+
+def _agendar_no_processo():
+    # Vários enfileiramentos seguidos viram uma só drenagem da fila
+    with _trava:
+        if _no_processo['agendado']:
+            return
+        _no_processo['agendado'] = True
+        if _no_processo['executor'] is None:
+            _no_processo['executor'] = ThreadPoolExecutor(
+                max_workers=THREADS_NO_PROCESSO, thread_name_prefix='tarefas'
+            )
+    _no_processo['executor'].submit(_drenar)
@@ -0,0 +1,45 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from ..imagens import FORMATOS, nome_variante, variantes_atuais
+
+register = template.Library()
+
+TIPOS = {extensao: tipo for extensao, _, tipo, _ in FORMATOS}
+
+
+def _srcset(variantes, extensao):
+    return ', '.join(
+        f"{default_storage.url(nome_variante(variantes['nome'], largura, extensao))} {largura}w"
+        for largura in variantes['larguras']
+    )
+
+
+@register.simple_tag
+def imagem_responsiva(arquivo, variantes, sizes='100vw', alt='', classe='', carregamento='lazy'):
+    """
+    <picture> com as variantes AVIF/WebP e o JPEG reduzido de fallback, para o navegador
+    escolher a largura pelo `sizes`. Sem variantes geradas ainda, <img> com o original.
+
+        {% imagem_responsiva produto.imagem produto.imagem_variantes sizes="(max-width: 576px) 100vw, 350px" alt=produto.nome %}
+    """
+    if not arquivo:
+        return ''
+    variantes = variantes_atuais(arquivo, variantes)
+    if not variantes:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}" decoding="async">',
+            arquivo.url, alt, classe, carregamento,
+        )
+
+    fontes = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((TIPOS[extensao], _srcset(variantes, extensao), sizes) for extensao in variantes['formatos'] if extensao != 'jpg'),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="{}" decoding="async"></picture>',
+        fontes,
+        default_storage.url(nome_variante(variantes['nome'], variantes['larguras'][0], 'jpg')),
+        _srcset(variantes, 'jpg'), sizes, alt, classe, carregamento,
+    )
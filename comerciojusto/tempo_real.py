@@ -0,0 +1,191 @@
+"""
+Entrega de eventos em tempo real (novas mensagens, contagem de não lidas)
+
+As views publicam eventos por usuário num broker; a view assíncrona `eventos`
+(Server-Sent Events, servida pelo ASGI) repassa ao navegador. O broker é
+configurável em settings.TEMPO_REAL_BROKER; o padrão BrokerMemoria funciona
+dentro de um único processo, sem Redis. Com vários workers, troque por um broker
+que distribua entre processos implementando a mesma interface.
+
+Publicar só monta o evento (e consulta a contagem de não lidas) se o broker diz
+que o usuário tem conexão aberta (tem_assinantes): no WSGI ninguém assina e cada
+mensagem nova não custa nenhuma consulta a mais.
+"""
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Eventos acumulados por conexão antes de descartar os mais antigos (cliente lento)
+TAMANHO_FILA = 100
+
+# Comentário enviado periodicamente para manter a conexão aberta em proxies
+INTERVALO_HEARTBEAT = 20
+
+# Espera sugerida ao navegador antes de reconectar (ms)
+RECONEXAO_MS = 3000
+
+
+class Assinatura:
+    """Fila de eventos de uma conexão; consumida com `await assinatura.proximo(timeout)`"""
+
+    def __init__(self, broker, usuario_id, loop):
+        self.broker = broker
+        self.usuario_id = usuario_id
+        self.loop = loop
+        self.fila = asyncio.Queue(maxsize=TAMANHO_FILA)
+
+    def entregar(self, evento):
+        # Executado no loop da conexão (via call_soon_threadsafe)
+        if self.fila.full():
+            self.fila.get_nowait()
+        self.fila.put_nowait(evento)
+
+    async def proximo(self, timeout=None):
+        """Próximo evento, ou None se o timeout expirar"""
+        try:
+            return await asyncio.wait_for(self.fila.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def cancelar(self):
+        self.broker.cancelar(self)
+
+
+class BrokerBase:
+    """Interface dos brokers de tempo real"""
+
+    def assinar(self, usuario_id):
+        """Registra uma conexão do usuário (chamado de dentro do loop asyncio)"""
+        raise NotImplementedError
+
+    def cancelar(self, assinatura):
+        raise NotImplementedError
+
+    def publicar(self, usuario_id, evento):
+        """Envia um evento (dict serializável em JSON) a todas as conexões do usuário; thread-safe"""
+        raise NotImplementedError
+
+    def tem_assinantes(self, usuario_id):
+        """
+        Se vale a pena montar um evento para o usuário (há conexão aberta). Brokers
+        entre processos que não sabem responder barato devem retornar True.
+        """
+        return True
+
+    def total_conexoes(self):
+        raise NotImplementedError
+
+
+class BrokerMemoria(BrokerBase):
+    """Broker em memória do processo: cada conexão tem uma asyncio.Queue no seu loop"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._assinaturas = {}
+
+    def assinar(self, usuario_id):
+        assinatura = Assinatura(self, usuario_id, asyncio.get_running_loop())
+        with self._lock:
+            self._assinaturas.setdefault(usuario_id, set()).add(assinatura)
+        return assinatura
+
+    def cancelar(self, assinatura):
+        with self._lock:
+            conjunto = self._assinaturas.get(assinatura.usuario_id)
+            if conjunto:
+                conjunto.discard(assinatura)
+                if not conjunto:
+                    del self._assinaturas[assinatura.usuario_id]
+
+    def publicar(self, usuario_id, evento):
+        with self._lock:
+            destinos = list(self._assinaturas.get(usuario_id, ()))
+        for assinatura in destinos:
+            try:
+                assinatura.loop.call_soon_threadsafe(assinatura.entregar, evento)
+            except RuntimeError:
+                # Loop já encerrado: conexão morta que ainda não foi cancelada
+                self.cancelar(assinatura)
+        return len(destinos)
+
+    def tem_assinantes(self, usuario_id):
+        with self._lock:
+            return usuario_id in self._assinaturas
+
+    def total_conexoes(self):
+        with self._lock:
+            return sum(len(conjunto) for conjunto in self._assinaturas.values())
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def obter_broker():
+    """Instância única do broker configurado em settings.TEMPO_REAL_BROKER"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                caminho = getattr(settings, 'TEMPO_REAL_BROKER', 'comerciojusto.tempo_real.BrokerMemoria')
+                _broker = import_string(caminho)()
+    return _broker
+
+
+def _dados_mensagem(mensagem, usuario_id):
+    enviada = mensagem.remetente_id == usuario_id
+    return {
+        'tipo': 'mensagem',
+        'id': mensagem.id_mensagem,
+        'outro_usuario_id': mensagem.destinatario_id if enviada else mensagem.remetente_id,
+        'assunto': mensagem.assunto,
+        'corpo': mensagem.corpo,
+        'criada_em': mensagem.criada_em.isoformat(),
+        'enviada': enviada,
+    }
+
+
+def publicar_mensagem(mensagem):
+    """
+    Entrega a mensagem nova às conexões dos dois participantes, com o total de não lidas
+    do destinatário. Sem conexão aberta (o caso comum no WSGI) não consulta o banco.
+    """
+    from .conversas import total_nao_lidas
+
+    broker = obter_broker()
+    if broker.tem_assinantes(mensagem.destinatario_id):
+        evento = _dados_mensagem(mensagem, mensagem.destinatario_id)
+        evento['nao_lidas'] = total_nao_lidas(mensagem.destinatario_id)
+        broker.publicar(mensagem.destinatario_id, evento)
+    if mensagem.remetente_id != mensagem.destinatario_id and broker.tem_assinantes(mensagem.remetente_id):
+        broker.publicar(mensagem.remetente_id, _dados_mensagem(mensagem, mensagem.remetente_id))
+
+
+def publicar_nao_lidas(usuario_id):
+    """Avisa as conexões do usuário que a contagem de não lidas mudou (só se houver alguma)"""
+    from .conversas import total_nao_lidas
+
+    broker = obter_broker()
+    if broker.tem_assinantes(usuario_id):
+        broker.publicar(usuario_id, {'tipo': 'nao_lidas', 'nao_lidas': total_nao_lidas(usuario_id)})
+
+
+def formatar_evento(evento):
+    """Serializa um evento no formato text/event-stream"""
+    return f"event: {evento['tipo']}\ndata: {json.dumps(evento)}\n\n"
+
+
+async def fluxo_eventos(usuario_id, broker=None):
+    """Gerador assíncrono do corpo da resposta SSE; a assinatura é cancelada quando o cliente desconecta"""
+    broker = broker or obter_broker()
+    assinatura = broker.assinar(usuario_id)
+    try:
+        yield f'retry: {RECONEXAO_MS}\n\n'
+        while True:
+            evento = await assinatura.proximo(timeout=INTERVALO_HEARTBEAT)
+            yield ': ping\n\n' if evento is None else formatar_evento(evento)
+    finally:
+        assinatura.cancelar()
@@ -1,3 +1,1348 @@
-from django.test import TestCase
+import asyncio
+import os
+import random
+import stat
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group, User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models.query import QuerySet
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    armazenamento, avaliacoes, busca, carrinho, certificacoes, conversas, estoque, facetas, geo, imagens,
+    middleware, painel, papeis, tarefas, tempo_real,
+)
+from .cache_camadas import CacheEmCamadas
+from .management.commands.benchmark_indices import INDICES as BENCHMARK_INDICES
+from .models import (
+    Avaliacao, BlobMidia, Carrinho, Certificacao, ItemCarrinho, ItemPedido, Mensagem, Pedido, Perfil, Produto,
+    Produtor, ReservaEstoque, Tarefa,
+)
+from .paginacao import codificar_cursor, paginar_keyset, paginar_lista
+from .papeis import EMPRESA, PRODUTOR
+from .tarefas import tarefa
+from .templatetags import midia
+from .versoes_cache import invalidar, namespace_produto
+from .views import ORDENACAO_CATALOGO
+
+CACHE_TESTES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# Tarefas da fila usadas pelos testes de tarefas.py
+EXECUTADAS = []
+
+
+@tarefa('testes.registrar', max_tentativas=3)
+def registrar_execucao(valor):
+    EXECUTADAS.append(valor)
+
+
+@tarefa('testes.falhar', max_tentativas=2)
+def falhar():
+    raise RuntimeError('falha de teste')
+
+
+@override_settings(CACHES=CACHE_TESTES, TAREFAS_EM_THREAD=False)
+class TesteBase(TestCase):
+    """Cache em memória, limpo a cada teste, e fila de tarefas sem a thread do processo"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+
+class OrcamentoConsultasPainelTests(TesteBase):
+    """Cada seção do painel cabe no orçamento de consultas de painel.SECOES, com volume de vendedor real"""
+
+    # Sessão e usuário da requisição autenticada; perfil e papéis vêm do cache depois da primeira
+    CONSULTAS_AUTENTICACAO = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendedor = User.objects.create_user('vendedor', password='senha')
+        cls.vendedor.groups.add(Group.objects.get_or_create(name=PRODUTOR)[0])
+        perfil = Perfil.objects.create(user=cls.vendedor, tipo='produtor')
+        produtos = Produto.objects.bulk_create([
+            Produto(nome=f'Produto {i}', preco=10 + i, estoque=100, perfil=perfil) for i in range(30)
+        ])
+        compradores = User.objects.bulk_create([User(username=f'comprador{i}') for i in range(20)])
+        pedidos = Pedido.objects.bulk_create([Pedido(usuario=compradores[i % 20]) for i in range(200)])
+        ItemPedido.objects.bulk_create([
+            ItemPedido(pedido=pedido, produto=produtos[(i * 3 + j) % 30], quantidade=j + 1)
+            for i, pedido in enumerate(pedidos) for j in range(4)
+        ])
+        Certificacao.objects.bulk_create([
+            Certificacao(perfil=perfil, produto=produtos[i], status='aprovada') for i in range(15)
+        ])
+        Avaliacao.objects.bulk_create([
+            Avaliacao(perfil=perfil, usuario=compradores[i], estrelas=1 + i % 5) for i in range(20)
+        ])
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.vendedor)
+
+    def test_secoes_dentro_do_orcamento(self):
+        for secao, (_, _, _, orcamento, _) in painel.SECOES.items():
+            with self.subTest(secao=secao):
+                url = reverse('secao_dashboard', args=[secao])
+                self.assertEqual(self.client.get(url).status_code, 200)
+                for pagina in ('1', '2'):
+                    with self.assertNumQueries(orcamento + self.CONSULTAS_AUTENTICACAO):
+                        resposta = self.client.get(url, {'pagina': pagina})
+                    self.assertEqual(resposta.status_code, 200)
+
+
+class PaginacaoCursorTests(TesteBase):
+    """Os cursores de paginacao.py percorrem o catálogo nos dois sentidos sem repetir nem pular itens"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Empates de destaque e vendas: o desempate fica com o id
+        Produto.objects.bulk_create([
+            Produto(nome=f'Produto {i}', destaque=i % 7 == 0, vendas=i % 4) for i in range(30)
+        ])
+        cls.esperado = list(Produto.objects.order_by(*ORDENACAO_CATALOGO).values_list('pk', flat=True))
+
+    def _pagina(self, cursor=None):
+        return paginar_keyset(Produto.objects.all(), ORDENACAO_CATALOGO, cursor, tamanho=7)
+
+    def test_ida_e_volta(self):
+        paginas = [self._pagina()]
+        self.assertIsNone(paginas[0]['cursor_anterior'])
+        while paginas[-1]['proximo_cursor']:
+            paginas.append(self._pagina(paginas[-1]['proximo_cursor']))
+
+        vistos = [produto.pk for pagina in paginas for produto in pagina['itens']]
+        self.assertEqual(vistos, self.esperado)
+        self.assertEqual([len(pagina['itens']) for pagina in paginas], [7, 7, 7, 7, 2])
+
+        # Voltando pelo cursor_anterior cada página é a mesma da ida
+        for i in range(len(paginas) - 1, 0, -1):
+            anterior = self._pagina(paginas[i]['cursor_anterior'])
+            self.assertEqual(anterior['itens'], paginas[i - 1]['itens'])
+            self.assertIsNotNone(anterior['proximo_cursor'])
+        self.assertIsNone(self._pagina(paginas[1]['cursor_anterior'])['cursor_anterior'])
+
+    def test_cursor_invalido_volta_ao_inicio(self):
+        self.assertEqual(self._pagina('nao-e-um-cursor')['itens'], self._pagina()['itens'])
+
+
+class CursorAdulteradoTests(TesteBase):
+    """Cursor forjado no ?cursor= vale como ilegível: primeira página, nunca erro 500"""
+
+    FORJADOS = [
+        [None, None, None],
+        ['a', 'b', 'c'],
+        [True, 'abc', 1],
+        [True, 1, 10 ** 30],
+        [1, 2, 3],
+        [True, 1.5, 2],
+        [True, [1], {'a': 1}],
+        [True, 1],
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        perfil = Perfil.objects.create(user=User.objects.create_user('vendedor'), tipo='produtor')
+        Produto.objects.bulk_create([
+            Produto(nome=f'Café {i}', perfil=perfil, vendas=i) for i in range(5)
+        ])
+
+    def setUp(self):
+        super().setUp()
+
+    def test_paginar_keyset(self):
+        primeira = paginar_keyset(Produto.objects.all(), ORDENACAO_CATALOGO, tamanho=2)
+        for valores in self.FORJADOS:
+            for direcao in ('proxima', 'anterior'):
+                with self.subTest(valores=valores, direcao=direcao):
+                    pagina = paginar_keyset(
+                        Produto.objects.all(), ORDENACAO_CATALOGO, codificar_cursor(valores, direcao), tamanho=2
+                    )
+                    self.assertEqual(pagina['itens'], primeira['itens'])
+                    self.assertIsNone(pagina['cursor_anterior'])
+
+    def test_paginar_lista(self):
+        chaves = [(float(i), -i, i) for i in range(5)]
+        # [1, 2, 3] é um cursor válido para a lista (só números)
+        for valores in [v for v in self.FORJADOS if v != [1, 2, 3]] + [['1.0', -1, 1]]:
+            with self.subTest(valores=valores):
+                pagina = paginar_lista(chaves, codificar_cursor(valores), tamanho=2)
+                self.assertEqual(pagina['itens'], chaves[:2])
+
+    def test_catalogo_e_busca(self):
+        for valores in self.FORJADOS + [['x', 1], [float('nan'), 1]]:
+            cursor = codificar_cursor(valores)
+            for parametros in ({'cursor': cursor}, {'cursor': cursor, 'pesquisa': 'cafe'}):
+                with self.subTest(parametros=parametros, valores=valores):
+                    self.assertEqual(self.client.get(reverse('index'), parametros).status_code, 200)
+
+
+class SomaCarrinhoTests(TesteBase):
+    """carrinho._somar não perde quantidade quando outra requisição insere a mesma linha antes"""
+
+    def setUp(self):
+        super().setUp()
+        self.carrinho = Carrinho.objects.create(sessao_id='sessao-teste')
+        self.produto = Produto.objects.create(nome='Café', preco=20)
+
+    def test_soma_na_linha_existente(self):
+        carrinho._somar(self.carrinho.pk, self.produto.pk, 2, self.produto.preco)
+        carrinho._somar(self.carrinho.pk, self.produto.pk, 3, self.produto.preco)
+        self.assertEqual(ItemCarrinho.objects.get(carrinho=self.carrinho).quantidade, 5)
+
+    def test_corrida_no_insert(self):
+        update = QuerySet.update
+        chamadas = []
+
+        def update_concorrente(queryset, **kwargs):
+            chamadas.append(kwargs)
+            if len(chamadas) == 1:
+                # A outra requisição insere a linha entre o nosso UPDATE e o INSERT
+                ItemCarrinho.objects.create(
+                    carrinho=self.carrinho, produto=self.produto, quantidade=4, preco=self.produto.preco
+                )
+                return 0
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=update_concorrente):
+            carrinho._somar(self.carrinho.pk, self.produto.pk, 3, self.produto.preco)
+
+        self.assertEqual(len(chamadas), 2)
+        self.assertEqual(ItemCarrinho.objects.get(carrinho=self.carrinho).quantidade, 7)
+
+
+class PrecificacaoCarrinhoTests(TesteBase):
+    """Uma consulta para o carrinho inteiro, com o preço atual e os avisos de mudança"""
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = User.objects.create_user('comprador', password='senha')
+        self.carrinho = Carrinho.objects.create(usuario=self.usuario)
+        self.produtos = [Produto.objects.create(nome=f'Produto {i}', preco=10 + i) for i in range(5)]
+        for produto in self.produtos:
+            carrinho.adicionar_item(self.carrinho, produto, quantidade=2)
+
+    def test_uma_consulta(self):
+        with self.assertNumQueries(1):
+            precificacao = carrinho.precificar_carrinho(self.carrinho)
+        self.assertEqual(len(precificacao['itens']), 5)
+        self.assertEqual(precificacao['total'], Decimal('120.00'))
+        self.assertEqual((precificacao['precos_alterados'], precificacao['indisponiveis']), ([], []))
+
+    def test_preco_alterado_e_indisponivel(self):
+        alterado, inativo = self.produtos[0], self.produtos[1]
+        Produto.objects.filter(pk=alterado.pk).update(preco=Decimal('12.50'))
+        Produto.objects.filter(pk=inativo.pk).update(ativo=False)
+
+        precificacao = carrinho.precificar_carrinho(self.carrinho)
+        self.assertEqual([linha['produto'] for linha in precificacao['precos_alterados']], [alterado])
+        self.assertEqual([linha['produto'] for linha in precificacao['indisponiveis']], [inativo])
+        linha = precificacao['precos_alterados'][0]
+        self.assertEqual((linha['preco_carrinho'], linha['preco'], linha['subtotal']), (10, Decimal('12.50'), 25))
+        # Vale o preço atual; o produto inativo fica fora do total
+        self.assertEqual(precificacao['total'], Decimal('25.00') + 2 * (12 + 13 + 14))
+
+        self.client.force_login(self.usuario)
+        resposta = self.client.get(reverse('visualizar_carrinho'))
+        self.assertContains(resposta, 'O preço de 1 produto mudou')
+        self.assertContains(resposta, 'Alguns produtos não estão mais disponíveis')
+        self.assertEqual(resposta.context['total'], precificacao['total'])
+
+    def test_centavos(self):
+        self.assertEqual(carrinho.centavos(Decimal('12.345')), 1234)
+        self.assertEqual(carrinho.centavos('0.1'), 10)
+        self.assertEqual(carrinho.centavos(Decimal('19.99') * 3), 5997)
+
+
+class ReservaEstoqueTests(TesteBase):
+    """estoque.reservar reserva tudo ou nada"""
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = User.objects.create_user('comprador', password='senha')
+        self.cafe = Produto.objects.create(nome='Café', preco=20, estoque=5)
+        self.mel = Produto.objects.create(nome='Mel', preco=30, estoque=1)
+        self.cacau = Produto.objects.create(nome='Cacau', preco=15)  # sem controle de estoque
+
+    def _estoques(self):
+        return dict(Produto.objects.values_list('pk', 'estoque'))
+
+    def test_reserva(self):
+        referencia = estoque.reservar(self.usuario, [(self.cafe.pk, 2), (self.cafe.pk, 1), (self.cacau.pk, 9)])
+        self.assertEqual(self._estoques(), {self.cafe.pk: 2, self.mel.pk: 1, self.cacau.pk: None})
+        self.assertEqual(
+            list(ReservaEstoque.objects.filter(referencia=referencia).values_list('produto_id', 'quantidade')),
+            [(self.cafe.pk, 3)],
+        )
+
+    def test_estoque_insuficiente(self):
+        antes = self._estoques()
+        # O café cabe e é baixado primeiro; a falta do mel desfaz tudo
+        with self.assertRaises(estoque.EstoqueInsuficiente) as erro:
+            estoque.reservar(self.usuario, [(self.cafe.pk, 2), (self.mel.pk, 2), (self.cacau.pk, 1)])
+        self.assertEqual((erro.exception.produto_id, erro.exception.quantidade), (self.mel.pk, 2))
+        self.assertEqual(self._estoques(), antes)
+        self.assertFalse(ReservaEstoque.objects.exists())
+
+
+class CachePaginasTests(TesteBase):
+    """A página pública fica em cache até o namespace dela ser invalidado (versoes_cache)"""
+
+    def setUp(self):
+        super().setUp()
+        perfil = Perfil.objects.create(user=User.objects.create_user('vendedor'), tipo='produtor')
+        self.produto = Produto.objects.create(nome='Café do sítio', preco=20, perfil=perfil)
+        self.url = reverse('detalhes_produto', args=[self.produto.pk])
+
+    def test_invalidar_descarta_a_pagina(self):
+        self.assertContains(self.client.get(self.url), 'Café do sítio')
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(self.url), 'Café do sítio')
+
+        # UPDATE direto não dispara signals: a página em cache continua valendo
+        Produto.objects.filter(pk=self.produto.pk).update(nome='Café torrado')
+        self.assertContains(self.client.get(self.url), 'Café do sítio')
+
+        invalidar(namespace_produto(self.produto.pk))
+        resposta = self.client.get(self.url)
+        self.assertContains(resposta, 'Café torrado')
+        self.assertNotContains(resposta, 'Café do sítio')
+
+    def test_signal_do_produto_invalida(self):
+        self.client.get(self.url)
+        self.produto.nome = 'Café torrado'
+        self.produto.save()
+        self.assertContains(self.client.get(self.url), 'Café torrado')
+
+    def test_parametro_desconhecido_nao_entra_no_cache(self):
+        self.client.get(self.url)
+        for i in range(3):
+            with self.assertNumQueries(0):
+                self.client.get(self.url)
+            # Fora da lista da view: sempre renderiza, e não guarda uma cópia
+            Produto.objects.filter(pk=self.produto.pk).update(nome=f'Café {i}')
+            self.assertContains(self.client.get(self.url, {'x': i}), f'Café {i}')
+        self.assertContains(self.client.get(self.url), 'Café do sítio')
+
+    def test_catalogo_chaveado_pelos_parametros_lidos(self):
+        url = reverse('index')
+        self.client.get(url, {'pesquisa': 'cafe', 'categoria': 'cafe'})
+        # Mesmos parâmetros em outra ordem: mesma página em cache
+        with self.assertNumQueries(0):
+            self.client.get(f'{url}?categoria=cafe&pesquisa=cafe')
+        with self.assertNumQueries(0):
+            self.client.get(url, {'pesquisa': 'cafe', 'categoria': 'cafe'})
+        self.assertGreater(self._consultas(url, {'pesquisa': 'cafe', 'categoria': 'cafe', 'utm': '1'}), 0)
+        self.assertGreater(self._consultas(url, {'pesquisa': 'cafe', 'categoria': 'cafe', 'utm': '1'}), 0)
+
+    def _consultas(self, url, parametros):
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self.client.get(url, parametros).status_code, 200)
+        return len(consultas)
+
+
+class PermissoesCacheTests(TesteBase):
+    """O diretório do cache em arquivo e as travas só são acessíveis pelo dono do processo"""
+
+    def test_diretorios_e_travas_privados(self):
+        with tempfile.TemporaryDirectory() as base:
+            local = os.path.join(base, 'cache')
+            os.makedirs(local, 0o777)
+            os.chmod(local, 0o777)  # criado antes, aberto demais
+            cache_arquivo = CacheEmCamadas(local, {})
+            cache_arquivo.add('chave', 1)
+
+            travas = cache_arquivo.travas.diretorio
+            self.assertEqual(stat.S_IMODE(os.stat(local).st_mode), 0o700)
+            self.assertEqual(stat.S_IMODE(os.stat(travas).st_mode), 0o700)
+            with cache_arquivo.travas.segurando('teste'):
+                trava, = [nome for nome in os.listdir(travas) if nome.endswith('.trava')]
+                self.assertEqual(stat.S_IMODE(os.stat(os.path.join(travas, trava)).st_mode), 0o600)
+
+
+class AgregadosAvaliacaoTests(TesteBase):
+    """Os agregados incrementais do Perfil batem com reconciliar_avaliacoes"""
+
+    def setUp(self):
+        super().setUp()
+        self.perfil = Perfil.objects.create(user=User.objects.create_user('vendedor'), tipo='produtor')
+        self.compradores = [User.objects.create_user(f'comprador{i}') for i in range(6)]
+
+    def _agregados(self):
+        return Perfil.objects.values(*avaliacoes.CAMPOS_AGREGADOS).get(pk=self.perfil.pk)
+
+    def test_incremental_igual_reconciliado(self):
+        criadas = [
+            Avaliacao.objects.create(perfil=self.perfil, usuario=comprador, estrelas=estrelas)
+            for comprador, estrelas in zip(self.compradores, [5, 4, 4, 1, 3, 2])
+        ]
+        criadas[0].delete()
+        criadas[3].delete()
+        incremental = self._agregados()
+        self.assertEqual(incremental['total_avaliacoes'], 4)
+        self.assertEqual(incremental['soma_avaliacoes'], 13)
+
+        avaliacoes.reconciliar_avaliacoes()
+        self.assertEqual(self._agregados(), incremental)
+
+        # Exclusão pelo queryset também passa pelo post_delete; sem avaliações volta à média padrão
+        Avaliacao.objects.all().delete()
+        incremental = self._agregados()
+        avaliacoes.reconciliar_avaliacoes()
+        self.assertEqual(self._agregados(), incremental)
+        self.assertEqual(incremental['total_avaliacoes'], 0)
+
+    def test_estrelas_fora_da_faixa(self):
+        produto = Produto.objects.create(nome='Mel', preco=30, perfil=self.perfil)
+        self.client.force_login(self.compradores[0])
+        for estrelas in ('0', '6', '9', 'x'):
+            with self.subTest(estrelas=estrelas):
+                resposta = self.client.post(
+                    reverse('detalhes_produto', args=[produto.pk]), {'estrelas': estrelas}
+                )
+                self.assertEqual(resposta.status_code, 200)
+        self.assertFalse(Avaliacao.objects.exists())
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Avaliacao.objects.create(perfil=self.perfil, usuario=self.compradores[0], estrelas=9)
+
+
+class LogoPainelTests(TesteBase):
+    """Logo recusado no upload volta para o painel com o motivo, sem fingir que salvou"""
+
+    def setUp(self):
+        super().setUp()
+        self.vendedor = User.objects.create_user('vendedor', password='senha')
+        self.vendedor.groups.add(Group.objects.get_or_create(name=PRODUTOR)[0])
+        self.perfil = Perfil.objects.create(user=self.vendedor, tipo='produtor')
+        self.client.force_login(self.vendedor)
+
+    def test_logo_com_tipo_invalido(self):
+        resposta = self.client.post(reverse('dashboard_perfil'), {
+            'atualizar_perfil': '1',
+            'bio': 'Nova bio',
+            'logo': SimpleUploadedFile('logo.png', b'nao sou uma imagem', content_type='image/png'),
+        })
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta.context['erro_logo'])
+        self.assertContains(resposta, resposta.context['erro_logo'])
+        self.perfil.refresh_from_db()
+        self.assertEqual(self.perfil.bio, 'Nova bio')
+        self.assertFalse(self.perfil.logo)
+
+    def test_sem_logo_redireciona(self):
+        resposta = self.client.post(reverse('dashboard_perfil'), {'atualizar_perfil': '1', 'bio': 'Nova bio'})
+        self.assertRedirects(resposta, reverse('dashboard_perfil'), fetch_redirect_response=False)
+
+
+class FilaTarefasTests(TesteBase):
+    """enfileirar sem duplicar por chave, reivindicação única e espera exponencial nas falhas"""
+
+    def setUp(self):
+        super().setUp()
+        EXECUTADAS.clear()
+
+    def test_chave_nao_duplica(self):
+        primeira = tarefas.enfileirar('testes.registrar', chave='a', valor=1)
+        self.assertIsNotNone(primeira)
+        self.assertIsNone(tarefas.enfileirar('testes.registrar', chave='a', valor=2))
+        self.assertIsNotNone(tarefas.enfileirar('testes.registrar', chave='b', valor=3))
+        # Sem chave não há deduplicação
+        tarefas.enfileirar('testes.registrar', valor=4)
+        tarefas.enfileirar('testes.registrar', valor=4)
+        self.assertEqual(Tarefa.objects.count(), 4)
+
+        # Em execução ela já não conta: a mesma chave pode voltar à fila
+        tarefas.reivindicar()
+        self.assertIsNotNone(tarefas.enfileirar('testes.registrar', chave='a', valor=5))
+
+    def test_corrida_no_insert(self):
+        tarefas.enfileirar('testes.registrar', chave='a', valor=1)
+        # Os dois processos passaram pela consulta antes de qualquer INSERT
+        with mock.patch.object(QuerySet, 'exists', return_value=False):
+            self.assertIsNone(tarefas.enfileirar('testes.registrar', chave='a', valor=2))
+        self.assertEqual(Tarefa.objects.filter(chave='a').count(), 1)
+
+    def test_tarefa_nao_registrada(self):
+        with self.assertRaises(LookupError):
+            tarefas.enfileirar('testes.inexistente')
+
+    def test_reivindicacao(self):
+        agora = tarefas.enfileirar('testes.registrar', valor=1)
+        depois = tarefas.enfileirar('testes.registrar', atraso=60, valor=2)
+        self.assertEqual(tarefas.reivindicar(), [agora])
+        # Já reivindicada: outro worker não leva de novo, e a atrasada ainda não venceu
+        self.assertEqual(tarefas.reivindicar(), [])
+
+        # Worker que morreu: depois de TEMPO_REIVINDICACAO ela volta para a fila
+        Tarefa.objects.filter(pk=agora.pk).update(atualizada_em=timezone.now() - tarefas.TEMPO_REIVINDICACAO * 2)
+        self.assertEqual(tarefas.reivindicar(), [agora])
+
+        Tarefa.objects.filter(pk=depois.pk).update(executar_em=timezone.now())
+        self.assertEqual(tarefas.executar_pendentes(), 1)
+        self.assertEqual(EXECUTADAS, [2])
+        self.assertEqual(Tarefa.objects.get(pk=depois.pk).status, 'concluida')
+
+    def test_espera_exponencial(self):
+        registro = tarefas.enfileirar('testes.falhar', chave='f')
+        antes = timezone.now()
+        with self.assertLogs('comerciojusto.tarefas', 'ERROR'):
+            self.assertEqual(tarefas.executar_pendentes(), 1)
+        registro.refresh_from_db()
+        self.assertEqual((registro.status, registro.tentativas), ('pendente', 1))
+        self.assertIn('falha de teste', registro.erro)
+        self.assertGreaterEqual(registro.executar_em, antes + timedelta(seconds=tarefas.ESPERA_BASE * 0.5))
+        # A espera ainda não venceu
+        self.assertEqual(tarefas.executar_pendentes(), 0)
+
+        Tarefa.objects.filter(pk=registro.pk).update(executar_em=timezone.now())
+        with self.assertLogs('comerciojusto.tarefas', 'ERROR'):
+            self.assertEqual(tarefas.executar_pendentes(), 1)
+        registro.refresh_from_db()
+        self.assertEqual((registro.status, registro.tentativas), ('falhou', 2))
+
+        for tentativas in range(1, 20):
+            self.assertLessEqual(tarefas.espera(tentativas), tarefas.ESPERA_MAXIMA)
+        self.assertGreater(tarefas.espera(3), tarefas.ESPERA_BASE * 2 - 1)
+
+    def test_retentativa_com_pendente_da_mesma_chave(self):
+        registro = tarefas.enfileirar('testes.falhar', chave='f')
+        reivindicada, = tarefas.reivindicar()
+        # Enfileirada de novo enquanto a primeira executa
+        nova = tarefas.enfileirar('testes.falhar', chave='f')
+        with self.assertLogs('comerciojusto.tarefas', 'ERROR'):
+            self.assertEqual(tarefas.executar(reivindicada), 'falhou')
+        registro.refresh_from_db()
+        self.assertIn('retentativa descartada', registro.erro)
+        self.assertEqual(Tarefa.objects.get(pk=nova.pk).status, 'pendente')
+
+    def test_executar_por_id(self):
+        registro = tarefas.enfileirar('testes.registrar', valor=7)
+        tarefas.reivindicar()
+        self.assertEqual(tarefas.executar_por_id(registro.pk), 'concluida')
+        self.assertEqual(EXECUTADAS, [7])
+
+
+@override_settings(TAREFAS_EM_THREAD=False)
+class ComandoExecutarTarefasTests(TransactionTestCase):
+    """executar_tarefas drena a fila pelo pool (a conexão da thread do pool precisa ver o commit)"""
+
+    def test_drena_a_fila(self):
+        EXECUTADAS.clear()
+        for valor in range(5):
+            tarefas.enfileirar('testes.registrar', valor=valor)
+        tarefas.enfileirar('testes.falhar')
+        saida = StringIO()
+        # Uma thread: o SQLite em memória dos testes trava a tabela com escritas concorrentes
+        with self.assertLogs('comerciojusto.tarefas', 'ERROR'):
+            call_command('executar_tarefas', threads=1, lote=2, stdout=saida)
+        self.assertEqual(sorted(EXECUTADAS), list(range(5)))
+        self.assertIn('✓ 6 tarefa(s) executada(s) (concluida: 5, pendente: 1)', saida.getvalue())
+
+
+class ArmazenamentoConteudoTests(TesteBase):
+    """Contagem de referências do armazenamento por conteúdo e a coleta dos arquivos sem uso"""
+
+    CONTEUDO = b'\x89PNG\r\n\x1a\n' + b'imagem de teste'
+
+    def setUp(self):
+        super().setUp()
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        configuracao = override_settings(MEDIA_ROOT=pasta.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.storage = armazenamento.armazenamento_midia()
+
+    def _produto(self, conteudo=CONTEUDO):
+        return Produto.objects.create(nome='Mel', imagem=SimpleUploadedFile('foto.png', conteudo))
+
+    def _envelhecer(self):
+        BlobMidia.objects.update(atualizado_em=timezone.now() - timedelta(days=2))
+
+    def test_referencias(self):
+        primeiro, segundo = self._produto(), self._produto()
+        self.assertEqual(primeiro.imagem.name, segundo.imagem.name)
+        blob = BlobMidia.objects.get()
+        self.assertEqual((blob.nome, blob.referencias), (primeiro.imagem.name, 2))
+
+        primeiro.delete()
+        self.assertEqual(BlobMidia.objects.get().referencias, 1)
+        segundo.imagem = SimpleUploadedFile('outra.png', self.CONTEUDO + b'!')
+        segundo.save()
+        self.assertEqual(dict(BlobMidia.objects.values_list('nome', 'referencias')), {
+            blob.nome: 0, segundo.imagem.name: 1,
+        })
+
+        # Recontagem a partir dos campos corrige desvios
+        BlobMidia.objects.update(referencias=7)
+        self.assertEqual(armazenamento.recontar_referencias(), 2)
+        self.assertEqual(BlobMidia.objects.get(pk=blob.pk).referencias, 0)
+
+    def test_coleta(self):
+        produto = self._produto()
+        nome = produto.imagem.name
+        produto.delete()
+        # Dentro da carência nada é apagado
+        self.assertEqual(armazenamento.coletar(timedelta(hours=1)), (0, 0))
+
+        self._envelhecer()
+        self.assertEqual(armazenamento.coletar(timedelta(hours=1), simular=True), (1, len(self.CONTEUDO)))
+        self.assertTrue(self.storage.exists(nome))
+        self.assertEqual(armazenamento.coletar(timedelta(hours=1)), (1, len(self.CONTEUDO)))
+        self.assertFalse(self.storage.exists(nome))
+        self.assertFalse(BlobMidia.objects.exists())
+
+    def test_coleta_de_arquivo_orfao(self):
+        nome = self._produto().imagem.name
+        Produto.objects.all().delete()
+        BlobMidia.objects.all().delete()
+        velho = (timezone.now() - timedelta(days=2)).timestamp()
+        os.utime(self.storage.path(nome), (velho, velho))
+        self.assertEqual(armazenamento.coletar(timedelta(hours=1)), (1, len(self.CONTEUDO)))
+        self.assertFalse(self.storage.exists(nome))
+
+    def test_upload_durante_a_coleta(self):
+        nome = self._produto().imagem.name
+        Produto.objects.all().delete()
+        self._envelhecer()
+        renomear = os.rename
+
+        def upload_no_meio(origem, destino):
+            # Depois de a coleta apagar o registro, o mesmo conteúdo é enviado de novo: o
+            # upload recria o registro e, vendo o arquivo no lugar, não grava outra cópia
+            self.assertFalse(BlobMidia.objects.exists())
+            self.assertIsNotNone(self._produto())
+            return renomear(origem, destino)
+
+        with mock.patch.object(armazenamento.os, 'rename', side_effect=upload_no_meio):
+            self.assertEqual(armazenamento.coletar(timedelta(hours=1)), (0, 0))
+        self.assertTrue(self.storage.exists(nome))
+        self.assertEqual(BlobMidia.objects.get().referencias, 1)
+        self.assertEqual(os.listdir(os.path.dirname(self.storage.path(nome))), [os.path.basename(nome)])
+
+
+class PublicacaoTempoRealTests(TesteBase):
+    """Eventos em tempo real só são montados (e o banco consultado) para quem tem conexão aberta"""
+
+    def setUp(self):
+        super().setUp()
+        self.remetente = User.objects.create_user('remetente')
+        self.destinatario = User.objects.create_user('destinatario')
+        self.mensagem = Mensagem.objects.create(
+            remetente=self.remetente, destinatario=self.destinatario, assunto='Oi', corpo='Tudo bem?'
+        )
+
+    def _com_broker(self, broker):
+        substituido = mock.patch.object(tempo_real, '_broker', broker)
+        substituido.start()
+        self.addCleanup(substituido.stop)
+        return broker
+
+    def test_sem_assinantes_nao_consulta(self):
+        broker = self._com_broker(tempo_real.BrokerMemoria())
+        with self.assertNumQueries(0):
+            tempo_real.publicar_mensagem(self.mensagem)
+            tempo_real.publicar_nao_lidas(self.destinatario.pk)
+        self.assertEqual(broker.total_conexoes(), 0)
+
+    def test_com_assinante(self):
+        broker = self._com_broker(mock.Mock(spec=tempo_real.BrokerMemoria))
+        broker.tem_assinantes.side_effect = lambda usuario_id: usuario_id == self.destinatario.pk
+        tempo_real.publicar_mensagem(self.mensagem)
+        tempo_real.publicar_nao_lidas(self.remetente.pk)
+        (usuario_id, evento), = [chamada.args for chamada in broker.publicar.call_args_list]
+        self.assertEqual(usuario_id, self.destinatario.pk)
+        self.assertEqual((evento['tipo'], evento['id'], evento['nao_lidas']), ('mensagem', self.mensagem.pk, 1))
+
+    def test_broker_memoria(self):
+        async def cenario():
+            broker = tempo_real.BrokerMemoria()
+            assinatura = broker.assinar(7)
+            self.assertTrue(broker.tem_assinantes(7))
+            self.assertFalse(broker.tem_assinantes(8))
+            self.assertEqual(broker.publicar(7, {'tipo': 'teste'}), 1)
+            self.assertEqual(await assinatura.proximo(1), {'tipo': 'teste'})
+            assinatura.cancelar()
+            self.assertFalse(broker.tem_assinantes(7))
+
+        asyncio.run(cenario())
+
+
+class BuscaProdutosTests(TesteBase):
+    """Normalização dos termos, prefixo no último termo e ordem por relevância"""
+
+    def _produto(self, nome, descricao='', **campos):
+        produto = Produto.objects.create(nome=nome, descricao=descricao, preco=10, **campos)
+        busca.indexar_produto(produto)
+        return produto
+
+    def _buscar(self, texto):
+        return list(
+            busca.buscar_produtos(Produto.objects.all(), texto)
+            .order_by('-relevancia', 'id_produto')
+            .values_list('nome', flat=True)
+        )
+
+    def test_tokenizar(self):
+        # Sem acento, sem stopwords e com plural e gênero reduzidos ao mesmo termo
+        self.assertEqual(busca.tokenizar('Feijões Orgânicos da Serra'), ['feija', 'organic', 'serr'])
+        self.assertEqual(busca.tokenizar('orgânica'), busca.tokenizar('ORGANICOS'))
+        self.assertEqual(busca.tokenizar('limões'), busca.tokenizar('limão'))
+        self.assertEqual(busca.tokenizar('de a o e x'), [])
+
+    def test_singular(self):
+        self.assertEqual(busca._singular('flores'), 'flor')
+        self.assertEqual(busca._singular('vegetais'), 'vegetal')
+        self.assertEqual(busca._singular('arrozes'), 'arroz')
+        # Palavras curtas e números ficam como estão
+        self.assertEqual(busca._singular('mel'), 'mel')
+        self.assertEqual(busca._singular('2024'), '2024')
+
+    def test_prefixo_so_no_ultimo_termo(self):
+        self._produto('Mel silvestre')
+        self._produto('Melancia')
+        self._produto('Tomate cereja')
+
+        # Enquanto se digita, o último termo vale como prefixo
+        self.assertEqual(self._buscar('mel'), ['Mel silvestre', 'Melancia'])
+        self.assertEqual(self._buscar('silv'), ['Mel silvestre'])
+        # Os termos anteriores precisam casar inteiros
+        self.assertEqual(self._buscar('mel silv'), ['Mel silvestre'])
+        self.assertEqual(self._buscar('me silvestre'), [])
+
+    def test_exige_todos_os_termos(self):
+        self._produto('Café orgânico')
+        self._produto('Café torrado')
+        self.assertEqual(self._buscar('cafés orgânicos'), ['Café orgânico'])
+        self.assertEqual(self._buscar('café chocolate'), [])
+        self.assertEqual(self._buscar('de da'), [])
+
+    def test_ordem_por_relevancia(self):
+        self._produto('Granola', descricao='com banana desidratada')
+        self._produto('Banana prata')
+        self._produto('Banana nanica', vendas=10)
+        self._produto('Banana da terra', destaque=True)
+
+        # Nome pesa mais que descrição; entre nomes iguais, destaque e vendas desempatam
+        self.assertEqual(
+            self._buscar('banana'),
+            ['Banana da terra', 'Banana nanica', 'Banana prata', 'Granola'],
+        )
+
+    def test_reindexar_substitui_termos(self):
+        produto = self._produto('Queijo minas')
+        produto.nome = 'Requeijão'
+        produto.save()
+        busca.indexar_produto(produto)
+        self.assertEqual(self._buscar('queijo'), [])
+        self.assertEqual(self._buscar('requeijao'), ['Requeijão'])
+
+
+class EstadoCertificacaoTests(TesteBase):
+    """As colunas desnormalizadas de Produto e Perfil acompanham as certificações"""
+
+    def setUp(self):
+        super().setUp()
+        self.perfil = Perfil.objects.create(user=User.objects.create_user('vendedor'), tipo='produtor')
+        self.produto = Produto.objects.create(nome='Mel', preco=30, perfil=self.perfil)
+        self.hoje = timezone.localdate()
+
+    def _certificacao(self, **campos):
+        campos.setdefault('status', 'aprovada')
+        certificacao = Certificacao.objects.create(perfil=self.perfil, produto=self.produto, **campos)
+        tarefas.executar_pendentes()
+        return certificacao
+
+    def _estado(self, obj):
+        obj.refresh_from_db()
+        return obj.certificado, obj.certificacoes_aprovadas, obj.certificacao_validade
+
+    def test_aprovar_e_excluir(self):
+        validade = self.hoje + timedelta(days=30)
+        self._certificacao(status='enviado_analise', validade=validade)
+        self.assertEqual(self._estado(self.produto), (False, 0, None))
+
+        aprovada = self._certificacao(validade=validade)
+        self.assertEqual(self._estado(self.produto), (True, 1, validade))
+        self.assertEqual(self._estado(self.perfil), (True, 1, validade))
+
+        # Uma aprovada sem validade faz o estado não expirar
+        sem_validade = self._certificacao()
+        self.assertEqual(self._estado(self.produto), (True, 2, None))
+
+        sem_validade.delete()
+        aprovada.delete()
+        tarefas.executar_pendentes()
+        self.assertEqual(self._estado(self.produto), (False, 0, None))
+        self.assertEqual(self._estado(self.perfil), (False, 0, None))
+
+    def test_vencida_nao_conta(self):
+        self._certificacao(validade=self.hoje - timedelta(days=1))
+        self.assertEqual(self._estado(self.produto), (False, 0, None))
+
+        validade = self.hoje + timedelta(days=3)
+        self._certificacao(validade=validade)
+        self.produto.refresh_from_db()
+        self.assertTrue(self.produto.certificado_vigente)
+        self.assertTrue(certificacoes.filtrar_certificados(Produto.objects.all()).exists())
+        # Passada a validade, o filtro já não inclui o produto, mesmo antes da varredura
+        depois = validade + timedelta(days=1)
+        self.assertFalse(certificacoes.filtrar_certificados(Produto.objects.all(), hoje=depois).exists())
+
+    def test_listagem_sem_consultar_certificacoes(self):
+        self._certificacao(validade=self.hoje + timedelta(days=30))
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(reverse('index'))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertFalse([q['sql'] for q in consultas.captured_queries if '"certificacao"' in q['sql']])
+
+
+class ExclusaoConversaTests(TesteBase):
+    """Excluir a conversa some só da caixa de quem excluiu; mensagens novas a trazem de volta"""
+
+    def setUp(self):
+        super().setUp()
+        self.ana = User.objects.create_user('ana', password='senha')
+        self.beto = User.objects.create_user('beto', password='senha')
+
+    def _enviar(self, remetente, destinatario, corpo):
+        return Mensagem.objects.create(remetente=remetente, destinatario=destinatario, assunto='Oi', corpo=corpo)
+
+    def _corpos(self, conversa, usuario):
+        conversa.refresh_from_db()
+        visiveis = conversas.mensagens_visiveis(conversa, usuario.id).order_by('id_mensagem')
+        return list(visiveis.values_list('corpo', flat=True))
+
+    def test_exclusao_por_participante(self):
+        for corpo in ('1', '2'):
+            self._enviar(self.ana, self.beto, corpo)
+        self._enviar(self.beto, self.ana, '3')
+        conversa = conversas.obter_conversa(self.ana.id, self.beto.id, criar=False)
+        self.assertEqual((conversas.total_nao_lidas(self.ana), conversas.total_nao_lidas(self.beto)), (1, 2))
+
+        conversas.excluir_da_caixa(conversa, self.ana)
+        self.assertFalse(conversas.conversas_do_usuario(self.ana).exists())
+        self.assertEqual(list(conversas.conversas_do_usuario(self.beto)), [conversa])
+        # O outro participante continua com todo o histórico e com as não lidas dele
+        self.assertEqual(self._corpos(conversa, self.beto), ['1', '2', '3'])
+        self.assertEqual(self._corpos(conversa, self.ana), [])
+        self.assertEqual((conversas.total_nao_lidas(self.ana), conversas.total_nao_lidas(self.beto)), (0, 2))
+
+        # Uma mensagem nova devolve a conversa só com o que chegou depois
+        self._enviar(self.beto, self.ana, '4')
+        self.assertEqual(list(conversas.conversas_do_usuario(self.ana)), [conversa])
+        self.assertEqual(self._corpos(conversa, self.ana), ['4'])
+        self.assertEqual(self._corpos(conversa, self.beto), ['1', '2', '3', '4'])
+
+    def test_excluir_pela_caixa_de_entrada(self):
+        self._enviar(self.ana, self.beto, '1')
+        conversa = conversas.obter_conversa(self.ana.id, self.beto.id, criar=False)
+        self.client.force_login(self.beto)
+        resposta = self.client.post(reverse('caixa_entrada'), {
+            'acao': 'excluir', 'conversas_selecionadas': [conversa.pk],
+        })
+        self.assertRedirects(resposta, reverse('caixa_entrada'), fetch_redirect_response=False)
+        self.assertEqual(Mensagem.objects.count(), 1)
+        self.assertFalse(conversas.conversas_do_usuario(self.beto).exists())
+        self.assertTrue(conversas.conversas_do_usuario(self.ana).exists())
+
+        # Quem não participa não consegue excluir a conversa dos outros
+        intruso = User.objects.create_user('intruso')
+        self.client.force_login(intruso)
+        self.client.post(reverse('caixa_entrada'), {'acao': 'excluir', 'conversas_selecionadas': [conversa.pk]})
+        self.assertTrue(conversas.conversas_do_usuario(self.ana).exists())
+
+
+class JanelaMensagensTests(TesteBase):
+    """Histórico em janelas pelo id (?antes=) e polling só das mensagens novas (?desde=)"""
+
+    def setUp(self):
+        super().setUp()
+        self.ana = User.objects.create_user('ana', password='senha')
+        self.beto = User.objects.create_user('beto', password='senha')
+        self.ids = [
+            Mensagem.objects.create(
+                remetente=self.ana if i % 2 else self.beto, destinatario=self.beto if i % 2 else self.ana,
+                assunto='Oi', corpo=str(i),
+            ).pk
+            for i in range(5)
+        ]
+        self.conversa = conversas.obter_conversa(self.ana.id, self.beto.id, criar=False)
+
+    def _ids(self, mensagens):
+        return [m.id_mensagem for m in mensagens]
+
+    def test_janelas(self):
+        mensagens, ha_mais = conversas.janela_mensagens(self.conversa, self.ana, 2)
+        self.assertEqual((self._ids(mensagens), ha_mais), (self.ids[3:], True))
+        mensagens, ha_mais = conversas.janela_mensagens(self.conversa, self.ana, 2, antes=self.ids[3])
+        self.assertEqual((self._ids(mensagens), ha_mais), (self.ids[1:3], True))
+        mensagens, ha_mais = conversas.janela_mensagens(self.conversa, self.ana, 2, antes=self.ids[1])
+        self.assertEqual((self._ids(mensagens), ha_mais), (self.ids[:1], False))
+
+        self.assertEqual(self._ids(conversas.mensagens_desde(self.conversa, self.ana, self.ids[1], 2)), self.ids[2:4])
+        self.assertEqual(conversas.mensagens_desde(self.conversa, self.ana, self.ids[-1], 2), [])
+
+    def test_polling_marca_so_as_entregues(self):
+        self.client.force_login(self.ana)
+        url = reverse('mensagens_conversa', args=[self.beto.id])
+        with mock.patch('comerciojusto.views.MENSAGENS_POR_PAGINA', 2):
+            dados = self.client.get(url, {'desde': self.ids[0]}).json()
+            self.assertEqual([m['id'] for m in dados['mensagens']], self.ids[1:3])
+            self.assertEqual(dados['ultima_id'], self.ids[2])
+            # Só a mensagem entregue à Ana nesta resposta fica lida; as de fora da janela continuam pendentes
+            self.assertEqual(
+                list(Mensagem.objects.filter(destinatario=self.ana, lida=False).values_list('pk', flat=True)),
+                [self.ids[0], self.ids[4]],
+            )
+            self.conversa.refresh_from_db()
+            self.assertEqual(self.conversa.nao_lidas_para(self.ana), 2)
+
+            # Nada novo: o cursor não anda
+            dados = self.client.get(url, {'desde': self.ids[-1]}).json()
+            self.assertEqual((dados['mensagens'], dados['ultima_id']), ([], self.ids[-1]))
+
+            dados = self.client.get(url, {'antes': self.ids[2]}).json()
+            self.assertEqual([m['id'] for m in dados['mensagens']], self.ids[:2])
+            self.assertIsNone(dados['cursor_antigas'])
+
+
+class MiddlewareCacheTests(TesteBase):
+    """Os valores do request só são consultados quando usados, e depois vêm do cache até o signal invalidar"""
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = User.objects.create_user('vendedor')
+        self.perfil = Perfil.objects.create(user=self.usuario, tipo='produtor', bio='Antiga')
+
+    def _request(self, usuario):
+        request = RequestFactory().get('/')
+        request.user = usuario
+        request.session = SessionStore()
+        for classe in (middleware.UserCacheMiddleware, middleware.PerfilCacheMiddleware,
+                       middleware.CarrinhoCountMiddleware):
+            classe(lambda request: None)(request)
+        return request
+
+    def test_preguicoso(self):
+        with self.assertNumQueries(0):
+            self._request(self.usuario)
+
+    def test_perfil_do_cache_ate_salvar(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self._request(self.usuario).perfil.bio, 'Antiga')
+        with self.assertNumQueries(0):
+            self.assertEqual(self._request(self.usuario).perfil.bio, 'Antiga')
+
+        self.perfil.bio = 'Nova'
+        self.perfil.save()
+        self.assertEqual(self._request(self.usuario).perfil.bio, 'Nova')
+
+        # "Sem perfil" também fica no cache
+        sem_perfil = User.objects.create_user('comprador')
+        self.assertFalse(self._request(sem_perfil).perfil)
+        with self.assertNumQueries(0):
+            self.assertFalse(self._request(sem_perfil).perfil)
+
+    def test_dados_usuario(self):
+        self.assertEqual(self._request(self.usuario).cached_user_data['username'], 'vendedor')
+        self.usuario.email = 'vendedor@example.com'
+        self.usuario.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(self._request(self.usuario).cached_user_data['email'], 'vendedor@example.com')
+
+    def test_contagem_do_carrinho(self):
+        self.assertEqual(self._request(self.usuario).carrinho_itens, 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(self._request(self.usuario).carrinho_itens, 0)
+
+        carrinho_usuario = Carrinho.objects.create(usuario=self.usuario)
+        carrinho.adicionar_item(carrinho_usuario, Produto.objects.create(nome='Mel', preco=30))
+        self.assertEqual(self._request(self.usuario).carrinho_itens, 1)
+        carrinho.adicionar_item(carrinho_usuario, Produto.objects.create(nome='Café', preco=20))
+        self.assertEqual(self._request(self.usuario).carrinho_itens, 2)
+
+
+class PapeisCacheTests(TesteBase):
+    """Os grupos em cache acompanham cada forma de mudar a participação (m2m_changed e Group)"""
+
+    def setUp(self):
+        super().setUp()
+        self.produtor = Group.objects.create(name=PRODUTOR)
+        self.usuarios = [User.objects.create_user(f'usuario{i}') for i in range(2)]
+
+    def _papeis(self):
+        # Usuário recarregado a cada checagem, como numa request nova: só o cache compartilhado vale
+        return [papeis.tem_papel(User.objects.get(pk=u.pk), PRODUTOR) for u in self.usuarios]
+
+    def test_uma_consulta_por_request(self):
+        usuario = User.objects.get(pk=self.usuarios[0].pk)
+        with self.assertNumQueries(1):
+            papeis.tem_papel(usuario, PRODUTOR)
+            papeis.pode_acessar_perfil(usuario, 'produtor')
+        with self.assertNumQueries(0):
+            papeis.tem_papel(User(pk=usuario.pk), PRODUTOR, EMPRESA)
+
+    def test_invalidacao(self):
+        self.assertEqual(self._papeis(), [False, False])
+
+        self.usuarios[0].groups.add(self.produtor)
+        self.assertEqual(self._papeis(), [True, False])
+
+        # Pelo outro lado da relação
+        self.produtor.user_set.add(self.usuarios[1])
+        self.assertEqual(self._papeis(), [True, True])
+        self.produtor.user_set.remove(self.usuarios[0])
+        self.assertEqual(self._papeis(), [False, True])
+        self.produtor.user_set.clear()
+        self.assertEqual(self._papeis(), [False, False])
+
+        self.usuarios[0].groups.set([self.produtor])
+        self.usuarios[1].groups.add(self.produtor)
+        self.assertEqual(self._papeis(), [True, True])
+        self.usuarios[1].groups.clear()
+        self.assertEqual(self._papeis(), [True, False])
+
+        # Renomear ou excluir o grupo também
+        self.produtor.name = 'Produtor antigo'
+        self.produtor.save()
+        self.assertEqual(self._papeis(), [False, False])
+        self.produtor.name = PRODUTOR
+        self.produtor.save()
+        self.assertEqual(self._papeis(), [True, False])
+        self.produtor.delete()
+        self.assertEqual(self._papeis(), [False, False])
+
+    def test_memorizado_no_usuario_e_limpo_no_add(self):
+        usuario = self.usuarios[0]
+        self.assertFalse(papeis.tem_papel(usuario, PRODUTOR))
+        usuario.groups.add(self.produtor)
+        self.assertTrue(papeis.tem_papel(usuario, PRODUTOR))
+
+
+class VariantesImagemTests(TesteBase):
+    """Miniaturas geradas em segundo plano, sem ampliar o original, e servidas só enquanto valem"""
+
+    def setUp(self):
+        super().setUp()
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        configuracao = override_settings(MEDIA_ROOT=pasta.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def _png(self, largura, altura, cor=(200, 30, 30, 0)):
+        saida = BytesIO()
+        Image.new('RGBA', (largura, altura), cor).save(saida, 'PNG')
+        return SimpleUploadedFile('foto.png', saida.getvalue(), content_type='image/png')
+
+    def _abrir(self, nome):
+        with default_storage.open(nome) as arquivo:
+            imagem = Image.open(arquivo)
+            imagem.load()
+        return imagem
+
+    def test_gerar_variantes(self):
+        produto = Produto.objects.create(nome='Mel', preco=30, imagem=self._png(800, 400))
+        self.assertIsNone(imagens.variantes_atuais(produto.imagem, produto.imagem_variantes))
+        tarefas.executar_pendentes()
+
+        produto.refresh_from_db()
+        variantes = imagens.variantes_atuais(produto.imagem, produto.imagem_variantes)
+        # 1024 passaria da largura original
+        self.assertEqual(variantes['larguras'], [320, 640])
+        self.assertEqual(variantes['formatos'], [f[0] for f in imagens.formatos_disponiveis()])
+        for largura in variantes['larguras']:
+            for extensao in variantes['formatos']:
+                imagem = self._abrir(imagens.nome_variante(produto.imagem.name, largura, extensao))
+                self.assertEqual(imagem.size, (largura, largura // 2))
+        # Transparência vira fundo branco no JPEG
+        jpeg = self._abrir(imagens.nome_variante(produto.imagem.name, 320, 'jpg'))
+        self.assertTrue(all(canal > 245 for canal in jpeg.convert('RGB').getpixel((10, 10))))
+
+        html = midia.imagem_responsiva(produto.imagem, produto.imagem_variantes, alt='Mel')
+        self.assertIn('<picture>', html)
+        self.assertIn('-640.webp 640w', html)
+
+    def test_original_menor_que_todas_as_larguras(self):
+        perfil = Perfil.objects.create(
+            user=User.objects.create_user('vendedor'), tipo='produtor', logo=self._png(50, 50)
+        )
+        tarefas.executar_pendentes()
+        perfil.refresh_from_db()
+        self.assertEqual(perfil.logo_variantes['larguras'], [50])
+
+    def test_arquivo_trocado_descarta_variantes(self):
+        produto = Produto.objects.create(nome='Mel', preco=30, imagem=self._png(400, 400))
+        tarefas.executar_pendentes()
+        produto.refresh_from_db()
+        anterior = produto.imagem.name
+
+        produto.imagem = self._png(400, 400, cor=(0, 0, 255, 255))
+        produto.save()
+        self.assertNotEqual(produto.imagem.name, anterior)
+        # Até a tarefa rodar, a tag serve o original
+        self.assertIn('<img src', midia.imagem_responsiva(produto.imagem, produto.imagem_variantes))
+        self.assertNotIn('<picture>', midia.imagem_responsiva(produto.imagem, produto.imagem_variantes))
+        # Variantes calculadas para o arquivo antigo não sobrescrevem o novo
+        self.assertFalse(imagens.salvar_variantes('Produto', produto.pk, anterior, {'nome': anterior}))
+
+        tarefas.executar_pendentes()
+        produto.refresh_from_db()
+        self.assertEqual(produto.imagem_variantes['nome'], produto.imagem.name)
+
+
+class FilaCertificacoesTests(TesteBase):
+    """Decisão em lote com trava otimista pela versão e a varredura de vencimentos"""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+        self.perfil = Perfil.objects.create(user=User.objects.create_user('vendedor'), tipo='produtor')
+        self.produto = Produto.objects.create(nome='Mel', preco=30, perfil=self.perfil)
+        self.hoje = timezone.localdate()
+
+    def _certificacao(self, **campos):
+        return Certificacao.objects.create(perfil=self.perfil, produto=self.produto, **campos)
+
+    def test_conflito_de_versao(self):
+        primeira, segunda = self._certificacao(), self._certificacao()
+        # Outro auditor reprovou a segunda depois que esta tela foi aberta
+        self.assertEqual(certificacoes.decidir({segunda.pk: 0}, aprovar=False), (1, 0))
+
+        decididas = certificacoes.decidir({primeira.pk: 0, segunda.pk: 0}, aprovar=True, parecer='ok')
+        self.assertEqual(decididas, (1, 1))
+        primeira.refresh_from_db()
+        segunda.refresh_from_db()
+        self.assertEqual((primeira.status, primeira.versao, primeira.parecer), ('aprovada', 1, 'ok'))
+        self.assertEqual((segunda.status, segunda.versao), ('reprovada', 1))
+
+        # Decidida pela versão atual, a reprovada ainda pode ser aprovada; aprovadas saem da fila
+        self.assertEqual(certificacoes.decidir({segunda.pk: 1, primeira.pk: 1}, aprovar=True), (1, 1))
+        tarefas.executar_pendentes()
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.certificacoes_aprovadas, 2)
+
+    def test_decidir_pela_fila(self):
+        certificacao = self._certificacao()
+        self.client.force_login(self.admin)
+        url = reverse('gerenciar_certificacoes')
+        for _ in range(2):
+            # O segundo envio (aba antiga) traz a versão já ultrapassada
+            resposta = self.client.post(url, {
+                'selecionadas': [certificacao.pk], f'versao_{certificacao.pk}': '0', 'acao': 'aprovar',
+            }, follow=True)
+        avisos = [str(m) for m in resposta.context['messages']]
+        self.assertIn('0 certificação(ões) atualizada(s) com sucesso.', avisos)
+        self.assertTrue(any('outro auditor' in aviso for aviso in avisos))
+        certificacao.refresh_from_db()
+        self.assertEqual((certificacao.status, certificacao.versao), ('aprovada', 1))
+        self.assertEqual(certificacao.administrador.email, 'admin@example.com')
+
+    def test_varredura(self):
+        vencida = self._certificacao(status='aprovada', validade=self.hoje - timedelta(days=1))
+        vencendo = self._certificacao(status='aprovada', validade=self.hoje + timedelta(days=10))
+        self._certificacao(status='aprovada', validade=self.hoje + timedelta(days=90))
+        tarefas.executar_pendentes()
+
+        saida = StringIO()
+        call_command('varrer_certificacoes', aviso_dias=30, lote=1, stdout=saida)
+        self.assertIn('1 certificação(ões) expirada(s), 1 aviso(s)', saida.getvalue())
+        vencida.refresh_from_db()
+        vencendo.refresh_from_db()
+        self.assertEqual((vencida.status, vencida.versao), ('expirada', 1))
+        self.assertIsNotNone(vencendo.aviso_vencimento_em)
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.certificacoes_aprovadas, 2)
+
+        # O aviso sai uma vez só e chega como mensagem ao produtor
+        self.assertEqual(certificacoes.avisar_vencimento(30), 0)
+        tarefas.executar_pendentes()
+        assuntos = set(Mensagem.objects.filter(destinatario=self.perfil.user).values_list('assunto', flat=True))
+        self.assertEqual(assuntos, {'Certificações expiradas', 'Certificações perto do vencimento'})
+
+
+class ProximidadeGeoTests(TesteBase):
+    """A grade acha exatamente os mesmos pontos que medir a distância de todos"""
+
+    def _forca_bruta(self, pontos, lat, lon, raio_km):
+        raio_km = min(raio_km, geo.RAIO_MAXIMO_KM)
+        encontrados = [(i, geo.distancia_km(lat, lon, p_lat, p_lon)) for i, p_lat, p_lon in pontos]
+        return sorted(((i, d) for i, d in encontrados if d <= raio_km), key=lambda item: (item[1], item[0]))
+
+    def test_grade_igual_forca_bruta(self):
+        aleatorio = random.Random(2024)
+        pontos = [(i, aleatorio.uniform(-34, 6), aleatorio.uniform(-74, -34)) for i in range(3000)]
+        # Pontos em cima das bordas das células e bem perto da origem
+        pontos += [(3000 + i, -23.5 + i * 1e-9, -46.5 - i * 1e-9) for i in range(3)]
+        grade = geo.IndiceGrade(pontos)
+        self.assertEqual(grade.total, len(pontos))
+
+        origens = [(-23.5, -46.5), (-23.5475, -46.6361), (5.2, -60.1), (-33.7, -53.4), (0.0, -50.0)]
+        for lat, lon in origens:
+            for raio in (1, 10, 55, 250, 1000, 5000):
+                with self.subTest(lat=lat, lon=lon, raio=raio):
+                    self.assertEqual(grade.proximos(lat, lon, raio), self._forca_bruta(pontos, lat, lon, raio))
+
+    def test_geocodificar(self):
+        self.assertEqual(geo.geocodificar('sao paulo', 'sp'), geo.geocodificar('São Paulo', 'SP'))
+        self.assertEqual(geo.ler_local('Campinas/SP'), (-22.9056, -47.0608))
+        self.assertEqual(geo.ler_local('Campinas - sp'), (-22.9056, -47.0608))
+        # Nome repetido em vários estados, sem UF, fica sem coordenadas
+        self.assertIsNone(geo.geocodificar('Bom Jesus'))
+        self.assertIsNone(geo.ler_local('Cidade que não existe/SP'))
+
+    def test_produtos_proximos(self):
+        produtos = {}
+        for nome, cidade, estado in (('sp', 'São Paulo', 'SP'), ('campinas', 'Campinas', 'SP'),
+                                     ('rio', 'Rio de Janeiro', 'RJ')):
+            perfil = Perfil.objects.create(
+                user=User.objects.create_user(nome), tipo='produtor', cidade=cidade, estado=estado
+            )
+            produtos[nome] = Produto.objects.create(nome=nome, preco=10, perfil=perfil)
+
+        def proximos():
+            chaves = geo.produtos_proximos(Produto.objects.all(), -23.5475, -46.6361, 100)
+            return [Produto.objects.get(pk=c[2]).nome for c in chaves]
+
+        self.assertEqual(proximos(), ['sp', 'campinas'])
+        # Mudar de cidade reconstrói o índice e descarta as listas em cache
+        perfil_rio = produtos['rio'].perfil
+        perfil_rio.cidade, perfil_rio.estado = 'Jundiaí', 'SP'
+        perfil_rio.save()
+        self.assertEqual(proximos(), ['sp', 'rio', 'campinas'])
+
+
+class ContagemFacetasTests(TesteBase):
+    """O número de cada opção é o total que filtrar() devolve ao marcá-la"""
+
+    def setUp(self):
+        super().setUp()
+        aleatorio = random.Random(7)
+        hoje = timezone.localdate()
+        perfis = [
+            Perfil.objects.create(user=User.objects.create_user(f'vendedor{i}'), tipo='produtor', estado=uf)
+            for i, uf in enumerate(('SP', 'MG', 'BA', ''))
+        ]
+        # Produto antigo: o perfil só vem pelo produtor
+        produtor = Produtor.objects.create(
+            perfil=perfis[1], nome='Sítio', cpf_cnpj='1', email='sitio@example.com', senha='x'
+        )
+        categorias = [valor for valor, _ in Produto.CATEGORIA_CHOICES]
+        for i in range(60):
+            validade = aleatorio.choice([None, hoje - timedelta(days=1), hoje + timedelta(days=30)])
+            Produto.objects.create(
+                nome=f'{aleatorio.choice(["Mel", "Café", "Queijo"])} {i}',
+                categoria=aleatorio.choice(categorias),
+                preco=aleatorio.choice([5, 10, 24.99, 25, 60, 100, 150]),
+                estoque=aleatorio.choice([None, 0, 3]),
+                certificado=aleatorio.random() < 0.5,
+                certificacao_validade=validade,
+                perfil=None if i % 7 == 0 else aleatorio.choice(perfis),
+                produtor=produtor if i % 7 == 0 else None,
+            )
+
+    def _filtros(self, **valores):
+        filtros = {'categoria': set(), 'faixa': set(), 'estado': set(), 'certificado': False, 'estoque': False}
+        filtros.update(valores)
+        return filtros
+
+    def _conferir(self, linhas, produtos, filtros):
+        total, contagens = facetas.contar(linhas, filtros)
+        self.assertEqual(total, facetas.filtrar(produtos, filtros).count())
+        for faceta in facetas.MULTIPLAS:
+            for valor in {linha[facetas.FACETAS.index(faceta)] for linha in linhas}:
+                marcada = {**filtros, faceta: {valor}}
+                self.assertEqual(
+                    contagens[faceta][valor], facetas.filtrar(produtos, marcada).count(), (faceta, valor, filtros)
+                )
+        for faceta in ('certificado', 'estoque'):
+            marcada = {**filtros, faceta: True}
+            self.assertEqual(contagens[faceta][True], facetas.filtrar(produtos, marcada).count(), (faceta, filtros))
+
+    def test_contagens_iguais_ao_filtro(self):
+        combinacoes = [
+            self._filtros(),
+            self._filtros(categoria={'frutas', 'mercearia'}),
+            self._filtros(faixa={'10-25'}, estoque=True),
+            self._filtros(estado={'MG'}, certificado=True),
+            self._filtros(categoria={'verduras'}, faixa={'ate-10', 'acima-100'}, estado={'SP', 'BA'}, estoque=True),
+        ]
+        linhas = facetas.cubo()
+        for filtros in combinacoes:
+            with self.subTest(filtros=filtros):
+                self._conferir(linhas, Produto.objects.all(), filtros)
+
+        # Com uma pesquisa, só os resultados dela
+        for produto in Produto.objects.all():
+            busca.indexar_produto(produto)
+        resultados = busca.buscar_produtos(Produto.objects.all(), 'mel').values('pk')
+        self._conferir(facetas.cubo('mel'), Produto.objects.filter(pk__in=resultados), self._filtros(estoque=True))
+
+    def test_cubo_do_cache_ate_invalidar(self):
+        facetas.cubo()
+        with self.assertNumQueries(0):
+            linhas = facetas.cubo()
+        produto = Produto.objects.first()
+        produto.preco = 1000
+        produto.save()
+        self.assertNotEqual(facetas.cubo(), linhas)
+
+
+class IndicesConsultasTests(TesteBase):
+    """Os índices do plano existem, atendem às consultas quentes e o benchmark desfaz o que gera"""
+
+    def _indices(self):
+        with connection.cursor() as cursor:
+            return {
+                nome
+                for modelo in BENCHMARK_INDICES
+                for nome in connection.introspection.get_constraints(cursor, modelo._meta.db_table)
+            }
+
+    def _conferir_indices(self):
+        esperados = {nome for nomes in BENCHMARK_INDICES.values() for nome in nomes}
+        self.assertLessEqual(esperados, self._indices())
+
+    def test_indices_criados(self):
+        self._conferir_indices()
+
+    def test_planos_usam_os_indices(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('planos conferidos no SQLite')
+        consultas = {
+            'produto_catalogo_idx': Produto.objects.order_by(*ORDENACAO_CATALOGO)[:25],
+            'produto_categoria_idx': Produto.objects.filter(categoria='frutas').order_by(*ORDENACAO_CATALOGO)[:25],
+            'carrinho_sessao_idx': Carrinho.objects.filter(sessao_id='sessao-teste')[:1],
+            'mensagem_nao_lidas_idx': Mensagem.objects.filter(conversa_id=1, destinatario_id=1, lida=False),
+        }
+        for indice, consulta in consultas.items():
+            with self.subTest(indice=indice):
+                self.assertIn(indice, consulta.explain())
+
+    def test_benchmark_desfaz_tudo(self):
+        saida = StringIO()
+        call_command(
+            'benchmark_indices', produtos=60, perfis=4, avaliacoes=40, mensagens=40, carrinhos=10,
+            certificacoes=20, repeticoes=1, stdout=saida,
+        )
+        self.assertIn('de 8 consultas mais rápidas com os índices', saida.getvalue())
+        # Dados e índices removidos durante a medição voltam como estavam
+        self.assertFalse(Produto.objects.exists())
+        self.assertFalse(User.objects.exists())
+        self._conferir_indices()
@@ -0,0 +1,142 @@
+"""
+Verificação dos uploads durante o recebimento (FILE_UPLOAD_HANDLERS no settings)
+
+O UploadVerificadoHandler fica antes dos handlers padrão do Django e olha os
+campos de arquivo conhecidos (REGRAS) pedaço a pedaço, antes de o arquivo ir
+para a memória ou para o disco:
+
+- o tipo vem dos primeiros bytes do arquivo (assinatura), não da extensão;
+- o limite de tamanho é aplicado enquanto os dados chegam;
+- o SHA-256 é calculado incrementalmente, sem reler o arquivo depois.
+
+Arquivo recusado não entra em request.FILES; o motivo fica em
+request.erros_upload. As views pegam o arquivo com arquivo_enviado(), que
+devolve o UploadedFile com .sha256 e .tipo_detectado.
+"""
+import hashlib
+
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+
+MB = 1024 * 1024
+
+# Assinaturas (posição, bytes) -> tipo
+ASSINATURAS = (
+    ('pdf', ((0, b'%PDF-'),)),
+    ('jpeg', ((0, b'\xff\xd8\xff'),)),
+    ('png', ((0, b'\x89PNG\r\n\x1a\n'),)),
+    ('webp', ((0, b'RIFF'), (8, b'WEBP'))),
+    ('gif', ((0, b'GIF8'),)),
+)
+BYTES_CABECALHO = 16
+EXTENSOES = {'pdf': '.pdf', 'jpeg': '.jpg', 'png': '.png', 'webp': '.webp', 'gif': '.gif'}
+
+IMAGENS = ('jpeg', 'png', 'webp', 'gif')
+
+# Campo do formulário -> (tamanho máximo, tipos aceitos, descrição dos tipos para a mensagem)
+REGRAS = {
+    'arquivo_certificado': (5 * MB, ('pdf', 'jpeg', 'png'), 'PDF ou imagem (JPG, JPEG, PNG)'),
+    'imagem_produto': (10 * MB, IMAGENS, 'imagem (JPG, PNG, WebP ou GIF)'),
+    'imagem': (10 * MB, IMAGENS, 'imagem (JPG, PNG, WebP ou GIF)'),  # admin de Produto
+    'logo': (5 * MB, IMAGENS, 'imagem (JPG, PNG, WebP ou GIF)'),
+}
+
+
+def detectar_tipo(cabecalho):
+    """Tipo do arquivo pelos primeiros bytes (None se desconhecido)"""
+    for tipo, partes in ASSINATURAS:
+        if all(cabecalho[inicio:inicio + len(magico)] == magico for inicio, magico in partes):
+            return tipo
+    return None
+
+
+def mensagem_tipo(campo):
+    return f'Tipo de arquivo não permitido. Envie {REGRAS[campo][2]}.'
+
+
+def mensagem_tamanho(campo):
+    return f'O arquivo não pode exceder {REGRAS[campo][0] // MB}MB.'
+
+
+class UploadVerificadoHandler(FileUploadHandler):
+    """Aplica REGRAS aos campos conhecidos e repassa os dados aos próximos handlers"""
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.regra = None
+        if request is not None:
+            request.erros_upload = {}
+            request.uploads_verificados = {}
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.regra = REGRAS.get(field_name)
+        self.hash = hashlib.sha256()
+        self.recebidos = 0
+        self.tipo = None
+
+    def _recusar(self, mensagem):
+        if self.request is not None:
+            self.request.erros_upload[self.field_name] = mensagem
+        # Os próximos handlers descartam o que já receberam e o resto do arquivo é ignorado
+        raise SkipFile(mensagem)
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.regra is None:
+            return raw_data
+        limite, tipos, _ = self.regra
+        if start == 0:
+            # O primeiro pedaço (64KB por padrão) já traz a assinatura
+            self.tipo = detectar_tipo(raw_data[:BYTES_CABECALHO])
+            if self.tipo not in tipos:
+                self._recusar(mensagem_tipo(self.field_name))
+        self.recebidos += len(raw_data)
+        if self.recebidos > limite:
+            self._recusar(mensagem_tamanho(self.field_name))
+        self.hash.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.regra is not None and self.tipo is not None and self.request is not None:
+            self.request.uploads_verificados[self.field_name] = (self.hash.hexdigest(), self.tipo)
+        # O arquivo em si é montado pelos handlers padrão (memória ou temporário)
+        return None
+
+
+def arquivo_enviado(request, campo):
+    """
+    (arquivo, erro) de um campo de upload: o UploadedFile vem com .sha256 e
+    .tipo_detectado; se o handler recusou o arquivo, arquivo é None e erro diz o motivo.
+    """
+    arquivo = request.FILES.get(campo)
+    erro = getattr(request, 'erros_upload', {}).get(campo)
+    verificados = getattr(request, 'uploads_verificados', None)
+    if arquivo is not None and verificados is not None:
+        arquivo.sha256, arquivo.tipo_detectado = verificados.get(campo, (None, None))
+        if arquivo.tipo_detectado is None and campo in REGRAS:
+            # Arquivo vazio: nenhum pedaço passou pela verificação
+            return None, mensagem_tipo(campo)
+    return arquivo, erro
+
+
+def tipo_do_arquivo(arquivo):
+    """Tipo de um arquivo já recebido: o detectado no upload ou lendo o cabeçalho"""
+    tipo = getattr(arquivo, 'tipo_detectado', None)
+    if tipo:
+        return tipo
+    arquivo.seek(0)
+    cabecalho = arquivo.read(BYTES_CABECALHO)
+    arquivo.seek(0)
+    return detectar_tipo(cabecalho)
+
+
+def sha256_arquivo(arquivo):
+    """SHA-256 de um arquivo: o calculado no upload ou, na falta dele, lendo o conteúdo"""
+    sha256 = getattr(arquivo, 'sha256', None)
+    if sha256:
+        return sha256
+    hash_ = hashlib.sha256()
+    arquivo.seek(0)
+    for pedaco in arquivo.chunks():
+        hash_.update(pedaco)
+    arquivo.seek(0)
+    return hash_.hexdigest()
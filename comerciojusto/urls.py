@@ -12,13 +12,17 @@ urlpatterns = [
     path('produto/<int:id_produto>/', views.detalhes_produto, name='detalhes_produto'), # Pagina do Produto
     path('perfil/<int:perfil_id>/', views.perfil_publico, name='perfil_publico'), # Perfil público
     path('dashboard/', views.dashboard_perfil, name='dashboard_perfil'), # Página unificada de perfil/feed
+    path('dashboard/secao/<str:secao>/', views.secao_dashboard, name='secao_dashboard'), # Seções do painel carregadas sob demanda
     path('meu-perfil/', views.editar_perfil, name='meu_perfil'), # Edição de perfil
     path('desconectar-google/', views.desconectar_google, name='desconectar_google'), # Desconectar conta Google
     path('caixa-entrada/', views.caixa_entrada, name='caixa_entrada'), # Caixa de entrada para conversa
     path('conversa/<int:usuario_id>/', views.visualizar_conversa, name='visualizar_conversa'), # Visualizar conversa
+    path('conversa/<int:usuario_id>/mensagens/', views.mensagens_conversa, name='mensagens_conversa'), # API de mensagens novas/antigas da conversa
+    path('eventos/', views.eventos, name='eventos'), # Canal em tempo real (SSE, via ASGI)
     path('mensagem/enviar/<int:destinatario_id>/', views.enviar_mensagem, name='enviar_mensagem'), # Enviar mensagem
     path('mensagem/marcar-lida/<int:mensagem_id>/', views.marcar_mensagem_lida, name='marcar_mensagem_lida'), # Marcar mensagem como lida
     path('carrinho/adicionar/', views.adicionar_carrinho, name='adicionar_carrinho'), # adicionar ao carrinho
     path('carrinho/', views.visualizar_carrinho, name='visualizar_carrinho'), # visualizar o carrinho
     path('admin/certificacoes/', views.gerenciar_certificacoes, name='gerenciar_certificacoes'), # admin: gerenciar certificações
+    path('midia/<path:nome>', views.midia_conteudo, name='midia_conteudo'), # Uploads gravados por conteúdo (cache imutável)
 ]
@@ -0,0 +1,81 @@
+"""
+Chaves de cache versionadas por namespace
+
+Cada namespace ("usuario:12", "carrinho:s:<sessao>") tem um número de versão
+guardado no próprio cache e embutido nas chaves dos valores. Invalidar é só
+incrementar a versão: as entradas antigas deixam de ser lidas e expiram pelo
+timeout, sem precisar conhecer ou apagar cada chave.
+
+A versão inicial vem do relógio, para que uma versão despejada do cache e
+recriada não volte a apontar para valores antigos.
+"""
+import time
+
+from django.core.cache import cache
+
+
+def _chave_versao(namespace):
+    return f'versao:{namespace}'
+
+
+def _versao_inicial():
+    return time.time_ns() // 1000
+
+
+def versao(namespace):
+    """Versão atual do namespace (criada na primeira leitura)"""
+    return cache.get_or_set(_chave_versao(namespace), _versao_inicial, None)
+
+
+def versoes(namespaces):
+    """{namespace: versão} de vários namespaces com uma leitura só do cache"""
+    chaves = {_chave_versao(namespace): namespace for namespace in namespaces}
+    encontradas = cache.get_many(list(chaves))
+    return {
+        namespace: encontradas[chave_versao] if chave_versao in encontradas else versao(namespace)
+        for chave_versao, namespace in chaves.items()
+    }
+
+
+def invalidar(namespace):
+    """Descarta todas as entradas do namespace incrementando sua versão"""
+    chave = _chave_versao(namespace)
+    try:
+        cache.incr(chave)
+    except ValueError:
+        # Versão não existia (ou foi despejada): começa de um valor ainda não usado
+        cache.set(chave, _versao_inicial(), None)
+
+
+def chave(namespace, *partes):
+    """Chave do valor `partes` dentro da versão atual do namespace"""
+    return ':'.join([namespace, f'v{versao(namespace)}', *map(str, partes)])
+
+
+def namespace_usuario(usuario_id):
+    return f'usuario:{usuario_id}'
+
+
+def namespace_carrinho(usuario_id=None, sessao_id=None):
+    """Namespace do carrinho pelo dono: usuário logado ou sessão anônima"""
+    if usuario_id:
+        return f'carrinho:u:{usuario_id}'
+    return f'carrinho:s:{sessao_id}'
+
+
+def namespace_produto(produto_id):
+    return f'produto:{produto_id}'
+
+
+def namespace_perfil(perfil_id):
+    """Páginas públicas do perfil (cache_paginas.py)"""
+    return f'perfil:{perfil_id}'
+
+
+def invalidar_perfis(perfil_ids):
+    """Invalida o cache dos usuários donos dos perfis e suas páginas (após UPDATEs em lote, sem signals)"""
+    from .models import Perfil
+
+    for perfil_id, usuario_id in Perfil.objects.filter(pk__in=list(perfil_ids)).values_list('pk', 'user_id'):
+        invalidar(namespace_usuario(usuario_id))
+        invalidar(namespace_perfil(perfil_id))
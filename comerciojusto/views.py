@@ -1,36 +1,50 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.contrib import messages
 from django.contrib.auth.models import User
-from django.http import JsonResponse
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse,
+)
+from django.template.loader import render_to_string
 from django.views.decorators.http import require_POST
-from .models import Perfil, Produto, Carrinho, Mensagem
+from .models import Perfil, Produto, Mensagem
+from .paginacao import paginar_keyset, paginar_lista, tamanho_pagina
+from .busca import buscar_produtos
+from .certificacoes import anexar_arquivo, aprovadas_vigentes
+from .carrinho import (
+    adicionar_item, obter_carrinho, precificar_carrinho, remover_item, transferir_carrinho_sessao,
+)
+from .papeis import EMPRESA, PRODUTOR, perfil_requerido, pode_acessar_perfil, tem_papel
+from .uploads import arquivo_enviado
+from .armazenamento import CACHE_IMUTAVEL, armazenamento_midia, sha256_do_nome
+from .cache_paginas import depende_de, pagina_publica
+from .versoes_cache import namespace_perfil, namespace_produto
+from . import certificacoes, conversas, facetas, geo, painel, tempo_real
 import json
 
 # Comentário geral: seria interessante ajustar para reduzir If/else e Try/Except com classes e afins...
 
-# Funções auxiliares para verificação de grupos
+# Funções auxiliares para verificação de grupos (grupos em cache, ver papeis.py)
 def is_produtor(user):
     """Verifica se o usuário pertence ao grupo Produtor"""
-    return user.groups.filter(name='Produtor').exists()
+    return tem_papel(user, PRODUTOR)
 
 def is_empresa(user):
     """Verifica se o usuário pertence ao grupo Empresa"""
-    return user.groups.filter(name='Empresa').exists()
+    return tem_papel(user, EMPRESA)
 
 def is_produtor_ou_empresa(user):
     """Verifica se o usuário pertence ao grupo Produtor ou Empresa"""
-    return is_produtor(user) or is_empresa(user)
+    return tem_papel(user, PRODUTOR, EMPRESA)
 
 def verifica_acesso_perfil(user, perfil_tipo):
     """Verifica se o usuário tem acesso ao tipo de perfil especificado"""
-    if user.is_superuser:
-        return True
-    if perfil_tipo == 'produtor':
-        return is_produtor(user)
-    elif perfil_tipo == 'empresa':
-        return is_empresa(user)
-    return False
+    return pode_acessar_perfil(user, perfil_tipo)
 
 def acesso_negado(request):
     """View para exibir página de acesso negado"""
@@ -44,9 +58,7 @@ def completar_cadastro_social(request):
     Solicita informações adicionais: tipo de perfil, CPF/CNPJ, etc.
     """
     # Verificar se o usuário já tem perfil
-    perfil_existe = Perfil.objects.filter(user=request.user).exists()
-    
-    if perfil_existe:
+    if request.perfil:
         # Se já tem perfil, redirecionar para dashboard
         return redirect('dashboard_perfil')
     
@@ -148,32 +160,103 @@ def completar_cadastro_social(request):
     return render(request, 'comerciojusto/completar_cadastro_social.html', context)
 
 
+# Ordenação do catálogo: a padrão do modelo + id como desempate para o cursor
+ORDENACAO_CATALOGO = ['-destaque', '-vendas', '-id_produto']
+ORDENACAO_BUSCA = ['-relevancia', '-id_produto']
+# Parâmetros do GET que o catálogo lê (chave do cache da página, cache_paginas.py)
+PARAMETROS_CATALOGO = ('pesquisa', *facetas.PARAMETROS, 'perto', 'raio', 'lat', 'lon', 'cursor', 'por_pagina')
+CONVERSAS_POR_PAGINA = 20
+CERTIFICACOES_POR_PAGINA = 50
+MENSAGENS_POR_PAGINA = 30
+
+
+def _inteiro(valor):
+    """Converte um parâmetro da query string em int (None se inválido)"""
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+def _origem_catalogo(request, perto, estado):
+    """Ponto de partida do filtro por distância: localização do navegador, cidade digitada ou a do próprio perfil"""
+    try:
+        lat, lon = float(request.GET['lat']), float(request.GET['lon'])
+        if -90 <= lat <= 90 and -180 <= lon <= 180:
+            return lat, lon
+    except (KeyError, ValueError):
+        pass
+    if perto:
+        return geo.ler_local(perto, estado)
+    perfil = request.perfil if request.user.is_authenticated else None
+    if perfil and perfil.latitude is not None:
+        return perfil.latitude, perfil.longitude
+    return None
+
+
+@pagina_publica(lambda: facetas.NAMESPACE, parametros=PARAMETROS_CATALOGO)
 def index(request):
-    categoria = request.GET.get('categoria', 'todas')
     pesquisa = request.GET.get('pesquisa', '')
+    filtros = facetas.ler_filtros(request.GET)
+    perto = request.GET.get('perto', '').strip()
+    raio = request.GET.get('raio', '')
+    raio_km = min(int(raio), geo.RAIO_MAXIMO_KM) if raio.isdigit() and int(raio) > 0 else None
     
-    produtos = Produto.objects.all()
-    
-    if categoria != 'todas':
-        produtos = produtos.filter(categoria=categoria)
+    # Categoria, preço, certificado, estado e estoque (facetas.py)
+    produtos = facetas.filtrar(Produto.objects.all(), filtros)
+    ordenacao = ORDENACAO_CATALOGO
     
     if pesquisa:
-        produtos = produtos.filter(nome__icontains=pesquisa) | produtos.filter(descricao__icontains=pesquisa)
-   # Possibilidade de adicionar outras categorias (adubos, fertilizantes, maquinário e etc..) 
-    categorias = [
-        ('todas', 'Todas Categorias'),
-        ('verduras', 'Verduras, folhas e ervas'),
-        ('legumes', 'Legumes Orgânicos'),
-        ('frutas', 'Frutas Orgânicas'),
-        ('condimentos', 'Condimento & Tempero regional'),
-        ('mercearia', 'Mercearia Orgânica'),
-    ]
+        # Busca pelo índice invertido, ordenada por relevância
+        produtos = buscar_produtos(produtos, pesquisa)
+        ordenacao = ORDENACAO_BUSCA
+    
+    # Com um estado marcado, "Campinas" sem UF é procurada nele
+    estado = next(iter(filtros['estado'])) if len(filtros['estado']) == 1 else None
+    origem = _origem_catalogo(request, perto, estado) if raio_km else None
+    ids_no_raio = None
+    if origem:
+        depende_de(request, geo.NAMESPACE)
+        # Contagens das facetas só entre os produtos no raio (com a pesquisa, sem as facetas)
+        no_raio = buscar_produtos(Produto.objects.all(), pesquisa) if pesquisa else Produto.objects.all()
+        ids_no_raio = [chave[-1] for chave in geo.produtos_proximos(no_raio, *origem, raio_km)]
+        # "Perto de mim": perfis no raio pelo índice em memória (geo.py), do mais perto ao mais longe
+        pagina = paginar_lista(
+            geo.produtos_proximos(produtos, *origem, raio_km),
+            cursor=request.GET.get('cursor'),
+            tamanho=tamanho_pagina(request),
+        )
+        por_id = Produto.objects.in_bulk([chave[-1] for chave in pagina['itens']])
+        itens = []
+        for distancia, _, id_produto in pagina['itens']:
+            if id_produto in por_id:
+                por_id[id_produto].distancia_km = distancia
+                itens.append(por_id[id_produto])
+        pagina['itens'] = itens
+    else:
+        # Paginação por cursor: custo constante independente da profundidade da página
+        pagina = paginar_keyset(
+            produtos,
+            ordenacao,
+            cursor=request.GET.get('cursor'),
+            tamanho=tamanho_pagina(request),
+        )
     
     context = {
-        'produtos': produtos,
-        'categorias': categorias,
-        'categoria_selecionada': categoria,
-        'pesquisa': pesquisa
+        'produtos': pagina['itens'],
+        'proximo_cursor': pagina['proximo_cursor'],
+        'cursor_anterior': pagina['cursor_anterior'],
+        'filtros': filtros,
+        'facetas': facetas.montar(request.GET, filtros, pesquisa, ids=ids_no_raio),
+        'filtros_ocultos': [
+            (nome, valor) for nome, valores in request.GET.lists() for valor in valores
+            if nome not in ('perto', 'raio', 'lat', 'lon', 'cursor')
+        ],
+        'pesquisa': pesquisa,
+        'perto': perto,
+        'raios': geo.RAIOS,
+        'raio_selecionado': raio_km,
+        'por_distancia': origem is not None,
+        'local_nao_encontrado': bool(raio_km) and origem is None,
     }
     return render(request, 'comerciojusto/index.html', context)
 
@@ -190,34 +273,7 @@ def login_view(request):
             login(request, user, backend='django.contrib.auth.backends.ModelBackend')
             
             # Transferir carrinho da sessão antiga para o usuário
-            if sessao_id_antiga:
-                carrinho_sessao = Carrinho.objects.filter(sessao_id=sessao_id_antiga).first()
-                if carrinho_sessao and carrinho_sessao.itens:
-                    # Buscar ou criar carrinho do usuário
-                    carrinho_usuario, created = Carrinho.objects.get_or_create(usuario=user)
-                    
-                    # Mesclar itens
-                    itens_usuario = carrinho_usuario.itens or {}
-                    itens_sessao = carrinho_sessao.itens or {}
-                    
-                    for produto_id, dados in itens_sessao.items():
-                        if produto_id in itens_usuario:
-                            # Somar quantidades se produto já existe
-                            itens_usuario[produto_id]['quantidade'] += dados['quantidade']
-                        else:
-                            # Adicionar novo produto
-                            itens_usuario[produto_id] = dados
-                    
-                    # Salvar carrinho do usuário
-                    carrinho_usuario.itens = itens_usuario
-                    carrinho_usuario.rascunho_json = itens_usuario
-                    carrinho_usuario.save()
-                    
-                    # Atualizar sessão
-                    request.session['carrinho_itens'] = len(itens_usuario)
-                    
-                    # Deletar carrinho da sessão
-                    carrinho_sessao.delete()
+            transferir_carrinho_sessao(sessao_id_antiga, user)
             
             return redirect('pos_login')
         return render(request, 'comerciojusto/login.html', {'erro': 'Credenciais inválidas'})
@@ -261,32 +317,7 @@ def cadastro_view(request):
             login(request, user, backend='django.contrib.auth.backends.ModelBackend')
             
             # Transferir carrinho da sessão antiga para o usuário
-            if sessao_id_antiga:
-                carrinho_sessao = Carrinho.objects.filter(sessao_id=sessao_id_antiga).first()
-                if carrinho_sessao and carrinho_sessao.itens:
-                    # Buscar ou criar carrinho do usuário
-                    carrinho_usuario, created = Carrinho.objects.get_or_create(usuario=user)
-                    
-                    # Mesclar itens
-                    itens_usuario = carrinho_usuario.itens or {}
-                    itens_sessao = carrinho_sessao.itens or {}
-                    
-                    for produto_id, dados in itens_sessao.items():
-                        if produto_id in itens_usuario:
-                            itens_usuario[produto_id]['quantidade'] += dados['quantidade']
-                        else:
-                            itens_usuario[produto_id] = dados
-                    
-                    # Salvar carrinho do usuário
-                    carrinho_usuario.itens = itens_usuario
-                    carrinho_usuario.rascunho_json = itens_usuario
-                    carrinho_usuario.save()
-                    
-                    # Atualizar sessão
-                    request.session['carrinho_itens'] = len(itens_usuario)
-                    
-                    # Deletar carrinho da sessão
-                    carrinho_sessao.delete()
+            transferir_carrinho_sessao(sessao_id_antiga, user)
             
             return redirect('dashboard_perfil')
         except Exception as e:
@@ -300,49 +331,24 @@ def logout_view(request):
 @login_required(login_url='login')
 def pos_login(request):
     # Verificar se o usuário tem perfil
-    try:
-        perfil = Perfil.objects.get(user=request.user)
+    if request.perfil:
         # Tem perfil, vai para dashboard
         return redirect('dashboard_perfil')
-    except Perfil.DoesNotExist:
-        # Não tem perfil, precisa completar cadastro
-        return redirect('completar_cadastro_social')
+    # Não tem perfil, precisa completar cadastro
+    return redirect('completar_cadastro_social')
 
 
 @login_required(login_url='login')
+@perfil_requerido
 def dashboard_perfil(request):
-    # Verificar se o usuário tem perfil
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-    except Perfil.DoesNotExist:
-        # Se for admin/superuser sem perfil, redirecionar para admin
-        if request.user.is_superuser or request.user.is_staff:
-            return redirect('/admin/')
-        # Se for usuário comum sem perfil, redirecionar para completar cadastro
-        return redirect('completar_cadastro_social')
-    
-    # Verificar se o usuário tem permissão para acessar este tipo de perfil
-    if not verifica_acesso_perfil(request.user, perfil.tipo):
-        return redirect('acesso_negado')
-    
-    produtos = None
-    pedidos = None
-    
-    # Para produtor e empresa visualizar seus produtos
-    if perfil.tipo in ['produtor', 'empresa']:
-        produtos = Produto.objects.filter(perfil=perfil)
-    
-    # Para produtor e empresa verificar seus pedidos (pedidos dos produtos deles)
-    if perfil.tipo in ['produtor', 'empresa']:
-        from .models import Pedido
-        # Buscar pedidos que contenham produtos do perfil
-        pedidos = Pedido.objects.filter(
-            itempedido__produto__perfil=perfil
-        ).distinct().order_by('-data_pedido')
+    # Perfil do cache (middleware.py), já com acesso verificado por perfil_requerido
+    perfil = request.perfil
 
     # Gerenciar certificações
     from .models import Certificacao
     erro_certificacao = None
+    erro_produto = None
+    erro_logo = None
     if request.method == 'POST':
         
         if 'excluir_produto_id' in request.POST:
@@ -356,9 +362,11 @@ def dashboard_perfil(request):
         if 'nome_produto' in request.POST and perfil.tipo in ['produtor', 'empresa']:
             nome = request.POST.get('nome_produto')
             preco = request.POST.get('preco_produto')
-            imagem = request.FILES.get('imagem_produto')
+            # Tipo e tamanho já verificados no recebimento (uploads.py)
+            imagem, erro_produto = arquivo_enviado(request, 'imagem_produto')
             descricao = request.POST.get('descricao_produto', '')
             categoria = request.POST.get('categoria_produto', 'todas')
+            estoque = request.POST.get('estoque_produto', '').strip()
             
             # Obter ou criar o produtor vinculado apenas se for tipo 'produtor'
             from .models import Produtor
@@ -377,7 +385,7 @@ def dashboard_perfil(request):
                     )
             
             # Para empresas, produtor fica None (campo agora é opcional)
-            if nome and preco and categoria:
+            if nome and preco and categoria and not erro_produto:
                 Produto.objects.create(
                     nome=nome,
                     preco=preco,
@@ -385,30 +393,40 @@ def dashboard_perfil(request):
                     perfil=perfil,
                     imagem=imagem,
                     descricao=descricao,
-                    categoria=categoria
+                    categoria=categoria,
+                    estoque=int(estoque) if estoque.isdigit() else None
                 )
-            return redirect('dashboard_perfil')
+            if not erro_produto:
+                return redirect('dashboard_perfil')
 
         # Envio da certificação (vincular a um produto)
         if 'nova_certificacao' in request.POST:
             produto_id = request.POST.get('produto_certificacao', '').strip()
             validade = request.POST.get('validade_certificacao', '').strip()
-            arquivo = request.FILES.get('arquivo_certificado')
+            arquivo, erro_arquivo = arquivo_enviado(request, 'arquivo_certificado')
             
-            if not produto_id or not arquivo:
+            if erro_arquivo:
+                erro_certificacao = erro_arquivo
+            elif not produto_id or not arquivo:
                 erro_certificacao = 'Selecione um produto e envie o arquivo da certificação.'
             else:
                 produto = Produto.objects.filter(id_produto=produto_id, perfil=perfil).first()
                 if produto:
-                    cert = Certificacao.objects.create(
+                    cert = Certificacao(
                         perfil=perfil,
                         produto=produto,
                         status='enviado_analise',
-                        arquivo_certificado=arquivo,
                         validade=validade if validade else None,
                         data_certificacao=None
                     )
-                    return redirect('dashboard_perfil')
+                    anexar_arquivo(cert, arquivo)
+                    try:
+                        cert.full_clean()
+                    except ValidationError as e:
+                        erro_certificacao = ' '.join(e.messages)
+                    else:
+                        cert.save()
+                        return redirect('dashboard_perfil')
                 else:
                     erro_certificacao = 'Produto inválido.'
 
@@ -416,24 +434,45 @@ def dashboard_perfil(request):
         if 'atualizar_perfil' in request.POST:
             perfil.descricao = request.POST.get('descricao', perfil.descricao)
             perfil.bio = request.POST.get('bio', perfil.bio)
-            if 'logo' in request.FILES:
-                perfil.logo = request.FILES['logo']
-            perfil.save()
-            return redirect('dashboard_perfil')
-
-    # Certificações do perfil
-    certificacoes = perfil.certificacoes.all().order_by('-id_certificacao')
+            # Tipo e tamanho verificados no recebimento; um logo recusado volta com o motivo
+            logo, erro_logo = arquivo_enviado(request, 'logo')
+            if logo:
+                perfil.logo = logo
+            # Só os campos do formulário: o perfil em cache pode ter agregados desatualizados
+            perfil.save(update_fields=['descricao', 'bio', 'logo'])
+            if not erro_logo:
+                return redirect('dashboard_perfil')
+
+    # Produtos, pedidos, certificações e avaliações são carregados por secao_dashboard;
+    # aqui só as opções do formulário de certificação
     context = {
         'perfil': perfil,
-        'produtos': produtos,
-        'pedidos': pedidos,
         'user': request.user,
-        'certificacoes': certificacoes,
+        'opcoes_produtos': Produto.objects.filter(perfil=perfil).order_by('nome').values_list('id_produto', 'nome'),
         'erro_certificacao': erro_certificacao,
+        'erro_produto': erro_produto,
+        'erro_logo': erro_logo,
     }
     return render(request, 'comerciojusto/dashboard_perfil.html', context)
 
 
+@login_required(login_url='login')
+@perfil_requerido
+def secao_dashboard(request, secao):
+    """Fragmento HTML paginado de uma seção do painel (ver painel.py)"""
+    perfil = request.perfil
+    if secao not in painel.secoes_do_perfil(perfil):
+        raise Http404('Seção inexistente')
+    
+    consulta, template, por_pagina, _, _ = painel.SECOES[secao]
+    with painel.contar_consultas() as consultas:
+        pagina = Paginator(consulta(perfil), por_pagina).get_page(request.GET.get('pagina'))
+        html = render_to_string(template, {'pagina': pagina, 'perfil': perfil}, request=request)
+    painel.verificar_orcamento(secao, consultas['total'])
+    return HttpResponse(html)
+
+
+@pagina_publica(lambda id_produto: namespace_produto(id_produto))
 def detalhes_produto(request, id_produto):
     produto = get_object_or_404(Produto, id_produto=id_produto)
     
@@ -444,29 +483,29 @@ def detalhes_produto(request, id_produto):
     else:
         produtor_info = None
         perfil_produto = produto.perfil
+    if perfil_produto:
+        # A página mostra o vendedor, as avaliações e as certificações dele
+        depende_de(request, namespace_perfil(perfil_produto.pk))
     
-    from .models import Avaliacao, Certificacao
-    avaliacoes = Avaliacao.objects.filter(perfil=perfil_produto)
-    certificacoes_aprovadas = Certificacao.objects.filter(perfil=perfil_produto, status='aprovada')
+    from .models import Avaliacao
+    # Média e histograma vêm dos agregados do perfil; aqui só as mais recentes
+    avaliacoes = Avaliacao.objects.filter(perfil=perfil_produto).select_related('usuario')[:10]
     
-    # Verificar se este produto específico tem certificação aprovada
-    produto_certificado = Certificacao.objects.filter(
-        produto=produto, 
-        status='aprovada'
-    ).exists()
+    # Estado de certificação desnormalizado: só consulta a lista se o perfil tiver alguma
+    certificacoes_aprovadas = []
+    if perfil_produto and perfil_produto.certificado_vigente:
+        certificacoes_aprovadas = aprovadas_vigentes(perfil_produto.certificacoes.all())
+    produto_certificado = produto.certificado_vigente
     
     # Avaliação
     erro_avaliacao = None
     if request.method == 'POST' and request.user.is_authenticated:
         estrelas_raw = request.POST.get('estrelas', '').strip()
         comentario = request.POST.get('comentario', '').strip()
-        if estrelas_raw.isdigit():
-            estrelas = int(estrelas_raw)
-            if estrelas > 0:
-                Avaliacao.objects.create(perfil=perfil_produto, usuario=request.user, estrelas=estrelas, comentario=comentario)
-                return redirect('detalhes_produto', id_produto=produto.id_produto)
-        else:
-            erro_avaliacao = 'Selecione sua estrela para avaliar.'
+        if estrelas_raw.isdigit() and 1 <= int(estrelas_raw) <= 5:
+            Avaliacao.objects.create(perfil=perfil_produto, usuario=request.user, estrelas=int(estrelas_raw), comentario=comentario)
+            return redirect('detalhes_produto', id_produto=produto.id_produto)
+        erro_avaliacao = 'Selecione de 1 a 5 estrelas para avaliar.'
     context = {
         'produto': produto,
         'produtor_info': produtor_info,
@@ -482,111 +521,109 @@ def detalhes_produto(request, id_produto):
 from django.contrib.auth.decorators import user_passes_test
 @user_passes_test(lambda u: u.is_superuser)
 def gerenciar_certificacoes(request):
+    """Fila de análise: paginada, filtrável e com decisão em lote (ver certificacoes.decidir)"""
     from .models import Certificacao
-    certificacoes = Certificacao.objects.exclude(status='aprovada').order_by('-id_certificacao')
-    msg = None
     if request.method == 'POST':
-        cert_id = request.POST.get('cert_id')
+        # Cada linha marcada vem com a versão que o auditor viu
+        versoes = {}
+        for cert_id in request.POST.getlist('selecionadas'):
+            versao = request.POST.get(f'versao_{cert_id}', '')
+            if cert_id.isdigit() and versao.isdigit():
+                versoes[int(cert_id)] = int(versao)
         acao = request.POST.get('acao')
-        parecer = request.POST.get('parecer', '').strip()
-        cert = Certificacao.objects.filter(id_certificacao=cert_id).first()
-        if cert:
-            if acao == 'aprovar':
-                cert.status = 'aprovada'
-                cert.parecer = parecer
-            elif acao == 'reprovar':
-                cert.status = 'reprovada'
-                cert.parecer = parecer
-            cert.save()
-            msg = 'Certificação atualizada com sucesso.'
-    return render(request, 'comerciojusto/gerenciar_certificacoes.html', {'certificacoes': certificacoes, 'msg': msg})
-
-
-@login_required(login_url='login')
+        if not versoes or acao not in ('aprovar', 'reprovar'):
+            messages.error(request, 'Selecione ao menos uma certificação.')
+        else:
+            decididas, conflitos = certificacoes.decidir(
+                versoes,
+                aprovar=acao == 'aprovar',
+                parecer=request.POST.get('parecer', '').strip(),
+                administrador=certificacoes.administrador_do_usuario(request.user),
+            )
+            messages.success(request, f'{decididas} certificação(ões) atualizada(s) com sucesso.')
+            if conflitos:
+                messages.warning(
+                    request, f'{conflitos} já tinha(m) sido decidida(s) por outro auditor e foi(ram) ignorada(s).'
+                )
+        # Volta para a mesma página e filtros
+        return redirect(request.get_full_path())
+
+    status = request.GET.get('status', 'enviado_analise')
+    busca = request.GET.get('q', '').strip()
+    fila = Certificacao.objects.select_related('perfil__user', 'produto').order_by('id_certificacao')
+    if status in dict(Certificacao.STATUS_CHOICES):
+        fila = fila.filter(status=status)
+    if busca:
+        fila = fila.filter(
+            Q(perfil__user__username__icontains=busca) | Q(produto__nome__icontains=busca)
+        )
+    pagina = Paginator(fila, CERTIFICACOES_POR_PAGINA).get_page(request.GET.get('pagina'))
+    filtros = request.GET.copy()
+    filtros.pop('pagina', None)
+    return render(request, 'comerciojusto/gerenciar_certificacoes.html', {
+        'pagina': pagina,
+        'status': status,
+        'busca': busca,
+        'opcoes_status': Certificacao.STATUS_CHOICES,
+        'filtros': filtros.urlencode(),
+        'decidiveis': certificacoes.EM_ANALISE,
+    })
 
 
 @login_required(login_url='login')
 def caixa_entrada(request):
-    from django.db.models import Q, Max
+    from .models import Conversa
     
-    # Processar ações (excluir, marcar como não lida)
+    # Processar ações (excluir, marcar como não lida) sobre as conversas selecionadas
     if request.method == 'POST':
         acao = request.POST.get('acao')
-        mensagens_ids = request.POST.getlist('mensagens_selecionadas')
+        conversas_ids = request.POST.getlist('conversas_selecionadas')
+        selecionadas = Conversa.objects.filter(
+            Q(usuario_a=request.user) | Q(usuario_b=request.user),
+            id_conversa__in=conversas_ids
+        )
         
-        if acao == 'excluir' and mensagens_ids:
-            Mensagem.objects.filter(
-                Q(remetente=request.user) | Q(destinatario=request.user),
-                id_mensagem__in=mensagens_ids
-            ).delete()
-        elif acao == 'marcar_nao_lida' and mensagens_ids:
-            Mensagem.objects.filter(
-                destinatario=request.user,
-                id_mensagem__in=mensagens_ids
-            ).update(lida=False)
+        if acao == 'excluir' and conversas_ids:
+            # Só some da caixa de quem excluiu; o outro participante mantém o histórico
+            for conversa in selecionadas:
+                conversas.excluir_da_caixa(conversa, request.user)
+        elif acao == 'marcar_nao_lida' and conversas_ids:
+            # Marca como não lida a última mensagem recebida de cada conversa
+            for conversa in selecionadas:
+                ultima_recebida = conversa.mensagens.filter(destinatario=request.user).order_by('-id_mensagem').first()
+                if ultima_recebida and ultima_recebida.lida:
+                    Mensagem.objects.filter(pk=ultima_recebida.pk).update(lida=False)
+                    conversas.recalcular_conversa(conversa.pk)
         
         return redirect('caixa_entrada')
     
-    # Buscar todas as mensagens do usuário
-    mensagens = Mensagem.objects.filter(
-        Q(remetente=request.user) | Q(destinatario=request.user)
-    )
-    
-    # Agrupar por conversas (identificar o outro usuário)
-    conversas_dict = {}
-    for msg in mensagens:
-        outro_usuario = msg.destinatario if msg.remetente == request.user else msg.remetente
-        
-        if outro_usuario.id not in conversas_dict:
-            conversas_dict[outro_usuario.id] = {
-                'usuario': outro_usuario,
-                'mensagens': [],
-                'ultima_mensagem': msg,
-                'nao_lidas': 0
-            }
-        
-        conversas_dict[outro_usuario.id]['mensagens'].append(msg)
-        
-        # Atualizar última mensagem se for mais recente
-        if msg.criada_em > conversas_dict[outro_usuario.id]['ultima_mensagem'].criada_em:
-            conversas_dict[outro_usuario.id]['ultima_mensagem'] = msg
-        
-        # Contar não lidas
-        if msg.destinatario == request.user and not msg.lida:
-            conversas_dict[outro_usuario.id]['nao_lidas'] += 1
-    
-    # Ordenar conversas por última mensagem
-    conversas = sorted(
-        conversas_dict.values(),
-        key=lambda x: x['ultima_mensagem'].criada_em,
-        reverse=True
-    )
-    
-    # Total de mensagens não lidas
-    total_nao_lidas = sum(c['nao_lidas'] for c in conversas)
+    # Uma consulta paginada sobre o resumo das conversas (sem carregar as mensagens)
+    paginador = Paginator(conversas.conversas_do_usuario(request.user), CONVERSAS_POR_PAGINA)
+    pagina = paginador.get_page(request.GET.get('pagina'))
+    lista_conversas = [
+        {
+            'id': conversa.id_conversa,
+            'usuario': conversa.outro_participante(request.user),
+            'ultima_mensagem': conversa.ultima_mensagem,
+            'nao_lidas': conversa.nao_lidas_para(request.user),
+        }
+        for conversa in pagina
+    ]
     
     context = {
-        'conversas': conversas,
-        'total_nao_lidas': total_nao_lidas,
+        'conversas': lista_conversas,
+        'pagina': pagina,
+        'total_conversas': paginador.count,
+        'total_nao_lidas': conversas.total_nao_lidas(request.user),
     }
     return render(request, 'comerciojusto/caixa_entrada.html', context)
 
 
 @login_required(login_url='login')
 def visualizar_conversa(request, usuario_id):
-    """View para visualizar uma conversa completa com outro usuário"""
-    from django.db.models import Q
-    
+    """View para visualizar uma conversa com outro usuário (últimas mensagens, antigas sob demanda)"""
     outro_usuario = get_object_or_404(User, id=usuario_id)
-    
-    # Buscar todas as mensagens entre os dois usuários
-    mensagens = Mensagem.objects.filter(
-        Q(remetente=request.user, destinatario=outro_usuario) |
-        Q(remetente=outro_usuario, destinatario=request.user)
-    ).order_by('criada_em')
-    
-    # Marcar como lidas as mensagens recebidas
-    mensagens.filter(destinatario=request.user, lida=False).update(lida=True)
+    conversa = conversas.obter_conversa(request.user.id, outro_usuario.id, criar=False)
     
     # Enviar nova mensagem
     if request.method == 'POST':
@@ -600,13 +637,82 @@ def visualizar_conversa(request, usuario_id):
             )
             return redirect('visualizar_conversa', usuario_id=usuario_id)
     
+    # Janela das mensagens mais recentes (ou anteriores ao cursor ?antes=<id_mensagem>)
+    mensagens, ha_mais_antigas = [], False
+    if conversa:
+        mensagens, ha_mais_antigas = conversas.janela_mensagens(
+            conversa, request.user, MENSAGENS_POR_PAGINA, antes=_inteiro(request.GET.get('antes'))
+        )
+        # Marcar como lidas apenas as mensagens recebidas exibidas nesta janela
+        conversas.marcar_entregues(conversa, request.user, mensagens)
+    
     context = {
         'outro_usuario': outro_usuario,
         'mensagens': mensagens,
+        'cursor_antigas': mensagens[0].id_mensagem if ha_mais_antigas else None,
+        'ultima_id': mensagens[-1].id_mensagem if mensagens else 0,
+        'janela_antiga': bool(request.GET.get('antes')),
     }
     return render(request, 'comerciojusto/visualizar_conversa.html', context)
 
 
+@login_required(login_url='login')
+def mensagens_conversa(request, usuario_id):
+    """
+    API JSON da conversa: ?desde=<id> devolve só as mensagens mais novas (polling);
+    ?antes=<id> devolve a página anterior do histórico.
+    """
+    outro_usuario = get_object_or_404(User, id=usuario_id)
+    conversa = conversas.obter_conversa(request.user.id, outro_usuario.id, criar=False)
+    if conversa is None:
+        return JsonResponse({'mensagens': [], 'ultima_id': 0, 'cursor_antigas': None})
+    
+    antes = _inteiro(request.GET.get('antes'))
+    ultima_id = _inteiro(request.GET.get('desde')) or 0
+    cursor_antigas = None
+    if antes:
+        mensagens, ha_mais_antigas = conversas.janela_mensagens(
+            conversa, request.user, MENSAGENS_POR_PAGINA, antes=antes
+        )
+        cursor_antigas = mensagens[0].id_mensagem if ha_mais_antigas else None
+    else:
+        mensagens = conversas.mensagens_desde(conversa, request.user, ultima_id, MENSAGENS_POR_PAGINA)
+        if mensagens:
+            ultima_id = mensagens[-1].id_mensagem
+    conversas.marcar_entregues(conversa, request.user, mensagens)
+    
+    return JsonResponse({
+        'mensagens': [
+            {
+                'id': m.id_mensagem,
+                'assunto': m.assunto,
+                'corpo': m.corpo,
+                'criada_em': m.criada_em.isoformat(),
+                'enviada': m.remetente_id == request.user.id,
+            }
+            for m in mensagens
+        ],
+        'ultima_id': ultima_id,
+        'cursor_antigas': cursor_antigas,
+    })
+
+
+@login_required(login_url='login')
+async def eventos(request):
+    """
+    Canal Server-Sent Events com as mensagens novas e a contagem de não lidas do usuário.
+    Só funciona servido pelo ASGI (webapp.asgi); no WSGI responde 204 e o navegador
+    segue no polling, para não prender uma thread por conexão.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    usuario = await request.auser()
+    resposta = StreamingHttpResponse(tempo_real.fluxo_eventos(usuario.id), content_type='text/event-stream')
+    resposta['Cache-Control'] = 'no-cache'
+    resposta['X-Accel-Buffering'] = 'no'
+    return resposta
+
+
 @require_POST
 def adicionar_carrinho(request):
     produto_id = request.POST.get('produto_id')
@@ -617,33 +723,8 @@ def adicionar_carrinho(request):
     except Produto.DoesNotExist:
         return JsonResponse({'success': False, 'message': 'Produto não encontrado'})
     
-    if request.user.is_authenticated:
-        carrinho, created = Carrinho.objects.get_or_create(usuario=request.user)
-    else:
-        # Garantir que a sessão existe
-        if not request.session.session_key:
-            request.session.create()
-        sessao_id = request.session.session_key
-        
-        carrinho, created = Carrinho.objects.get_or_create(sessao_id=sessao_id)
-    
-    itens = carrinho.itens or {}
-    
-    if str(produto_id) in itens:
-        itens[str(produto_id)]['quantidade'] += quantidade
-    else:
-        itens[str(produto_id)] = {
-            'quantidade': quantidade,
-            'preco': str(produto.preco),
-            'nome': produto.nome,
-        }
-    
-    carrinho.itens = itens
-    carrinho.rascunho_json = itens
-    carrinho.save()
-    
-    request.session['carrinho_itens'] = len(itens)
-    request.session.modified = True  # Forçar salvamento da sessão
+    carrinho = obter_carrinho(request, criar=True)
+    adicionar_item(carrinho, produto, max(quantidade, 1))
     
     from django.shortcuts import redirect
     return redirect('visualizar_carrinho')
@@ -651,69 +732,35 @@ def adicionar_carrinho(request):
 
 def visualizar_carrinho(request):
 
-    carrinho = None
-    if request.user.is_authenticated:
-        carrinho = Carrinho.objects.filter(usuario=request.user).first()
-    else:
-        sessao_id = request.session.session_key
-        carrinho = Carrinho.objects.filter(sessao_id=sessao_id).first()
+    carrinho = obter_carrinho(request)
 
     if request.method == 'POST' and 'remover_produto_id' in request.POST:
-        produto_id_remover = request.POST.get('remover_produto_id')
-        if carrinho and carrinho.itens and produto_id_remover in carrinho.itens:
-            itens_carrinho = carrinho.itens
-            itens_carrinho.pop(produto_id_remover, None)
-            carrinho.itens = itens_carrinho
-            carrinho.rascunho_json = itens_carrinho
-            carrinho.save()
-            request.session['carrinho_itens'] = len(itens_carrinho)
+        produto_id_remover = _inteiro(request.POST.get('remover_produto_id'))
+        if carrinho and produto_id_remover and remover_item(carrinho, produto_id_remover):
             return redirect('visualizar_carrinho')
 
-    itens = []
-    total = 0
-    
-    if carrinho and carrinho.itens:
-        for produto_id, info in carrinho.itens.items():
-            try:
-                produto = Produto.objects.get(id_produto=produto_id)
-                subtotal = float(info['preco']) * info['quantidade']
-                itens.append({
-                    'produto': produto,
-                    'quantidade': info['quantidade'],
-                    'subtotal': subtotal,
-                })
-                total += subtotal
-            except Produto.DoesNotExist:
-                pass
+    precificacao = precificar_carrinho(carrinho)
     
     context = {
-        'itens': itens,
-        'total': total,
+        'itens': precificacao['itens'],
+        'total': precificacao['total'],
+        'precos_alterados': precificacao['precos_alterados'],
+        'indisponiveis': precificacao['indisponiveis'],
         'carrinho': carrinho,
     }
     return render(request, 'comerciojusto/carrinho.html', context)
 
 
 @login_required(login_url='login')
+@perfil_requerido
 def editar_perfil(request):
     """View para edição completa do perfil do usuário"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-    except Perfil.DoesNotExist:
-        # Se for admin/superuser sem perfil, redirecionar para admin
-        if request.user.is_superuser or request.user.is_staff:
-            return redirect('/admin/')
-        # Se não tem perfil, redirecionar para completar cadastro social
-        return redirect('completar_cadastro_social')
-    
-    # Verificar se o usuário tem permissão para acessar este tipo de perfil
-    if not verifica_acesso_perfil(request.user, perfil.tipo):
-        return redirect('acesso_negado')
+    perfil = request.perfil
     
     if request.method == 'POST':
         # Atualizar dados do usuário
         request.user.first_name = request.POST.get('nome', request.user.first_name)
-        request.user.save()
+        request.user.save(update_fields=['first_name'])
         
         # Atualizar dados do perfil
         perfil.bio = request.POST.get('bio', perfil.bio)
@@ -724,17 +771,25 @@ def editar_perfil(request):
         perfil.cidade = request.POST.get('cidade', perfil.cidade)
         perfil.estado = request.POST.get('estado', perfil.estado)
         
-        # Upload de foto de perfil
-        if 'logo' in request.FILES:
-            perfil.logo = request.FILES['logo']
+        # Upload de foto de perfil (tipo e tamanho verificados no recebimento)
+        logo, erro_logo = arquivo_enviado(request, 'logo')
+        if logo:
+            perfil.logo = logo
         
-        perfil.save()
+        # Só os campos do formulário: o perfil em cache pode ter agregados desatualizados
+        perfil.save(update_fields=[
+            'bio', 'descricao', 'contato_adicional', 'cpf_cnpj', 'endereco', 'cidade', 'estado', 'logo',
+        ])
         
-        return redirect('meu_perfil')
+        if not erro_logo:
+            return redirect('meu_perfil')
+    else:
+        erro_logo = None
     
     context = {
         'perfil': perfil,
         'user': request.user,
+        'erro_logo': erro_logo,
     }
     return render(request, 'comerciojusto/meu_perfil.html', context)
 
@@ -780,24 +835,25 @@ def enviar_mensagem(request, destinatario_id):
 def marcar_mensagem_lida(request, mensagem_id):
     """View para marcar mensagem como lida"""
     mensagem = get_object_or_404(Mensagem, id_mensagem=mensagem_id, destinatario=request.user)
-    mensagem.lida = True
-    mensagem.save()
+    if mensagem.conversa:
+        conversas.marcar_lidas(mensagem.conversa, request.user, ids=[mensagem.id_mensagem])
     return redirect('caixa_entrada')
 
 
+@pagina_publica(lambda perfil_id: namespace_perfil(perfil_id))
 def perfil_publico(request, perfil_id):
     """View para exibir perfil público de produtor/empresa"""
     perfil = get_object_or_404(Perfil, id=perfil_id)
     produtos = Produto.objects.filter(perfil=perfil, ativo=True)
     
-    from .models import Certificacao
-    certificacoes_aprovadas = Certificacao.objects.filter(
-        perfil=perfil, 
-        status='aprovada'
-    )
+    certificacoes_aprovadas = []
+    if perfil.certificado_vigente:
+        certificacoes_aprovadas = aprovadas_vigentes(
+            perfil.certificacoes.select_related('produto')
+        )
     
     from .models import Avaliacao
-    avaliacoes = Avaliacao.objects.filter(perfil=perfil).order_by('-data_avaliacao')[:10]
+    avaliacoes = Avaliacao.objects.filter(perfil=perfil).select_related('usuario').order_by('-data_avaliacao')[:10]
     
     context = {
         'perfil': perfil,
@@ -808,3 +864,17 @@ def perfil_publico(request, perfil_id):
     return render(request, 'comerciojusto/perfil_publico.html', context)
 
 
+def midia_conteudo(request, nome):
+    """Mídia do armazenamento por conteúdo: o nome é o hash do arquivo, então pode ficar em cache para sempre"""
+    sha256 = sha256_do_nome(nome)
+    storage = armazenamento_midia()
+    if not sha256 or not storage.exists(nome):
+        raise Http404('Arquivo inexistente')
+    etag = f'"{sha256}"'
+    if request.headers.get('If-None-Match') == etag:
+        resposta = HttpResponseNotModified()
+    else:
+        resposta = FileResponse(storage.open(nome, 'rb'))
+    resposta['ETag'] = etag
+    resposta['Cache-Control'] = CACHE_IMUTAVEL
+    return resposta
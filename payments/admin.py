@@ -1,3 +1,17 @@
 from django.contrib import admin
+from .models import EventoStripe, SessaoCheckout
 
-# Register your models here.
+
+@admin.register(SessaoCheckout) # Sessões de checkout do Stripe
+class SessaoCheckoutAdmin(admin.ModelAdmin):
+    list_display = ('id_sessao', 'usuario', 'total', 'status', 'pedido', 'sem_estoque', 'criada_em')
+    list_filter = ('status',)
+    search_fields = ('id_sessao', 'usuario__username', 'usuario__email')
+    raw_id_fields = ('usuario', 'pedido')
+
+@admin.register(EventoStripe) # Eventos recebidos pelo webhook
+class EventoStripeAdmin(admin.ModelAdmin):
+    list_display = ('id_evento', 'tipo', 'status', 'tentativas', 'proxima_tentativa', 'recebido_em', 'atualizado_em')
+    list_filter = ('status', 'tipo')
+    search_fields = ('id_evento',)
+    readonly_fields = ('recebido_em',)
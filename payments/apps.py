@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PaymentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'payments'
+
+    def ready(self):
+        from . import cliente_stripe, ingestao  # noqa: F401 (registram tarefas)
+        cliente_stripe.configurar()
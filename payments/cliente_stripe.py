@@ -0,0 +1,55 @@
+"""
+Cliente HTTP do Stripe compartilhado pelo processo
+
+Uma requests.Session com pool de conexões (keep-alive com a API em vez de um
+handshake TLS por checkout), timeout curto e retentativas limitadas do próprio
+SDK (que reenvia com a mesma Idempotency-Key, sem criar sessões duplicadas).
+STRIPE_API_BASE permite apontar para o servidor falso local
+(python manage.py stripe_falso). Configurado no ready() do app.
+"""
+import hashlib
+import hmac
+import time
+
+import requests
+import stripe
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from comerciojusto.tarefas import tarefa
+
+TAMANHO_POOL = 10
+
+
+def configurar():
+    """Aplica as configurações do settings ao SDK do Stripe"""
+    sessao = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=TAMANHO_POOL, pool_maxsize=TAMANHO_POOL)
+    sessao.mount('https://', adaptador)
+    sessao.mount('http://', adaptador)
+
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    stripe.api_base = getattr(settings, 'STRIPE_API_BASE', 'https://api.stripe.com')
+    stripe.max_network_retries = getattr(settings, 'STRIPE_MAX_RETRIES', 2)
+    stripe.default_http_client = stripe.RequestsClient(
+        timeout=getattr(settings, 'STRIPE_TIMEOUT', 10), session=sessao
+    )
+
+
+def assinar_payload(payload, segredo, timestamp=None):
+    """Cabeçalho Stripe-Signature de um payload: HMAC-SHA256 de "{timestamp}.{payload}" """
+    timestamp = int(timestamp or time.time())
+    assinatura = hmac.new(
+        (segredo or '').encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256
+    ).hexdigest()
+    return f't={timestamp},v1={assinatura}'
+
+
+@tarefa('stripe.expirar_sessao')
+def expirar_sessao(sessao_id):
+    """Encerra no Stripe uma sessão de checkout que foi substituída"""
+    try:
+        stripe.checkout.Session.expire(sessao_id)
+    except stripe.InvalidRequestError:
+        # Já expirada ou já paga: nada a fazer (se foi paga, o webhook monta o pedido)
+        pass
@@ -0,0 +1,195 @@
+"""
+Ingestão de pedidos a partir dos eventos do webhook do Stripe
+
+1. O webhook valida a assinatura, grava o evento bruto (EventoStripe, com o id
+   do evento como chave de idempotência) e responde 200 na hora.
+2. Uma tarefa em segundo plano (comerciojusto/tarefas.py, ou o comando
+   processar_eventos_stripe) reivindica os eventos pendentes com um UPDATE
+   condicional e materializa Pedido, ItemPedido, estoque e vendas numa única
+   transação por lote, com um savepoint por evento. Evento com erro volta à
+   fila depois de uma espera exponencial (proxima_tentativa, como as Tarefas),
+   até MAX_TENTATIVAS.
+
+Cada SessaoCheckout só vira pedido uma vez: a troca de status aberta -> paga é
+um UPDATE condicional, então eventos diferentes da mesma sessão (completed e
+async_payment_succeeded) não duplicam o pedido. As reservas de estoque da sessão
+(estoque.py) viram venda no pagamento e voltam ao estoque se a sessão expirar.
+Pagamento que chega depois de a reserva voltar ao estoque baixa com o mesmo
+UPDATE condicional; se não há mais estoque, o pedido é criado e a quantidade
+fica em SessaoCheckout.sem_estoque para reembolso, sem estoque negativo.
+"""
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from comerciojusto.tarefas import enfileirar, espera, tarefa
+
+logger = logging.getLogger(__name__)
+
+EVENTOS_PAGAMENTO = {'checkout.session.completed', 'checkout.session.async_payment_succeeded'}
+EVENTOS_EXPIRACAO = {'checkout.session.expired', 'checkout.session.async_payment_failed'}
+STATUS_PAGOS = {'paid', 'no_payment_required'}
+
+# Evento "processando" há mais tempo que isso é de um worker que morreu: volta para a fila
+TEMPO_REIVINDICACAO = timedelta(minutes=5)
+MAX_TENTATIVAS = 5
+TAMANHO_LOTE = 50
+
+
+def registrar_evento(evento):
+    """Grava o evento bruto do Stripe; retorna False se ele já tinha sido recebido"""
+    from .models import EventoStripe
+
+    _, criado = EventoStripe.objects.get_or_create(
+        id_evento=evento['id'],
+        defaults={'tipo': evento.get('type', ''), 'payload': evento},
+    )
+    return criado
+
+
+def _fila(agora):
+    return (
+        Q(status='pendente')
+        | Q(status='processando', atualizado_em__lt=agora - TEMPO_REIVINDICACAO)
+        | Q(status='erro', tentativas__lt=MAX_TENTATIVAS)
+        & (Q(proxima_tentativa__lte=agora) | Q(proxima_tentativa__isnull=True))
+    )
+
+
+def reivindicar_eventos(limite=TAMANHO_LOTE):
+    """Marca até `limite` eventos da fila como 'processando' para este worker e os retorna"""
+    from .models import EventoStripe
+
+    agora = timezone.now()
+    ids = list(
+        EventoStripe.objects.filter(_fila(agora)).order_by('recebido_em').values_list('pk', flat=True)[:limite]
+    )
+    if not ids:
+        return []
+    # O horário do UPDATE serve de marca: outro worker que disputou os mesmos ids
+    # só leva os que ele próprio conseguiu trocar
+    marca = timezone.now()
+    EventoStripe.objects.filter(_fila(agora), pk__in=ids).update(status='processando', atualizado_em=marca)
+    return list(EventoStripe.objects.filter(pk__in=ids, status='processando', atualizado_em=marca).order_by('recebido_em'))
+
+
+def materializar_pedido(dados_sessao):
+    """
+    Cria o Pedido de uma sessão de checkout paga. Retorna o pedido, ou None se a sessão
+    é desconhecida, ainda não foi paga ou já tinha virado pedido.
+    """
+    from comerciojusto.carrinho import remover_produtos
+    from comerciojusto.estoque import baixar_sem_reserva, converter_reservas
+    from comerciojusto.models import Carrinho, Empresa, ItemPedido, Pedido, Produto
+    from .models import SessaoCheckout
+
+    if dados_sessao.get('payment_status') not in STATUS_PAGOS:
+        return None
+    sessao_id = dados_sessao['id']
+    # 'expirada' também vale: a sessão substituída é marcada antes de o Stripe confirmar
+    # o encerramento, e se o pagamento chegou mesmo assim ele precisa virar pedido
+    if not SessaoCheckout.objects.filter(pk=sessao_id, status__in=('aberta', 'expirada')).update(status='paga'):
+        return None
+
+    sessao = SessaoCheckout.objects.select_related('usuario').get(pk=sessao_id)
+    quantidades = Counter()
+    for item in sessao.itens:
+        quantidades[int(item['produto_id'])] += int(item['quantidade'])
+    existentes = set(Produto.objects.filter(pk__in=quantidades).values_list('pk', flat=True))
+
+    pedido = Pedido.objects.create(
+        usuario=sessao.usuario,
+        empresa=Empresa.objects.filter(perfil__user=sessao.usuario).first(),
+    )
+    ItemPedido.objects.bulk_create([
+        ItemPedido(pedido=pedido, produto_id=produto_id, quantidade=quantidade)
+        for produto_id, quantidade in quantidades.items() if produto_id in existentes
+    ])
+    # O reservado no checkout já saiu do estoque; só baixa o que ficou sem reserva
+    # (reserva vencida antes do pagamento chegar)
+    reservadas = converter_reservas(sessao_id)
+    vendidas = {produto_id: quantidade for produto_id, quantidade in quantidades.items() if produto_id in existentes}
+    # Vendas de todos os produtos da sessão num UPDATE só
+    Produto.objects.filter(pk__in=vendidas).update(vendas=F('vendas') + Case(
+        *[When(pk=produto_id, then=Value(quantidade)) for produto_id, quantidade in vendidas.items()],
+        default=Value(0), output_field=IntegerField(),
+    ))
+    sem_estoque = {}
+    for produto_id, quantidade in vendidas.items():
+        falta = quantidade - reservadas[produto_id]
+        if falta > 0 and not baixar_sem_reserva(produto_id, falta):
+            sem_estoque[str(produto_id)] = falta
+    if sem_estoque:
+        logger.error('Sessão %s paga sem estoque (precisa de reembolso): %s', sessao_id, sem_estoque)
+
+    SessaoCheckout.objects.filter(pk=sessao_id).update(pedido=pedido, sem_estoque=sem_estoque)
+    carrinho = Carrinho.objects.filter(usuario=sessao.usuario).first()
+    if carrinho:
+        remover_produtos(carrinho, quantidades)
+    return pedido
+
+
+def processar_evento(evento):
+    """Aplica um evento; retorna o status final ('processado' ou 'ignorado')"""
+    from comerciojusto.estoque import liberar_reservas
+    from .models import SessaoCheckout
+
+    dados = evento.payload.get('data', {}).get('object', {})
+    if evento.tipo in EVENTOS_PAGAMENTO:
+        return 'processado' if materializar_pedido(dados) else 'ignorado'
+    if evento.tipo in EVENTOS_EXPIRACAO:
+        SessaoCheckout.objects.filter(pk=dados.get('id'), status='aberta').update(status='expirada')
+        liberar_reservas(dados.get('id'))
+        return 'processado'
+    return 'ignorado'
+
+
+def processar_pendentes(limite=TAMANHO_LOTE):
+    """Processa um lote de eventos da fila; retorna a contagem por status final"""
+    from .models import EventoStripe
+
+    eventos = reivindicar_eventos(limite)
+    resumo = Counter()
+    if not eventos:
+        return resumo
+    retentativas = []
+    with transaction.atomic():
+        for evento in eventos:
+            try:
+                with transaction.atomic():
+                    evento.status = processar_evento(evento)
+                evento.erro = ''
+            except Exception as e:
+                logger.exception('Falha ao processar o evento %s do Stripe', evento.pk)
+                evento.status = 'erro'
+                evento.erro = repr(e)
+            evento.tentativas += 1
+            evento.atualizado_em = timezone.now()
+            if evento.status == 'erro' and evento.tentativas < MAX_TENTATIVAS:
+                atraso = espera(evento.tentativas)
+                evento.proxima_tentativa = evento.atualizado_em + timedelta(seconds=atraso)
+                retentativas.append(atraso)
+            resumo[evento.status] += 1
+        EventoStripe.objects.bulk_update(
+            eventos, ['status', 'erro', 'tentativas', 'atualizado_em', 'proxima_tentativa']
+        )
+        if retentativas:
+            # Sem worker contínuo, a fila volta a ser processada quando a primeira retentativa vencer
+            enfileirar('stripe.processar_eventos', chave='retentativa', atraso=min(retentativas))
+    return resumo
+
+
+@tarefa('stripe.processar_eventos')
+def processar_fila():
+    """Processa lotes até esvaziar a fila de eventos"""
+    while sum(processar_pendentes().values()):
+        pass
+
+
+def agendar_processamento():
+    """Enfileira o processamento dos eventos (uma tarefa pendente por vez)"""
+    enfileirar('stripe.processar_eventos', chave='fila')
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.ingestao import TAMANHO_LOTE, processar_pendentes
+
+
+class Command(BaseCommand):
+    help = 'Processa os eventos do Stripe pendentes (cria os pedidos das sessões de checkout pagas)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE, help='Eventos por transação')
+        parser.add_argument('--continuo', action='store_true', help='Fica rodando e consulta a fila periodicamente')
+        parser.add_argument('--intervalo', type=float, default=2.0, help='Espera entre consultas com a fila vazia (s)')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            resumo = processar_pendentes(options['lote'])
+            if resumo:
+                total += sum(resumo.values())
+                self.stdout.write(', '.join(f'{status}: {qtd}' for status, qtd in sorted(resumo.items())))
+                continue
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
+        self.stdout.write(self.style.SUCCESS(f'✓ {total} evento(s) processado(s)'))
@@ -0,0 +1,61 @@
+import json
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+
+from payments.cliente_stripe import assinar_payload
+from payments.models import SessaoCheckout
+from payments.views import stripe_webhook
+
+
+class Command(BaseCommand):
+    help = 'Envia ao webhook um evento do Stripe assinado com STRIPE_WEBHOOK_SECRET (teste local da ingestão)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sessao', nargs='?', help='id da SessaoCheckout (padrão: a sessão aberta mais recente)')
+        parser.add_argument('--tipo', default='checkout.session.completed', help='Tipo do evento')
+        parser.add_argument('--repetir', type=int, default=1, help='Reenvia o mesmo evento N vezes (idempotência)')
+        parser.add_argument('--url', help='Envia por HTTP para um servidor rodando (ex.: http://localhost:8000/webhook/stripe/)')
+
+    def handle(self, *args, **options):
+        sessao_id = options['sessao']
+        if not sessao_id:
+            sessao = SessaoCheckout.objects.filter(status='aberta').order_by('-criada_em').first()
+            if not sessao:
+                raise CommandError('Nenhuma sessão de checkout aberta.')
+            sessao_id = sessao.pk
+
+        payload = json.dumps({
+            'id': f'evt_simulado_{uuid.uuid4().hex[:24]}',
+            'object': 'event',
+            'type': options['tipo'],
+            'created': int(time.time()),
+            'data': {'object': {'id': sessao_id, 'object': 'checkout.session', 'payment_status': 'paid'}},
+        })
+
+        for _ in range(options['repetir']):
+            status = self._enviar(payload, options['url'])
+            self.stdout.write(f'Evento {options["tipo"]} para {sessao_id}: HTTP {status}')
+        self.stdout.write(self.style.SUCCESS('✓ Evento enviado'))
+
+    def _enviar(self, payload, url):
+        assinatura = assinar_payload(payload, settings.STRIPE_WEBHOOK_SECRET)
+        if not url:
+            request = RequestFactory().post(
+                '/webhook/stripe/', payload, content_type='application/json', HTTP_STRIPE_SIGNATURE=assinatura
+            )
+            return stripe_webhook(request).status_code
+        requisicao = urllib.request.Request(
+            url, data=payload.encode(), method='POST',
+            headers={'Content-Type': 'application/json', 'Stripe-Signature': assinatura},
+        )
+        try:
+            with urllib.request.urlopen(requisicao, timeout=10) as resposta:
+                return resposta.status
+        except urllib.error.HTTPError as e:
+            return e.code
@@ -0,0 +1,158 @@
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from payments.cliente_stripe import assinar_payload
+
+
+class Command(BaseCommand):
+    help = (
+        'Servidor falso da API do Stripe para testes locais do checkout. Rode o site com '
+        'STRIPE_API_BASE=http://localhost:12111 e STRIPE_SECRET_KEY=sk_test_falso'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--porta', type=int, default=12111)
+        parser.add_argument('--atraso', type=float, default=0.0, help='Latência simulada por chamada (ms)')
+        parser.add_argument('--falhas', type=float, default=0.0, help='Fração de chamadas que respondem 500 (testa as retentativas)')
+        parser.add_argument('--webhook', default='http://localhost:8000/webhook/stripe/', help='Webhook avisado quando a sessão é "paga" em /pagar/<id>')
+
+    def handle(self, *args, **options):
+        estado = {'sessoes': {}, 'idempotencia': {}, 'chamadas': 0, 'trava': threading.Lock()}
+        comando = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, como a API real
+
+            def log_message(self, formato, *args):
+                comando.stdout.write(f'  {self.command} {self.path} -> {args[1] if len(args) > 1 else ""}')
+
+            def _responder(self, status, corpo, cabecalhos=None):
+                dados = json.dumps(corpo).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(dados)))
+                for nome, valor in (cabecalhos or {}).items():
+                    self.send_header(nome, valor)
+                self.end_headers()
+                self.wfile.write(dados)
+
+            def _simular_rede(self):
+                with estado['trava']:
+                    estado['chamadas'] += 1
+                if options['atraso']:
+                    time.sleep(options['atraso'] / 1000)
+                if options['falhas'] and random.random() < options['falhas']:
+                    self._responder(
+                        500, {'error': {'type': 'api_error', 'message': 'Falha simulada'}},
+                        {'Stripe-Should-Retry': 'true'},
+                    )
+                    return True
+                return False
+
+            def do_POST(self):
+                tamanho = int(self.headers.get('Content-Length') or 0)
+                form = dict(parse_qsl(self.rfile.read(tamanho).decode()))
+                if self._simular_rede():
+                    return
+                caminho = urlparse(self.path).path.rstrip('/')
+                if caminho == '/v1/checkout/sessions':
+                    chave = self.headers.get('Idempotency-Key')
+                    with estado['trava']:
+                        if chave and chave in estado['idempotencia']:
+                            return self._responder(200, estado['idempotencia'][chave])
+                        sessao = self._nova_sessao(form)
+                        estado['sessoes'][sessao['id']] = sessao
+                        if chave:
+                            estado['idempotencia'][chave] = sessao
+                    return self._responder(200, sessao)
+                if caminho.startswith('/v1/checkout/sessions/') and caminho.endswith('/expire'):
+                    sessao = estado['sessoes'].get(caminho.split('/')[4])
+                    if not sessao:
+                        return self._responder(404, {'error': {'type': 'invalid_request_error', 'message': 'Sessão inexistente'}})
+                    sessao['status'] = 'expired'
+                    return self._responder(200, sessao)
+                self._responder(404, {'error': {'type': 'invalid_request_error', 'message': f'Rota não simulada: {caminho}'}})
+
+            def do_GET(self):
+                caminho = urlparse(self.path).path.rstrip('/')
+                if caminho.startswith('/v1/checkout/sessions/'):
+                    if self._simular_rede():
+                        return
+                    sessao = estado['sessoes'].get(caminho.split('/')[4])
+                    if not sessao:
+                        return self._responder(404, {'error': {'type': 'invalid_request_error', 'message': 'Sessão inexistente'}})
+                    return self._responder(200, sessao)
+                if caminho.startswith('/pagar/'):
+                    sessao = estado['sessoes'].get(caminho.split('/')[2])
+                    if not sessao:
+                        return self._responder(404, {'error': {'message': 'Sessão inexistente'}})
+                    sessao.update(status='complete', payment_status='paid')
+                    comando._avisar_webhook(options['webhook'], sessao)
+                    self.send_response(302)
+                    self.send_header('Location', sessao['success_url'])
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self._responder(404, {'error': {'message': 'Rota não simulada'}})
+
+            def _nova_sessao(self, form):
+                sessao_id = f'cs_test_{uuid.uuid4().hex}'
+                total = 0
+                i = 0
+                while f'line_items[{i}][quantity]' in form:
+                    total += int(form.get(f'line_items[{i}][price_data][unit_amount]', 0)) * int(form[f'line_items[{i}][quantity]'])
+                    i += 1
+                return {
+                    'id': sessao_id,
+                    'object': 'checkout.session',
+                    'url': f'http://localhost:{options["porta"]}/pagar/{sessao_id}',
+                    'mode': form.get('mode', 'payment'),
+                    'status': 'open',
+                    'payment_status': 'unpaid',
+                    'amount_total': total,
+                    'currency': 'brl',
+                    'customer_email': form.get('customer_email'),
+                    'client_reference_id': form.get('client_reference_id'),
+                    'expires_at': int(form.get('expires_at') or time.time() + 86400),
+                    'success_url': form.get('success_url'),
+                    'cancel_url': form.get('cancel_url'),
+                    'metadata': {k[9:-1]: v for k, v in form.items() if k.startswith('metadata[')},
+                }
+
+        servidor = ThreadingHTTPServer(('localhost', options['porta']), Handler)
+        self.stdout.write(self.style.SUCCESS(f'✓ Stripe falso em http://localhost:{options["porta"]} (Ctrl+C para parar)'))
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
+            self.stdout.write(f'{estado["chamadas"]} chamada(s) à API, {len(estado["sessoes"])} sessão(ões) criada(s)')
+
+    def _avisar_webhook(self, url, sessao):
+        payload = json.dumps({
+            'id': f'evt_falso_{uuid.uuid4().hex[:24]}',
+            'object': 'event',
+            'type': 'checkout.session.completed',
+            'created': int(time.time()),
+            'data': {'object': sessao},
+        })
+        requisicao = urllib.request.Request(
+            url, data=payload.encode(), method='POST',
+            headers={'Content-Type': 'application/json', 'Stripe-Signature': assinar_payload(payload, settings.STRIPE_WEBHOOK_SECRET)},
+        )
+        try:
+            with urllib.request.urlopen(requisicao, timeout=10) as resposta:
+                self.stdout.write(f'  webhook {url} -> {resposta.status}')
+        except (urllib.error.URLError, OSError) as e:
+            self.stdout.write(self.style.WARNING(f'  webhook {url} falhou: {e}'))
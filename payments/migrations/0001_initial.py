@@ -0,0 +1,55 @@
+# Generated by Django 6.0 on 2026-10-18 12:37
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('comerciojusto', '0016_pedido_empresa_opcional'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoStripe',
+            fields=[
+                ('id_evento', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('tipo', models.CharField(max_length=100)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('processado', 'Processado'), ('ignorado', 'Ignorado'), ('erro', 'Erro')], default='pendente', max_length=20)),
+                ('tentativas', models.PositiveIntegerField(default=0)),
+                ('erro', models.TextField(blank=True, default='')),
+                ('recebido_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('atualizado_em', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Evento do Stripe',
+                'verbose_name_plural': 'Eventos do Stripe',
+                'db_table': 'evento_stripe',
+                'indexes': [models.Index(fields=['status', 'recebido_em'], name='evento_stripe_fila_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SessaoCheckout',
+            fields=[
+                ('id_sessao', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('itens', models.JSONField(default=list)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('status', models.CharField(choices=[('aberta', 'Aberta'), ('paga', 'Paga'), ('expirada', 'Expirada')], default='aberta', max_length=20)),
+                ('criada_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('pedido', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sessao_checkout', to='comerciojusto.pedido')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sessoes_checkout', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Sessão de Checkout',
+                'verbose_name_plural': 'Sessões de Checkout',
+                'db_table': 'sessao_checkout',
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-18 12:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comerciojusto', '0017_reserva_estoque'),
+        ('payments', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sessaocheckout',
+            name='expira_em',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sessaocheckout',
+            name='hash_carrinho',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='sessaocheckout',
+            name='url',
+            field=models.URLField(blank=True, default='', max_length=2000),
+        ),
+        migrations.AddIndex(
+            model_name='sessaocheckout',
+            index=models.Index(fields=['usuario', 'hash_carrinho', 'status'], name='sessao_checkout_hash_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_sessao_checkout_reuso'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sessaocheckout',
+            name='sem_estoque',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_sessao_checkout_sem_estoque'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventostripe',
+            name='proxima_tentativa',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
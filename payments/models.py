@@ -1,3 +1,68 @@
 from django.db import models
+from django.contrib.auth.models import User
+from django.utils import timezone
 
-# Create your models here.
+
+# Sessão de checkout criada no Stripe: guarda o retrato dos itens no momento do
+# pagamento, para o pedido ser montado depois sem depender do carrinho atual
+class SessaoCheckout(models.Model):
+    STATUS_CHOICES = [
+        ('aberta', 'Aberta'),
+        ('paga', 'Paga'),
+        ('expirada', 'Expirada'),
+    ]
+    id_sessao = models.CharField(max_length=255, primary_key=True)  # id da sessão no Stripe (cs_...)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sessoes_checkout')
+    itens = models.JSONField(default=list)  # [{"produto_id", "quantidade", "preco"}]
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='aberta')
+    pedido = models.OneToOneField('comerciojusto.Pedido', on_delete=models.SET_NULL, null=True, blank=True, related_name='sessao_checkout')
+    hash_carrinho = models.CharField(max_length=64, blank=True, default='')  # conteúdo do carrinho, para reaproveitar a sessão
+    url = models.URLField(max_length=2000, blank=True, default='')  # página de pagamento do Stripe
+    expira_em = models.DateTimeField(null=True, blank=True)
+    # {produto_id: quantidade} paga depois de a reserva voltar ao estoque e sem estoque para baixar (reembolsar)
+    sem_estoque = models.JSONField(default=dict, blank=True)
+    criada_em = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Checkout {self.id_sessao} ({self.get_status_display()})"
+
+    class Meta:
+        db_table = 'sessao_checkout'
+        verbose_name = 'Sessão de Checkout'
+        verbose_name_plural = 'Sessões de Checkout'
+        indexes = [
+            models.Index(fields=['usuario', 'hash_carrinho', 'status'], name='sessao_checkout_hash_idx'),
+        ]
+
+
+# Evento recebido pelo webhook do Stripe. O id do evento é a chave de idempotência:
+# reenvios do mesmo evento pelo Stripe não geram uma segunda linha
+class EventoStripe(models.Model):
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('processando', 'Processando'),
+        ('processado', 'Processado'),
+        ('ignorado', 'Ignorado'),
+        ('erro', 'Erro'),
+    ]
+    id_evento = models.CharField(max_length=255, primary_key=True)  # id do evento no Stripe (evt_...)
+    tipo = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    tentativas = models.PositiveIntegerField(default=0)
+    erro = models.TextField(blank=True, default='')
+    proxima_tentativa = models.DateTimeField(null=True, blank=True)  # evento com erro só volta à fila a partir daqui
+    recebido_em = models.DateTimeField(default=timezone.now)
+    atualizado_em = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.tipo} {self.id_evento} ({self.get_status_display()})"
+
+    class Meta:
+        db_table = 'evento_stripe'
+        verbose_name = 'Evento do Stripe'
+        verbose_name_plural = 'Eventos do Stripe'
+        indexes = [
+            models.Index(fields=['status', 'recebido_em'], name='evento_stripe_fila_idx'),
+        ]
@@ -1,3 +1,114 @@
-from django.test import TestCase
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from comerciojusto import carrinho
+from comerciojusto.models import Carrinho, Pedido, Produto, ReservaEstoque, Tarefa
+
+from . import ingestao
+from .models import EventoStripe, SessaoCheckout
+
+CACHE_TESTES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=CACHE_TESTES, TAREFAS_EM_THREAD=False)
+class IngestaoEventosTests(TestCase):
+    """Reenvios do mesmo evento (ou de outro evento da mesma sessão) não duplicam o pedido"""
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('comprador', password='senha')
+        self.produto = Produto.objects.create(nome='Mel', preco=30, estoque=10)
+        SessaoCheckout.objects.create(
+            id_sessao='cs_teste', usuario=self.usuario, total=60,
+            itens=[{'produto_id': self.produto.pk, 'quantidade': 2, 'preco': '30.00'}],
+        )
+
+    def _evento(self, id_evento, tipo='checkout.session.completed'):
+        return {
+            'id': id_evento,
+            'type': tipo,
+            'data': {'object': {'id': 'cs_teste', 'payment_status': 'paid'}},
+        }
+
+    def test_evento_duplicado(self):
+        self.assertTrue(ingestao.registrar_evento(self._evento('evt_1')))
+        self.assertFalse(ingestao.registrar_evento(self._evento('evt_1')))
+        self.assertEqual(EventoStripe.objects.count(), 1)
+
+        self.assertEqual(ingestao.processar_pendentes(), {'processado': 1})
+        # Nada volta para a fila depois de processado
+        self.assertEqual(ingestao.processar_pendentes(), {})
+        self.assertEqual(Pedido.objects.filter(usuario=self.usuario).count(), 1)
+
+        self.produto.refresh_from_db()
+        self.assertEqual((self.produto.estoque, self.produto.vendas), (8, 2))
+
+    def test_eventos_diferentes_da_mesma_sessao(self):
+        ingestao.registrar_evento(self._evento('evt_1'))
+        ingestao.registrar_evento(self._evento('evt_2', 'checkout.session.async_payment_succeeded'))
+
+        self.assertEqual(ingestao.processar_pendentes(), {'processado': 1, 'ignorado': 1})
+        self.assertEqual(Pedido.objects.filter(usuario=self.usuario).count(), 1)
+        self.assertEqual(SessaoCheckout.objects.get(pk='cs_teste').status, 'paga')
+        self.produto.refresh_from_db()
+        self.assertEqual((self.produto.estoque, self.produto.vendas), (8, 2))
+
+
+@override_settings(CACHES=CACHE_TESTES, TAREFAS_EM_THREAD=False)
+class ReusoSessaoCheckoutTests(TestCase):
+    """O mesmo carrinho volta para a sessão aberta; carrinho alterado encerra a anterior e cria outra"""
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('comprador', password='senha', email='comprador@example.com')
+        self.produto = Produto.objects.create(nome='Mel', preco=30, estoque=10)
+        self.carrinho = Carrinho.objects.create(usuario=self.usuario)
+        carrinho.adicionar_item(self.carrinho, self.produto, quantidade=2)
+        self.client.force_login(self.usuario)
+        self.sessoes = []
+
+    def _criar_sessao(self, **kwargs):
+        id_sessao = f'cs_{len(self.sessoes) + 1}'
+        self.sessoes.append(kwargs)
+        return SimpleNamespace(id=id_sessao, url=f'https://checkout.stripe.com/c/pay/{id_sessao}')
+
+    def _checkout(self):
+        with mock.patch('stripe.checkout.Session.create', side_effect=self._criar_sessao):
+            resposta = self.client.get(reverse('criar_checkout'))
+        self.assertEqual(resposta.status_code, 302)
+        return resposta.url
+
+    def _reservado(self, id_sessao):
+        reservas = ReservaEstoque.objects.filter(referencia=id_sessao, status='ativa')
+        return sum(reservas.values_list('quantidade', flat=True))
+
+    def test_mesmo_carrinho_reaproveita(self):
+        url = self._checkout()
+        self.assertEqual(url, 'https://checkout.stripe.com/c/pay/cs_1')
+        self.assertEqual(self.sessoes[0]['line_items'][0]['price_data']['unit_amount'], 3000)
+        self.assertEqual(self._reservado('cs_1'), 2)
+
+        self.assertEqual(self._checkout(), url)
+        self.assertEqual(len(self.sessoes), 1)
+        self.assertEqual(self._reservado('cs_1'), 2)
+
+    def test_carrinho_alterado_cria_outra(self):
+        self._checkout()
+        carrinho.adicionar_item(self.carrinho, self.produto)
+
+        self.assertEqual(self._checkout(), 'https://checkout.stripe.com/c/pay/cs_2')
+        self.assertEqual(SessaoCheckout.objects.get(pk='cs_1').status, 'expirada')
+        self.assertEqual(SessaoCheckout.objects.get(pk='cs_2').status, 'aberta')
+        # A reserva da sessão antiga volta ao estoque e ela é encerrada no Stripe em segundo plano
+        self.assertEqual((self._reservado('cs_1'), self._reservado('cs_2')), (0, 3))
+        self.assertTrue(Tarefa.objects.filter(nome='stripe.expirar_sessao', chave='cs_1', status='pendente').exists())
+
+    def test_sessao_perto_de_expirar_nao_e_reaproveitada(self):
+        self._checkout()
+        SessaoCheckout.objects.filter(pk='cs_1').update(expira_em=timezone.now() + timedelta(minutes=2))
+        self.assertEqual(self._checkout(), 'https://checkout.stripe.com/c/pay/cs_2')
+        self.assertEqual(len(self.sessoes), 2)
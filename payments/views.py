@@ -5,34 +5,68 @@ from django.contrib import messages
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse, HttpResponse
-from comerciojusto.models import Produto, Carrinho
+import json
+import math
+from datetime import timedelta
+from django.utils import timezone
+from comerciojusto import estoque
+from comerciojusto.tarefas import enfileirar
+from comerciojusto.carrinho import centavos, hash_carrinho, obter_carrinho, precificar_carrinho
+from .ingestao import agendar_processamento, registrar_evento
+from .models import SessaoCheckout
 
-# Configurar a chave secreta do Stripe
-stripe.api_key = settings.STRIPE_SECRET_KEY
+# Sessão que expira em menos que isso não é reaproveitada
+MARGEM_REUSO = timedelta(minutes=5)
 
 @login_required
 def criar_checkout(request):
     """Cria uma sessão de checkout do Stripe"""
     # Buscar carrinho do banco de dados
-    if request.user.is_authenticated:
-        carrinho_obj = Carrinho.objects.filter(usuario=request.user).first()
-    else:
-        sessao_id = request.session.session_key
-        carrinho_obj = Carrinho.objects.filter(sessao_id=sessao_id).first()
+    precificacao = precificar_carrinho(obter_carrinho(request))
     
-    if not carrinho_obj or not carrinho_obj.itens:
+    if not precificacao['itens']:
         messages.warning(request, 'Seu carrinho está vazio.')
         return redirect('visualizar_carrinho')
     
-    carrinho = carrinho_obj.itens
+    if precificacao['indisponiveis']:
+        messages.warning(request, 'Remova os produtos indisponíveis do carrinho antes de finalizar a compra.')
+        return redirect('visualizar_carrinho')
+    
+    # Carrinho igual ao de uma sessão ainda válida: volta direto para a página de pagamento
+    agora = timezone.now()
+    hash_atual = hash_carrinho(precificacao)
+    abertas = SessaoCheckout.objects.filter(usuario=request.user, status='aberta', expira_em__gt=agora)
+    sessao_existente = (
+        abertas.filter(hash_carrinho=hash_atual, expira_em__gt=agora + MARGEM_REUSO)
+        .exclude(url='').order_by('-criada_em').first()
+    )
+    if sessao_existente:
+        return redirect(sessao_existente.url)
+    
+    # O carrinho mudou: o estoque reservado pelas sessões anteriores volta e elas são
+    # encerradas no Stripe em segundo plano (não dá mais para pagar o carrinho antigo)
+    for sessao_anterior in abertas.values_list('id_sessao', flat=True):
+        estoque.liberar_reservas(sessao_anterior)
+        enfileirar('stripe.expirar_sessao', chave=sessao_anterior, sessao_id=sessao_anterior)
+    abertas.update(status='expirada')
+    
+    # Separa o estoque antes de mandar o comprador ao Stripe (tudo ou nada)
+    try:
+        reserva = estoque.reservar(
+            request.user, [(item['produto'].pk, item['quantidade']) for item in precificacao['itens']]
+        )
+    except estoque.EstoqueInsuficiente as e:
+        nome = next(item['produto'].nome for item in precificacao['itens'] if item['produto'].pk == e.produto_id)
+        messages.warning(request, f'Não há estoque suficiente de "{nome}" para a quantidade no carrinho.')
+        return redirect('visualizar_carrinho')
     
     try:
         line_items = []
         
-        # Iterar pelos itens do carrinho
-        for produto_id, item_data in carrinho.items():
-            produto = Produto.objects.get(id_produto=produto_id)
-            quantidade = item_data.get('quantidade', 1)
+        # Iterar pelos itens do carrinho (já resolvidos com o preço atual)
+        for item in precificacao['itens']:
+            produto = item['produto']
+            quantidade = item['quantidade']
             
             product_data = {'name': produto.nome}
             
@@ -44,11 +78,15 @@ def criar_checkout(request):
                 'price_data': {
                     'currency': 'brl',
                     'product_data': product_data,
-                    'unit_amount': int(produto.preco * 100),  # Converter para centavos
+                    'unit_amount': centavos(item['preco']),  # Converter para centavos
                 },
                 'quantity': quantidade,
             })
         
+        # Validade contada a partir de agora (a reserva e o banco já tomaram tempo);
+        # a reserva dura MARGEM_RESERVA a mais, então cobre a sessão inteira
+        expira_em = timezone.now() + estoque.duracao_checkout()
+        
         # Criar sessão de checkout
         session = stripe.checkout.Session.create(
             payment_method_types=['card'],
@@ -57,17 +95,36 @@ def criar_checkout(request):
             success_url=request.build_absolute_uri('/sucesso/'),
             cancel_url=request.build_absolute_uri('/cancelado/'),
             customer_email=request.user.email,
+            expires_at=math.ceil(expira_em.timestamp()),
+            client_reference_id=str(request.user.id),
             metadata={
                 'user_id': request.user.id,
             }
         )
         
+        # Retrato dos itens pagos: o pedido é montado a partir dele quando o webhook chegar
+        SessaoCheckout.objects.create(
+            id_sessao=session.id,
+            usuario=request.user,
+            itens=[
+                {
+                    'produto_id': item['produto'].pk,
+                    'quantidade': item['quantidade'],
+                    'preco': str(item['preco']),
+                }
+                for item in precificacao['itens']
+            ],
+            total=precificacao['total'],
+            hash_carrinho=hash_atual,
+            url=session.url,
+            expira_em=expira_em,
+        )
+        estoque.vincular_reservas(reserva, session.id)
+        
         return redirect(session.url)
     
-    except Produto.DoesNotExist:
-        messages.error(request, 'Produto não encontrado no carrinho.')
-        return redirect('visualizar_carrinho')
     except Exception as e:
+        estoque.liberar_reservas(reserva)
         messages.error(request, f'Erro ao criar sessão de pagamento: {str(e)}')
         return redirect('visualizar_carrinho')
 
@@ -95,7 +152,7 @@ def stripe_webhook(request):
     sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
     
     try:
-        event = stripe.Webhook.construct_event(
+        stripe.Webhook.construct_event(
             payload, sig_header, settings.STRIPE_WEBHOOK_SECRET
         )
     except ValueError:
@@ -105,10 +162,8 @@ def stripe_webhook(request):
         # Assinatura inválida
         return HttpResponse(status=400)
     
-    # Processar evento
-    if event['type'] == 'checkout.session.completed':
-        session = event['data']['object']
-        # Aqui você pode processar o pedido, salvar no banco, etc.
-        print(f"Pagamento concluído para sessão: {session['id']}")
+    # Só grava o evento (idempotente pelo id) e responde; o pedido é montado fora da requisição
+    if registrar_evento(json.loads(payload)):
+        agendar_processamento()
     
     return JsonResponse({'status': 'success'})
@@ -76,6 +76,9 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'comerciojusto.middleware.UserCacheMiddleware',  # request.cached_user_data
+    'comerciojusto.middleware.PerfilCacheMiddleware',  # request.perfil
+    'comerciojusto.middleware.CarrinhoCountMiddleware',  # request.carrinho_itens
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',  # allauth
@@ -109,6 +112,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Transações pegam a trava de escrita no início: escritas concorrentes (workers de
+        # tarefas, threads do processo) esperam a vez em vez de falhar com "database is locked"
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
     }
 }
 
@@ -153,8 +159,59 @@ STATIC_URL = 'static/'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Produto.imagem, Perfil.logo e Certificacao.arquivo_certificado usam STORAGES['midia']:
+# cada conteúdo é gravado uma vez (comerciojusto/armazenamento.py) e servido em /midia/
+# com cache imutável. Arquivos sem referência: python manage.py limpar_midia
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'midia': {
+        'BACKEND': 'comerciojusto.armazenamento.ArmazenamentoConteudo',
+        'OPTIONS': {'url_conteudo': '/midia/'},
+    },
+}
+
+# Cache em camadas (comerciojusto/cache_camadas.py): LRU pequena em cada processo na frente
+# de um cache em arquivo compartilhado por todos os workers, sem serviço externo. Para usar
+# o SQLite como camada compartilhada: CACHE_COMPARTILHADO=django.core.cache.backends.db.DatabaseCache,
+# CACHE_LOCATION=cache_compartilhado e python manage.py createcachetable.
+# Contagens de acertos/falhas: python manage.py estatisticas_cache
+CACHES = {
+    'default': {
+        'BACKEND': 'comerciojusto.cache_camadas.CacheEmCamadas',
+        # Dentro do projeto, não num caminho conhecido do /tmp: o FileBasedCache desserializa
+        # (pickle) o que está no diretório, que é criado com 0o700 e conferido na inicialização
+        'LOCATION': os.environ.get('CACHE_LOCATION', str(BASE_DIR / 'cache')),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'LOCAL_MAX_ENTRADAS': int(os.environ.get('CACHE_LOCAL_MAX_ENTRADAS', 1000)),
+            'LOCAL_TIMEOUT': int(os.environ.get('CACHE_LOCAL_TIMEOUT', 30)),
+            'COMPARTILHADO': {
+                'BACKEND': os.environ.get('CACHE_COMPARTILHADO', 'django.core.cache.backends.filebased.FileBasedCache'),
+                'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRADAS', 20000))},
+            },
+        },
+    },
+}
+
+# Uploads: o primeiro handler verifica tipo (pela assinatura), tamanho e SHA-256 dos
+# campos de arquivo conhecidos enquanto recebe (comerciojusto/uploads.py)
+FILE_UPLOAD_HANDLERS = [
+    'comerciojusto.uploads.UploadVerificadoHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Catálogo (paginação por cursor na página inicial)
+CATALOGO_POR_PAGINA = int(os.environ.get('CATALOGO_POR_PAGINA', 24))
+CATALOGO_POR_PAGINA_MAXIMO = 96
+
+# Mensagens em tempo real (SSE servido pelo ASGI). O broker em memória atende um
+# único processo; com vários workers use um broker compartilhado entre processos.
+TEMPO_REAL_BROKER = os.environ.get('TEMPO_REAL_BROKER', 'comerciojusto.tempo_real.BrokerMemoria')
+
 # ===== CONFIGURAÇÕES DO DJANGO-ALLAUTH =====
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',  # Login tradicional
@@ -200,6 +257,25 @@ SOCIALACCOUNT_PROVIDERS = {
 STRIPE_PUBLISHABLE_KEY = os.environ.get('STRIPE_PUBLISHABLE_KEY')
 STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
 STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', '')
+# Cliente HTTP do Stripe (payments/cliente_stripe.py): timeout em segundos e retentativas
+# de falhas de rede. STRIPE_API_BASE aponta para o servidor falso local nos testes
+# (python manage.py stripe_falso → STRIPE_API_BASE=http://localhost:12111)
+STRIPE_API_BASE = os.environ.get('STRIPE_API_BASE', 'https://api.stripe.com')
+STRIPE_TIMEOUT = float(os.environ.get('STRIPE_TIMEOUT', 10))
+STRIPE_MAX_RETRIES = int(os.environ.get('STRIPE_MAX_RETRIES', 2))
+# Validade da sessão de checkout e da reserva de estoque (o Stripe aceita de 30 a 1440 minutos;
+# abaixo de 31 vale 31, folga para o relógio do Stripe: estoque.duracao_checkout).
+# Reservas vencidas voltam ao estoque: python manage.py expirar_reservas --continuo
+ESTOQUE_RESERVA_MINUTOS = int(os.environ.get('ESTOQUE_RESERVA_MINUTOS', 30))
+
+# Tarefas em segundo plano (comerciojusto/tarefas.py: reindexação da busca, pedidos do
+# webhook do Stripe etc.). Sem worker, rodam numa thread do próprio processo após a resposta.
+# Em produção use False e rode: python manage.py executar_tarefas --continuo
+TAREFAS_EM_THREAD = os.environ.get('TAREFAS_EM_THREAD', 'True') == 'True'
+
+# Usuário que assina os avisos de certificação vencida/a vencer na caixa de entrada
+# (python manage.py varrer_certificacoes). Vazio: o primeiro superusuário
+CERTIFICACOES_REMETENTE = os.environ.get('CERTIFICACOES_REMETENTE', '')
 
 # Para permitir requisições do Stripe em produção
 CSRF_TRUSTED_ORIGINS = ['https://checkout.stripe.com']
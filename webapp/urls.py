@@ -20,10 +20,12 @@ from django.conf import settings
 from django.conf.urls.static import static
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('accounts/', include('allauth.urls')),  # URLs do allauth
     path('', include('payments.urls')), # Pagamento stripe (ANTES do comerciojusto)
     path('', include('comerciojusto.urls')),
+    # Depois do comerciojusto: o admin responde 404 para qualquer admin/... que não conhece
+    # (e a fila de certificações fica em admin/certificacoes/)
+    path('admin/', admin.site.urls),
 ]
 
 if settings.DEBUG: